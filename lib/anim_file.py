@@ -1,9 +1,46 @@
 #!/usr/bin/env python3
 
-from .util import Struct, Reader
+from . import symbols
+from .symbols import HashedString
+from .util import Printable, Struct, Reader, map_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Layouts of the columnar tables built by ANIM.read(columnar=True)
+# Element records are stored as-is, frame records point into the element and
+# event tables.
+ELEMENT_DTYPE = numpy.dtype([
+    ('symbol_hash', '<u4'),
+    ('symbol_frame', '<u4'),
+    ('folder_hash', '<u4'),
+    ('a', '<f4'),
+    ('b', '<f4'),
+    ('c', '<f4'),
+    ('d', '<f4'),
+    ('tx', '<f4'),
+    ('ty', '<f4'),
+    ('z', '<f4'),
+]) if numpy else None
+
+FRAME_DTYPE = numpy.dtype([
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('w', '<f4'),
+    ('h', '<f4'),
+    ('event_offset', '<u4'),
+    ('n_events', '<u4'),
+    ('element_offset', '<u4'),
+    ('n_elements', '<u4'),
+]) if numpy else None
 
 
 class Facing(Struct):
+    __slots__ = ('value',)
+
     RIGHT = 1<<0
     UP = 1<<1
     LEFT = 1<<2
@@ -49,6 +86,9 @@ class Facing(Struct):
 
 
 class Animation(Struct):
+    # Set by the columnar and lazy modes, which print like the object mode
+    __noprint__ = ['frame_start', 'offset']
+
     def __init__(self):
         self.name = None
         self.valid_facings = None
@@ -57,14 +97,20 @@ class Animation(Struct):
         self.n_frames = None
         self.frames = None
 
-    @staticmethod
-    def read(reader):
-        a = Animation()
+    @classmethod
+    def read_header(cls, reader):
+        """
+        Reads everything but the frames
+        """
+        a = cls()
         a.name = reader.read_string()
         a.valid_facings = Facing.read(reader)
-        a.root_symbol = reader.read_uint32()
-        a.frame_rate = reader.read_float()
-        a.n_frames  = reader.read_uint32()
+        a.root_symbol, a.frame_rate, a.n_frames = reader.read_record('IfI')
+        return a
+
+    @staticmethod
+    def read(reader):
+        a = Animation.read_header(reader)
         a.frames = []
         for _ in range(a.n_frames):
             a.frames.append(Frame.read(reader))
@@ -72,7 +118,52 @@ class Animation(Struct):
         return a
 
 
+class LazyAnimation(Animation):
+    """
+    Animation whose frames are only decoded when first accessed
+    """
+    def __init__(self):
+        super().__init__()
+        self.offset = None
+        self._data = None
+
+    @staticmethod
+    def read(reader):
+        a = LazyAnimation.read_header(reader)
+        a.offset = reader.offset
+        a._data = reader.data
+        for _ in range(a.n_frames):
+            Frame.skip(reader)
+        return a
+
+    @property
+    def frames(self):
+        if self._frames is None and self._data is not None:
+            reader = Reader(self._data)
+            reader.offset = self.offset
+            self._frames = []
+            for _ in range(self.n_frames):
+                self._frames.append(Frame.read(reader))
+        return self._frames
+
+    @frames.setter
+    def frames(self, frames):
+        self._frames = frames
+
+    def json_value(self):
+        out = {
+            k: v for k, v in self.__dict__.items()
+            if not k.startswith('_') and k not in self.__noprint__
+        }
+        out['frames'] = self.frames
+        return out
+
+
 class Frame(Struct):
+    __slots__ = (
+        'x', 'y', 'w', 'h', 'n_events', 'events', 'n_elements', 'elements'
+    )
+
     def __init__(self):
         self.x = None
         self.y = None
@@ -86,14 +177,8 @@ class Frame(Struct):
     @staticmethod
     def read(reader):
         f = Frame()
-        f.x = reader.read_float()
-        f.y = reader.read_float()
-        f.w = reader.read_float()
-        f.h = reader.read_float()
-        f.n_events = reader.read_uint32()
-        f.events = []
-        for _ in range(f.n_events):
-            f.events.append(reader.read_uint32())
+        f.x, f.y, f.w, f.h, f.n_events = reader.read_record('4fI')
+        f.events = list(reader.read_uint32_array(f.n_events))
 
         f.n_elements = reader.read_uint32()
         f.elements = []
@@ -102,8 +187,21 @@ class Frame(Struct):
 
         return f
 
+    @staticmethod
+    def skip(reader):
+        reader.offset += 16 # x, y, w, h
+        n_events = reader.read_uint32()
+        reader.offset += 4 * n_events
+        n_elements = reader.read_uint32()
+        reader.offset += Element.SIZE * n_elements
+
 
 class Element(Struct):
+    __slots__ = ('symbol_hash', 'symbol_frame', 'folder_hash', 'mat')
+    __noprint__ = ['SIZE']
+
+    SIZE = 40 # 3 uint32 + Mat
+
     def __init__(self):
         self.symbol_hash = None
         self.symbol_frame = None
@@ -113,14 +211,20 @@ class Element(Struct):
     @staticmethod
     def read(reader):
         e = Element()
-        e.symbol_hash = reader.read_float()
-        e.symbol_frame = reader.read_float()
-        e.folder_hash = reader.read_float()
+        e.symbol_hash, e.symbol_frame, e.folder_hash = reader.read_record('3I')
         e.mat = Mat.read(reader)
         return e
 
+    def symbol_name(self):
+        return symbols.table.name(self.symbol_hash)
+
+    def folder_name(self):
+        return symbols.table.name(self.folder_hash)
+
 
 class Mat(Struct):
+    __slots__ = ('a', 'b', 'c', 'd', 'tx', 'ty', 'z')
+
     def __init__(self):
         self.a = None
         self.b = None
@@ -133,30 +237,140 @@ class Mat(Struct):
     @staticmethod
     def read(reader):
         m = Mat()
-        m.a = reader.read_float()
-        m.b = reader.read_float()
-        m.c = reader.read_float()
-        m.d = reader.read_float()
-        m.tx = reader.read_float()
-        m.ty = reader.read_float()
-        m.z = reader.read_float()
+        m.a, m.b, m.c, m.d, m.tx, m.ty, m.z = reader.read_record('7f')
         return m
 
 
-class HashedString(Struct):
-    def __init__(self):
-        self.hash = None
-        self.str = None
+def _column(name):
+    return property(lambda self: self._rows[self._index][name].item())
 
-    @staticmethod
-    def read(reader):
-        h = HashedString()
-        h.hash = reader.read_uint32()
-        h.str = reader.read_string()
-        return h
+
+class MatView(Printable):
+    """
+    Mat backed by a row of ANIM.element_table
+    """
+    a = _column('a')
+    b = _column('b')
+    c = _column('c')
+    d = _column('d')
+    tx = _column('tx')
+    ty = _column('ty')
+    z = _column('z')
+
+    def __init__(self, rows, index):
+        self._rows = rows
+        self._index = index
+
+    def json_value(self):
+        return {
+            k: getattr(self, k) for k in ('a', 'b', 'c', 'd', 'tx', 'ty', 'z')
+        }
+
+
+class ElementView(Printable):
+    """
+    Element backed by a row of ANIM.element_table
+    """
+    symbol_hash = _column('symbol_hash')
+    symbol_frame = _column('symbol_frame')
+    folder_hash = _column('folder_hash')
+
+    def __init__(self, rows, index):
+        self._rows = rows
+        self._index = index
+
+    @property
+    def mat(self):
+        return MatView(self._rows, self._index)
+
+    def symbol_name(self):
+        return symbols.table.name(self.symbol_hash)
+
+    def folder_name(self):
+        return symbols.table.name(self.folder_hash)
+
+    def json_value(self):
+        return {
+            'symbol_hash': self.symbol_hash,
+            'symbol_frame': self.symbol_frame,
+            'folder_hash': self.folder_hash,
+            'mat': self.mat,
+        }
+
+
+class FrameView(Printable):
+    """
+    Frame backed by a row of ANIM.frame_table
+    """
+    x = _column('x')
+    y = _column('y')
+    w = _column('w')
+    h = _column('h')
+    n_events = _column('n_events')
+    n_elements = _column('n_elements')
+
+    def __init__(self, anim, index):
+        self._anim = anim
+        self._rows = anim.frame_table
+        self._index = index
+
+    @property
+    def events(self):
+        start = self._rows[self._index]['event_offset']
+        return self._anim.event_table[start:start+self.n_events].tolist()
+
+    @property
+    def elements(self):
+        start = int(self._rows[self._index]['element_offset'])
+        return [
+            ElementView(self._anim.element_table, i)
+            for i in range(start, start + self.n_elements)
+        ]
+
+    def json_value(self):
+        return {
+            'x': self.x,
+            'y': self.y,
+            'w': self.w,
+            'h': self.h,
+            'n_events': self.n_events,
+            'events': self.events,
+            'n_elements': self.n_elements,
+            'elements': self.elements,
+        }
+
+
+class FrameRange(Printable):
+    """
+    Sequence of FrameView, used as Animation.frames in columnar mode
+    """
+    def __init__(self, anim, start, count):
+        self._anim = anim
+        self._start = start
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return FrameView(self._anim, self._start + i)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def json_value(self):
+        return list(self)
 
 
 class ANIM(Struct):
+    __noprint__ = ['frame_table', 'element_table', 'event_table', '_index']
+
     def __init__(self):
         self.magic = None
         self.version = None
@@ -165,33 +379,112 @@ class ANIM(Struct):
         self.n_total_events = None
         self.n_animations = None
         self.animations = []
+        self.n_strings = None
+        self.strings = None
+        self.frame_table = None
+        self.element_table = None
+        self.event_table = None
+        self._index = None
 
     @staticmethod
-    def read(reader):
+    def read(reader, columnar=False, lazy=False):
+        """
+        In columnar mode, all frames, elements and events are stored in flat
+        numpy tables (frame_table, element_table, event_table) and
+        Animation.frames is a FrameRange of views over them. Each animation
+        also gets a frame_start index into frame_table.
+
+        In lazy mode, frames are only skipped over and animations are
+        LazyAnimation objects that decode their frames on first access.
+        """
+        assert not (columnar and lazy)
         a = ANIM()
         a.magic = reader.read_bytes(4)
         assert a.magic == b'ANIM'
         a.version = reader.read_uint32()
         assert a.version == 4
 
-        a.n_total_elements = reader.read_uint32()
-        a.n_frames = reader.read_uint32()
-        a.n_total_events = reader.read_uint32()
-        a.n_animations = reader.read_uint32()
-        a.animations = []
-        for _ in range(a.n_animations):
-            a.animations.append(Animation.read(reader))
+        (
+            a.n_total_elements,
+            a.n_frames,
+            a.n_total_events,
+            a.n_animations
+        ) = reader.read_record('4I')
+        if columnar:
+            a._read_columnar(reader)
+        elif lazy:
+            a.animations = []
+            for _ in range(a.n_animations):
+                a.animations.append(LazyAnimation.read(reader))
+        else:
+            a.animations = []
+            for _ in range(a.n_animations):
+                a.animations.append(Animation.read(reader))
 
         a.n_strings = reader.read_uint32()
         a.strings = []
         for _ in range(a.n_strings):
             a.strings.append(HashedString.read(reader))
+        symbols.table.add_strings(a.strings)
 
         return a
 
+    def _read_columnar(self, reader):
+        if numpy is None:
+            raise RuntimeError('numpy is required for columnar mode')
+
+        frames = []
+        elements = []
+        events = []
+        n_elements = 0
+        n_events = 0
+        self.animations = []
+        for _ in range(self.n_animations):
+            anim = Animation.read_header(reader)
+            anim.frame_start = len(frames)
+            for _ in range(anim.n_frames):
+                x, y, w, h, n_ev = reader.read_record('4fI')
+                events.append(reader.read_bytes(n_ev * 4))
+                n_el = reader.read_uint32()
+                elements.append(
+                    reader.read_bytes(n_el * ELEMENT_DTYPE.itemsize))
+                frames.append((x, y, w, h, n_events, n_ev, n_elements, n_el))
+                n_events += n_ev
+                n_elements += n_el
+            anim.frames = FrameRange(self, anim.frame_start, anim.n_frames)
+            self.animations.append(anim)
+
+        self.frame_table = numpy.array(frames, dtype=FRAME_DTYPE)
+        self.element_table = numpy.frombuffer(
+            b''.join(elements), dtype=ELEMENT_DTYPE)
+        self.event_table = numpy.frombuffer(b''.join(events), dtype='<u4')
+
+    def find(self, key):
+        """
+        Returns the animations (one per facing) named `key`, which can be a
+        str, bytes or the hash of the name
+        """
+        if self._index is None:
+            # By name and by hash of the name: animation names are not in
+            # the string table, which only holds symbol names
+            self._index = {}
+            for anim in self.animations:
+                name = bytes(anim.name)
+                self._index.setdefault(name, []).append(anim)
+                self._index.setdefault(
+                    symbols.string_hash(name), []).append(anim)
+
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        elif not isinstance(key, int):
+            key = bytes(key)
+        return self._index.get(key, [])
+
 
 if __name__ == '__main__':
     import sys
-    with open(sys.argv[1], 'rb') as fp:
-        data = memoryview(fp.read())
-    print(ANIM.read(Reader(data)).to_json(indent=4))
+    data = map_file(sys.argv[1])
+    columnar = '--columnar' in sys.argv[2:]
+    lazy = '--lazy' in sys.argv[2:]
+    ANIM.read(Reader(data), columnar, lazy).dump_json(sys.stdout, indent=4)
+    print()
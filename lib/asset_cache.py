@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+
+"""
+On-disk cache of parsed ANIM and BILD files.
+
+Each source file gets a cache file holding its columnar tables and a string
+table, which is memory-mapped on load: the numpy tables and strings of the
+returned object are views into the mapping. A cache file is keyed by the
+source path and is valid while the source mtime and size are unchanged, or
+when its content hash is still the same.
+
+Cache file layout (little-endian):
+    header      magic, version, kind (ANIM/BILD), source mtime (ns), source
+                size, source content hash, number of sections
+    directory   (offset, size) of each section
+    sections    8-byte aligned, the first three are the source path, the
+                string blob and the string offsets
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from . import anim_file, bild_file, symbols
+from .symbols import HashedString
+from .util import BinData, Reader, map_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAGIC = b'DSTC'
+VERSION = 1
+HEADER = struct.Struct('<4sI4sQQ16sI')
+SECTION = struct.Struct('<QQ')
+ALIGNMENT = 8
+
+DEFAULT_DIRECTORY = os.path.join(
+    os.path.expanduser('~'), '.cache', 'dont_starve_tools')
+
+ANIMATION_DTYPE = numpy.dtype([
+    ('name', '<u4'),
+    ('valid_facings', '<u4'),
+    ('root_symbol', '<u4'),
+    ('frame_rate', '<f4'),
+    ('n_frames', '<u4'),
+    ('frame_start', '<u4'),
+]) if numpy else None
+
+SYMBOL_DTYPE = numpy.dtype([
+    ('hash', '<u4'),
+    ('n_frames', '<u4'),
+    ('frame_start', '<u4'),
+]) if numpy else None
+
+BUILD_FRAME_DTYPE = numpy.dtype([
+    ('num', '<u4'),
+    ('duration', '<u4'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('w', '<f4'),
+    ('h', '<f4'),
+    ('alpha_index', '<u4'),
+    ('n_alpha', '<u4'),
+]) if numpy else None
+
+HASHED_STRING_DTYPE = numpy.dtype([
+    ('hash', '<u4'),
+    ('str', '<u4'),
+]) if numpy else None
+
+
+class StringTable:
+    """
+    Deduplicated byte strings, referenced by index
+    """
+    def __init__(self) -> None:
+        self._indexes: Dict[bytes, int] = {}
+        self._strings: List[bytes] = []
+
+    def add(self, s: BinData) -> int:
+        s = bytes(s)
+        i = self._indexes.get(s)
+        if i is None:
+            i = self._indexes[s] = len(self._strings)
+            self._strings.append(s)
+        return i
+
+    def sections(self) -> Tuple[bytes, bytes]:
+        """
+        Returns the blob and the uint32 offsets (one more than strings)
+        """
+        offsets = [0]
+        for s in self._strings:
+            offsets.append(offsets[-1] + len(s))
+        return (
+            b''.join(self._strings),
+            struct.pack(f'<{len(offsets)}I', *offsets)
+        )
+
+
+def _strings(blob: memoryview, offsets) -> List[memoryview]:
+    offsets = offsets.tolist()
+    return [blob[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+
+
+def _hashed_strings(table, strings: List[memoryview]) -> list:
+    out = []
+    for h, s in table.tolist():
+        hs = HashedString()
+        hs.hash = h
+        hs.str = strings[s]
+        out.append(hs)
+    symbols.table.add_strings(out)
+    return out
+
+
+def anim_sections(anim: 'anim_file.ANIM', strings: StringTable) -> list:
+    """
+    Returns the sections of a columnar ANIM, after the string table
+    """
+    animations = numpy.array([
+        (
+            strings.add(a.name),
+            a.valid_facings.value,
+            a.root_symbol,
+            a.frame_rate,
+            a.n_frames,
+            a.frame_start
+        )
+        for a in anim.animations
+    ], dtype=ANIMATION_DTYPE)
+    hashed = numpy.array([
+        (h.hash, strings.add(h.str)) for h in anim.strings
+    ], dtype=HASHED_STRING_DTYPE)
+    counts = numpy.array([
+        anim.n_total_elements,
+        anim.n_frames,
+        anim.n_total_events,
+    ], dtype='<u4')
+    return [
+        counts,
+        animations,
+        anim.frame_table,
+        anim.element_table,
+        anim.event_table,
+        hashed,
+    ]
+
+
+def load_anim(sections: List[memoryview], strings: List[memoryview]):
+    """
+    Inverse of anim_sections, gives the same object as a columnar ANIM.read
+    """
+    a = anim_file.ANIM()
+    a.magic = b'ANIM'
+    a.version = 4
+    (
+        a.n_total_elements,
+        a.n_frames,
+        a.n_total_events
+    ) = numpy.frombuffer(sections[0], dtype='<u4').tolist()
+    animations = numpy.frombuffer(sections[1], dtype=ANIMATION_DTYPE)
+    a.n_animations = len(animations)
+
+    a.frame_table = numpy.frombuffer(sections[2], dtype=anim_file.FRAME_DTYPE)
+    a.element_table = numpy.frombuffer(
+        sections[3], dtype=anim_file.ELEMENT_DTYPE)
+    a.event_table = numpy.frombuffer(sections[4], dtype='<u4')
+
+    a.animations = []
+    for row in animations.tolist():
+        anim = anim_file.Animation()
+        anim.name = strings[row[0]]
+        anim.valid_facings = anim_file.Facing()
+        anim.valid_facings.value = row[1]
+        anim.root_symbol, anim.frame_rate, anim.n_frames = row[2:5]
+        anim.frame_start = row[5]
+        anim.frames = anim_file.FrameRange(a, anim.frame_start, anim.n_frames)
+        a.animations.append(anim)
+
+    a.strings = _hashed_strings(
+        numpy.frombuffer(sections[5], dtype=HASHED_STRING_DTYPE),
+        strings
+    )
+    a.n_strings = len(a.strings)
+    return a
+
+
+def bild_sections(bild: 'bild_file.BILD', strings: StringTable) -> list:
+    """
+    Returns the sections of a columnar BILD, after the string table
+    """
+    frames = []
+    symbols = []
+    for s in bild.symbols:
+        symbols.append((s.hash, s.n_frames, len(frames)))
+        for f in s.frames:
+            frames.append((
+                f.num, f.duration,
+                f.bbox.x, f.bbox.y, f.bbox.w, f.bbox.h,
+                f.alpha_index, f.n_alpha
+            ))
+    counts = numpy.array([
+        bild.n_frames,
+        strings.add(bild.build_name),
+    ], dtype='<u4')
+    materials = numpy.array(
+        [strings.add(m) for m in bild.materials], dtype='<u4')
+    hashed = numpy.array([
+        (h.hash, strings.add(h.str)) for h in bild.strings
+    ], dtype=HASHED_STRING_DTYPE)
+    return [
+        counts,
+        materials,
+        numpy.array(symbols, dtype=SYMBOL_DTYPE),
+        numpy.array(frames, dtype=BUILD_FRAME_DTYPE),
+        bild.vertices,
+        hashed,
+    ]
+
+
+def load_bild(sections: List[memoryview], strings: List[memoryview]):
+    """
+    Inverse of bild_sections, gives the same object as a columnar BILD.read
+    """
+    b = bild_file.BILD()
+    b.magic = b'BILD'
+    b.version = 6
+    b.n_frames, build_name = numpy.frombuffer(sections[0], dtype='<u4') \
+        .tolist()
+    b.build_name = strings[build_name]
+    b.materials = [
+        strings[i]
+        for i in numpy.frombuffer(sections[1], dtype='<u4').tolist()
+    ]
+    b.n_materials = len(b.materials)
+
+    frames = numpy.frombuffer(sections[3], dtype=BUILD_FRAME_DTYPE).tolist()
+    b.symbols = []
+    for h, n_frames, start in numpy.frombuffer(
+        sections[2], dtype=SYMBOL_DTYPE
+    ).tolist():
+        s = bild_file.Symbol()
+        s.hash = h
+        s.n_frames = n_frames
+        s.frames = []
+        for row in frames[start:start+n_frames]:
+            f = bild_file.Frame()
+            f.num, f.duration = row[0:2]
+            f.bbox = bild_file.Bbox()
+            f.bbox.x, f.bbox.y, f.bbox.w, f.bbox.h = row[2:6]
+            f.alpha_index, f.n_alpha = row[6:8]
+            s.frames.append(f)
+        b.symbols.append(s)
+    b.n_symbols = len(b.symbols)
+
+    b.vertices = numpy.frombuffer(sections[4], dtype=bild_file.VERTEX_DTYPE)
+    b.n_vertices = len(b.vertices)
+    b.strings = _hashed_strings(
+        numpy.frombuffer(sections[5], dtype=HASHED_STRING_DTYPE),
+        strings
+    )
+    b.n_strings = len(b.strings)
+    return b
+
+
+KINDS = {
+    b'ANIM': (
+        lambda data: anim_file.ANIM.read(Reader(data), columnar=True),
+        anim_sections,
+        load_anim
+    ),
+    b'BILD': (
+        lambda data: bild_file.BILD.read(Reader(data), columnar=True),
+        bild_sections,
+        load_bild
+    ),
+}
+
+
+def content_hash(data: BinData) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def write(
+    fp, kind: bytes, path: str, mtime: int, size: int, digest: bytes,
+    sections: list
+) -> None:
+    """
+    Writes a cache file, `sections` come after the path
+    """
+    sections = [
+        memoryview(s).cast('B') for s in [os.fsencode(path)] + sections
+    ]
+    position = HEADER.size + SECTION.size * len(sections)
+    offsets = []
+    for s in sections:
+        position += -position % ALIGNMENT
+        offsets.append(position)
+        position += len(s)
+
+    fp.write(HEADER.pack(
+        MAGIC, VERSION, kind, mtime, size, digest, len(sections)))
+    for offset, s in zip(offsets, sections):
+        fp.write(SECTION.pack(offset, len(s)))
+    position = HEADER.size + SECTION.size * len(sections)
+    for offset, s in zip(offsets, sections):
+        fp.write(bytes(offset - position))
+        fp.write(s)
+        position = offset + len(s)
+
+
+def read_header(data: BinData) -> Optional[tuple]:
+    """
+    Returns (kind, mtime, size, digest, sections) of a cache file, or None if
+    it is not one of the current version
+    """
+    if len(data) < HEADER.size:
+        return None
+    magic, version, kind, mtime, size, digest, n_sections = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or kind not in KINDS:
+        return None
+    sections = []
+    for i in range(n_sections):
+        offset, length = SECTION.unpack_from(
+            data, HEADER.size + i * SECTION.size)
+        sections.append(data[offset:offset+length])
+    return kind, mtime, size, digest, sections
+
+
+class AssetCache:
+    """
+    Cache of parsed ANIM and BILD files stored in `directory`, one file per
+    source path
+    """
+    def __init__(self, directory: Optional[str]=None) -> None:
+        if numpy is None:
+            raise RuntimeError('numpy is required by the asset cache')
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.hits = 0
+        self.rehashed = 0
+        self.misses = 0
+
+    def path(self, source: str) -> str:
+        name = hashlib.blake2b(
+            os.fsencode(os.path.abspath(source)), digest_size=16
+        ).hexdigest()
+        return os.path.join(self.directory, f'{name}.cache')
+
+    def load(self, source: str):
+        """
+        Returns the columnar ANIM or BILD of `source`, from the cache if it is
+        still valid
+        """
+        st = os.stat(source)
+        path = self.path(source)
+        data = map_file(path) if os.path.exists(path) else None
+        header = read_header(data) if data is not None else None
+
+        if header is not None and header[2] == st.st_size:
+            kind, mtime, size, digest, sections = header
+            if mtime != st.st_mtime_ns:
+                # Touched but maybe not modified
+                if content_hash(map_file(source)) != digest:
+                    return self._build(source, st)
+                self.rehashed += 1
+                with open(path, 'r+b') as fp:
+                    fp.write(HEADER.pack(
+                        MAGIC, VERSION, kind, st.st_mtime_ns, size, digest,
+                        len(sections)
+                    ))
+            self.hits += 1
+            strings = _strings(
+                sections[1], numpy.frombuffer(sections[2], dtype='<u4'))
+            return KINDS[kind][2](sections[3:], strings)
+        return self._build(source, st)
+
+    def _build(self, source: str, st: os.stat_result):
+        self.misses += 1
+        data = map_file(source)
+        kind = bytes(data[:4])
+        if kind not in KINDS:
+            raise ValueError(f'{source} is not an ANIM or BILD file')
+        read, sections, _ = KINDS[kind]
+        obj = read(data)
+
+        strings = StringTable()
+        tables = sections(obj, strings)
+        path = self.path(source)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as fp:
+            write(
+                fp, kind, os.path.abspath(source), st.st_mtime_ns,
+                st.st_size, content_hash(data),
+                list(strings.sections()) + tables
+            )
+        os.replace(tmp_path, path)
+        return obj
+
+    def warm(self, root: str) -> int:
+        """
+        Caches every ANIM and BILD file of a directory tree, returns how many
+        were found
+        """
+        n = 0
+        for source in find_files(root):
+            self.load(source)
+            n += 1
+        return n
+
+    def prune(self, root: Optional[str]=None) -> int:
+        """
+        Removes the entries whose source is gone or changed (all of them, or
+        those under `root`), returns how many were removed
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        root = os.path.join(os.path.abspath(root), '') if root else None
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith('.cache'):
+                continue
+            header = read_header(map_file(path))
+            if header is not None:
+                source = os.fsdecode(bytes(header[4][0]))
+                if root is not None and not source.startswith(root):
+                    continue
+                try:
+                    st = os.stat(source)
+                    if (st.st_mtime_ns, st.st_size) == header[1:3]:
+                        continue
+                except FileNotFoundError:
+                    pass
+            os.remove(path)
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'rehashed': self.rehashed,
+            'misses': self.misses,
+        }
+
+
+def find_files(root: str) -> List[str]:
+    """
+    Returns the paths of the ANIM and BILD files of a directory tree
+    """
+    files = []
+    for dirpath, dirs, names in os.walk(root):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as fp:
+                if fp.read(4) in KINDS:
+                    files.append(path)
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Cache of parsed `Don\'t Starve` ANIM and BILD files.'
+    )
+    parser.add_argument('mode', choices=['w', 'p', 'r'],
+        help='Warm the cache for a directory tree/Prune stale entries ' + \
+        '(of a directory tree if given)/Read a file through the cache ' + \
+        'and print it as JSON')
+    parser.add_argument('path', nargs='?', default=None,
+        help='Directory tree, or file in read mode')
+    parser.add_argument('--cache-dir', default=None,
+        help=f'Cache directory (defaults to {DEFAULT_DIRECTORY})')
+    args = parser.parse_args()
+
+    cache = AssetCache(args.cache_dir)
+    if args.mode == 'w':
+        if args.path is None:
+            parser.error('warm mode takes a directory')
+        n = cache.warm(args.path)
+        print(f'{n} files, {cache.misses} parsed, {cache.hits} cached')
+    elif args.mode == 'p':
+        print(f'{cache.prune(args.path)} entries removed')
+    elif args.mode == 'r':
+        if args.path is None:
+            parser.error('read mode takes a file')
+        cache.load(args.path).dump_json(sys.stdout, indent=4)
+        print()
+
+
+if __name__ == '__main__':
+    main()
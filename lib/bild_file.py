@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 
-from .util import Struct, Reader
+from . import symbols
+from .symbols import HashedString
+from .util import Struct, Reader, map_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Layout of a vertex record, used by the columnar mode of BILD.read
+VERTEX_DTYPE = numpy.dtype([
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('u', '<f4'),
+    ('v', '<f4'),
+    ('w', '<f4'),
+]) if numpy else None
 
 
 class Symbol(Struct):
+    __slots__ = ('hash', 'n_frames', 'frames')
+
     def __init__(self):
         self.hash = None
         self.n_frames = None
@@ -12,16 +32,20 @@ class Symbol(Struct):
     @staticmethod
     def read(reader):
         s = Symbol()
-        s.hash = reader.read_uint32()
-        s.n_frames  = reader.read_uint32()
+        s.hash, s.n_frames = reader.read_record('II')
         s.frames = []
         for _ in range(s.n_frames):
             s.frames.append(Frame.read(reader))
 
         return s
 
+    def name(self):
+        return symbols.table.name(self.hash)
+
 
 class Bbox(Struct):
+    __slots__ = ('x', 'y', 'w', 'h')
+
     def __init__(self):
         self.x = None
         self.y = None
@@ -31,14 +55,13 @@ class Bbox(Struct):
     @staticmethod
     def read(reader):
         b = Bbox()
-        b.x = reader.read_float()
-        b.y = reader.read_float()
-        b.w = reader.read_float()
-        b.h = reader.read_float()
+        b.x, b.y, b.w, b.h = reader.read_record('4f')
         return b
 
 
 class Frame(Struct):
+    __slots__ = ('num', 'duration', 'bbox', 'alpha_index', 'n_alpha')
+
     def __init__(self):
         self.num = None
         self.duration = None
@@ -49,15 +72,15 @@ class Frame(Struct):
     @staticmethod
     def read(reader):
         f = Frame()
-        f.num = reader.read_uint32()
-        f.duration = reader.read_uint32()
+        f.num, f.duration = reader.read_record('II')
         f.bbox = Bbox.read(reader)
-        f.alpha_index = reader.read_uint32()
-        f.n_alpha = reader.read_uint32()
+        f.alpha_index, f.n_alpha = reader.read_record('II')
         return f
 
 
 class Vertex(Struct):
+    __slots__ = ('x', 'y', 'z', 'u', 'v', 'w')
+
     def __init__(self):
         self.x = None
         self.y = None
@@ -69,28 +92,10 @@ class Vertex(Struct):
     @staticmethod
     def read(reader):
         v = Vertex()
-        v.x = reader.read_float()
-        v.y = reader.read_float()
-        v.z = reader.read_float()
-        v.u = reader.read_float()
-        v.v = reader.read_float()
-        v.w = reader.read_float()
+        v.x, v.y, v.z, v.u, v.v, v.w = reader.read_record('6f')
         return v
 
 
-class HashedString(Struct):
-    def __init__(self):
-        self.hash = None
-        self.str = None
-
-    @staticmethod
-    def read(reader):
-        h = HashedString()
-        h.hash = reader.read_uint32()
-        h.str = reader.read_string()
-        return h
-
-
 class BILD(Struct):
     def __init__(self):
         self.magic = None
@@ -107,15 +112,19 @@ class BILD(Struct):
         self.strings = None
 
     @staticmethod
-    def read(reader):
+    def read(reader, columnar=False):
+        """
+        In columnar mode, `vertices` is a numpy structured array (VERTEX_DTYPE)
+        over the reader's data instead of a list of Vertex objects. It is
+        zero-copy as long as the reader wraps a memoryview.
+        """
         b = BILD()
         b.magic = reader.read_bytes(4)
         assert b.magic == b'BILD'
         b.version = reader.read_uint32()
         assert b.version == 6
 
-        b.n_symbols = reader.read_uint32()
-        b.n_frames = reader.read_uint32()
+        b.n_symbols, b.n_frames = reader.read_record('II')
         b.build_name = reader.read_string()
         b.n_materials = reader.read_uint32()
 
@@ -128,20 +137,30 @@ class BILD(Struct):
             b.symbols.append(Symbol.read(reader))
 
         b.n_vertices = reader.read_uint32()
-        b.vertices = []
-        for _ in range(b.n_vertices):
-            b.vertices.append(Vertex.read(reader))
+        if columnar:
+            if numpy is None:
+                raise RuntimeError('numpy is required for columnar mode')
+            b.vertices = numpy.frombuffer(
+                reader.read_bytes(b.n_vertices * VERTEX_DTYPE.itemsize),
+                dtype=VERTEX_DTYPE
+            )
+        else:
+            b.vertices = []
+            for _ in range(b.n_vertices):
+                b.vertices.append(Vertex.read(reader))
 
         b.n_strings = reader.read_uint32()
         b.strings = []
         for _ in range(b.n_strings):
             b.strings.append(HashedString.read(reader))
+        symbols.table.add_strings(b.strings)
 
         return b
 
 
 if __name__ == '__main__':
     import sys
-    with open(sys.argv[1], 'rb') as fp:
-        data = memoryview(fp.read())
-    print(BILD.read(Reader(data)).to_json(indent=4))
+    data = map_file(sys.argv[1])
+    columnar = '--columnar' in sys.argv[2:]
+    BILD.read(Reader(data), columnar).dump_json(sys.stdout, indent=4)
+    print()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""
+Resolves the elements of ANIM frames against the symbols of a BILD.
+
+Each animation frame becomes a draw list: one DRAW_DTYPE record per element
+whose symbol is in the build, giving the range of BILD.vertices to draw, the
+element transform and its z. The transform maps a build vertex (x, y) to
+    (a*x + c*y + tx, b*x + d*y + ty)
+and is stored as the 2x3 matrix ((a, c, tx), (b, d, ty)). Records keep the
+order of the elements in the frame.
+"""
+
+import argparse
+from collections import OrderedDict
+from typing import List
+
+from .anim_file import ANIM, ELEMENT_DTYPE, Animation
+from .bild_file import BILD
+from .util import Reader, Timed, map_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DRAW_DTYPE = numpy.dtype([
+    ('start', '<u4'),
+    ('count', '<u4'),
+    ('matrix', '<f4', (2, 3)),
+    ('z', '<f4'),
+]) if numpy else None
+
+
+class Compositor:
+    """
+    Draw lists of the animations of `anim` with the symbols of `build`.
+    The draw lists of the last `max_animations` animations are cached.
+    """
+    def __init__(
+        self, build: BILD, anim: ANIM, max_animations: int=256
+    ) -> None:
+        if numpy is None:
+            raise RuntimeError('numpy is required by the compositor')
+        self.build = build
+        self.anim = anim
+        self.max_animations = max_animations
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict = OrderedDict()
+
+        # Build frames sorted by (symbol hash, frame number), an element
+        # uses the last frame starting at or before its symbol_frame
+        keys = []
+        ranges = []
+        for symbol in build.symbols:
+            for frame in symbol.frames:
+                keys.append(symbol.hash << 32 | frame.num)
+                ranges.append((frame.alpha_index, frame.n_alpha))
+        keys = numpy.array(keys, dtype=numpy.uint64)
+        order = numpy.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._ranges = numpy.array(ranges, dtype=numpy.uint32) \
+            .reshape(-1, 2)[order]
+
+    def _elements(self, animation: Animation):
+        """
+        Returns the ELEMENT_DTYPE records of all the frames of an animation
+        and the index of the first element of each frame (plus the end)
+        """
+        if self.anim.element_table is not None:
+            start = animation.frame_start
+            frames = self.anim.frame_table[start:start+animation.n_frames]
+            offsets = numpy.empty(len(frames) + 1, dtype=numpy.int64)
+            offsets[:-1] = frames['element_offset']
+            offsets[-1] = offsets[-2] + frames[-1]['n_elements'] \
+                if len(frames) else 0
+            elements = self.anim.element_table[offsets[0]:offsets[-1]]
+            return elements, offsets - offsets[0]
+
+        rows = []
+        offsets = [0]
+        for frame in animation.frames:
+            for e in frame.elements:
+                m = e.mat
+                rows.append((
+                    e.symbol_hash, e.symbol_frame, e.folder_hash,
+                    m.a, m.b, m.c, m.d, m.tx, m.ty, m.z
+                ))
+            offsets.append(len(rows))
+        return numpy.array(rows, dtype=ELEMENT_DTYPE), numpy.array(offsets)
+
+    def compose(self, animation: Animation) -> List:
+        """
+        Returns the draw lists of all the frames of an animation, computed
+        in a single pass over its elements
+        """
+        elements, offsets = self._elements(animation)
+
+        hashes = elements['symbol_hash'].astype(numpy.uint64)
+        queries = hashes << numpy.uint64(32) | elements['symbol_frame']
+        found = numpy.searchsorted(self._keys, queries, side='right') - 1
+        keep = found >= 0
+        keep[keep] = (self._keys[found[keep]] >> numpy.uint64(32)) \
+            == hashes[keep]
+        found = found[keep]
+        elements = elements[keep]
+
+        draws = numpy.empty(len(elements), dtype=DRAW_DTYPE)
+        draws['start'] = self._ranges[found, 0]
+        draws['count'] = self._ranges[found, 1]
+        matrix = draws['matrix']
+        matrix[:, 0, 0] = elements['a']
+        matrix[:, 0, 1] = elements['c']
+        matrix[:, 0, 2] = elements['tx']
+        matrix[:, 1, 0] = elements['b']
+        matrix[:, 1, 1] = elements['d']
+        matrix[:, 1, 2] = elements['ty']
+        draws['z'] = elements['z']
+
+        # Frame boundaries once the unknown symbols are dropped
+        bounds = numpy.zeros(len(keep) + 1, dtype=numpy.int64)
+        numpy.cumsum(keep, out=bounds[1:])
+        bounds = bounds[offsets].tolist()
+        return [
+            draws[bounds[i]:bounds[i+1]] for i in range(len(bounds) - 1)
+        ]
+
+    def draw_lists(self, animation: Animation) -> List:
+        draws = self._cache.get(animation)
+        if draws is not None:
+            self._cache.move_to_end(animation)
+            self.hits += 1
+            return draws
+        self.misses += 1
+        draws = self._cache[animation] = self.compose(animation)
+        if len(self._cache) > self.max_animations:
+            self._cache.popitem(last=False)
+        return draws
+
+    def draw_list(self, animation: Animation, frame: int):
+        """
+        Returns the DRAW_DTYPE records of a frame
+        """
+        return self.draw_lists(animation)[frame]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the animation compositor.'
+    )
+    parser.add_argument('build', help='BILD file path')
+    parser.add_argument('anim', help='ANIM file path')
+    parser.add_argument('--columnar', action='store_true',
+        help='Read the ANIM in columnar mode')
+    parser.add_argument('--print', dest='name', default=None,
+        help='Print the draw lists of the animations with this name')
+    args = parser.parse_args()
+
+    build = BILD.read(Reader(map_file(args.build)))
+    anim = ANIM.read(Reader(map_file(args.anim)), columnar=args.columnar)
+    compositor = Compositor(build, anim)
+
+    if args.name is not None:
+        for animation in anim.find(args.name):
+            print(f'{bytes(animation.name).decode()} {animation.valid_facings}')
+            for i, draws in enumerate(compositor.draw_lists(animation)):
+                print(f'frame {i}')
+                for d in draws:
+                    print(f'    vertices {d["start"]}+{d["count"]} ' + \
+                        f'matrix {d["matrix"].tolist()} z {d["z"]}')
+        return
+
+    n_frames = sum(a.n_frames for a in anim.animations)
+    with Timed('compose') as t:
+        for animation in anim.animations:
+            compositor.compose(animation)
+    print(f'{n_frames} frames in {t.elapsed:.3f}s, ' + \
+        f'{n_frames / max(t.elapsed, 1e-9):.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+Vectorized DXT1/DXT3/DXT5 (BC1/BC2/BC3) decoder.
+
+decompress_image() is a drop-in replacement for squish.decompressImage: it
+takes the same arguments and flags and gives the same output, byte for byte.
+"""
+
+import argparse
+import numpy
+
+from .util import Timed
+
+
+# Same values as squish.DXT1/DXT3/DXT5
+DXT1 = 1 << 0
+DXT3 = 1 << 1
+DXT5 = 1 << 2
+
+_COLOUR_DTYPE = [('c0', '<u2'), ('c1', '<u2'), ('indices', '<u4')]
+
+_BLOCK_DTYPES = {
+    DXT1: numpy.dtype(_COLOUR_DTYPE),
+    DXT3: numpy.dtype([('alpha', '<u8')] + _COLOUR_DTYPE),
+    DXT5: numpy.dtype(
+        [('a0', 'u1'), ('a1', 'u1'), ('alpha', '6u1')] + _COLOUR_DTYPE),
+}
+
+_SHIFT2 = numpy.arange(16, dtype=numpy.uint32) * 2
+_SHIFT3 = numpy.arange(16, dtype=numpy.uint64) * 3
+_SHIFT4 = numpy.arange(16, dtype=numpy.uint64) * 4
+
+
+def _unpack565(c):
+    c = c.astype(numpy.int32)
+    r = (c >> 11) & 0x1f
+    g = (c >> 5) & 0x3f
+    b = c & 0x1f
+    return numpy.stack([
+        (r << 3) | (r >> 2),
+        (g << 2) | (g >> 4),
+        (b << 3) | (b >> 2),
+    ], axis=-1)
+
+
+def _decompress_colour(blocks, is_dxt1):
+    """
+    Returns the (n, 16, 4) pixels of the colour part of `blocks`
+    """
+    n = len(blocks)
+    c0 = _unpack565(blocks['c0'])
+    c1 = _unpack565(blocks['c1'])
+
+    codes = numpy.empty((n, 4, 4), dtype=numpy.int32)
+    codes[:, 0, :3] = c0
+    codes[:, 1, :3] = c1
+    codes[:, 0:3, 3] = 255
+    codes[:, 2, :3] = (2 * c0 + c1) // 3
+    codes[:, 3, :3] = (c0 + 2 * c1) // 3
+    codes[:, 3, 3] = 255
+    if is_dxt1:
+        # 3 colours + transparent black
+        three = blocks['c0'] <= blocks['c1']
+        codes[three, 2, :3] = (c0[three] + c1[three]) // 2
+        codes[three, 3] = 0
+
+    indices = (blocks['indices'][:, None] >> _SHIFT2) & 3
+    return numpy.take_along_axis(
+        codes, indices[:, :, None].astype(numpy.intp), axis=1)
+
+
+def _decompress_alpha_dxt3(blocks):
+    alpha = (blocks['alpha'][:, None] >> _SHIFT4) & 0xf
+    return (alpha | (alpha << 4)).astype(numpy.int32)
+
+
+def _decompress_alpha_dxt5(blocks):
+    n = len(blocks)
+    a0 = blocks['a0'].astype(numpy.int32)[:, None]
+    a1 = blocks['a1'].astype(numpy.int32)[:, None]
+
+    i5 = numpy.arange(1, 5, dtype=numpy.int32)
+    i7 = numpy.arange(1, 7, dtype=numpy.int32)
+    codes = numpy.empty((n, 8), dtype=numpy.int32)
+    codes[:, 0:1] = a0
+    codes[:, 1:2] = a1
+    codes[:, 2:8] = ((7 - i7) * a0 + i7 * a1) // 7
+    five = (a0 <= a1)[:, 0]
+    codes[five, 2:6] = ((5 - i5) * a0[five] + i5 * a1[five]) // 5
+    codes[five, 6] = 0
+    codes[five, 7] = 255
+
+    # 16 indices of 3 bits, as a 48 bits little endian integer
+    packed = numpy.zeros((n, 8), dtype=numpy.uint8)
+    packed[:, :6] = blocks['alpha']
+    indices = (packed.view('<u8') >> _SHIFT3) & 7
+    return numpy.take_along_axis(codes, indices.astype(numpy.intp), axis=1)
+
+
+def decompress(data, width, height, flags):
+    """
+    Returns the (height, width, 4) uint8 RGBA pixels of a compressed image,
+    as a contiguous array. `data` can be any buffer, it is not copied.
+    """
+    kind = flags & (DXT1 | DXT3 | DXT5)
+    dtype = _BLOCK_DTYPES[kind]
+    bw = (width + 3) // 4
+    bh = (height + 3) // 4
+    blocks = numpy.frombuffer(data, dtype=dtype, count=bw * bh)
+
+    pixels = _decompress_colour(blocks, kind == DXT1)
+    if kind == DXT3:
+        pixels[:, :, 3] = _decompress_alpha_dxt3(blocks)
+    elif kind == DXT5:
+        pixels[:, :, 3] = _decompress_alpha_dxt5(blocks)
+
+    image = pixels.astype(numpy.uint8) \
+        .reshape(bh, bw, 4, 4, 4) \
+        .transpose(0, 2, 1, 3, 4) \
+        .reshape(bh * 4, bw * 4, 4)
+    return numpy.ascontiguousarray(image[:height, :width])
+
+
+def decompress_image(data, width, height, flags):
+    """
+    Same as squish.decompressImage
+    """
+    return decompress(data, width, height, flags).tobytes()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the numpy DXT decoder against squish.',
+        epilog='Uses random blocks if no texture is provided.'
+    )
+    parser.add_argument('filenames', nargs='*', help='.tex file paths')
+    parser.add_argument('--size', type=int, default=1024,
+        help='Width and height of the random images')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='Number of runs per image, the best one is kept')
+    args = parser.parse_args()
+
+    from .tex_file import PixelFormat, read_file, squish
+    from .util import map_file
+
+    pf_to_flags = {
+        PixelFormat.DXT1: DXT1,
+        PixelFormat.DXT3: DXT3,
+        PixelFormat.DXT5: DXT5,
+    }
+    images = []
+    if args.filenames:
+        for filename in args.filenames:
+            tex = read_file(map_file(filename))
+            if tex.pixel_format not in pf_to_flags:
+                continue
+            for i, mipmap in enumerate(tex.mipmaps):
+                images.append((
+                    f'{filename}[{i}]',
+                    mipmap.data,
+                    mipmap.width,
+                    mipmap.height,
+                    pf_to_flags[tex.pixel_format]
+                ))
+    else:
+        rng = numpy.random.default_rng(0)
+        n_blocks = ((args.size + 3) // 4) ** 2
+        for name, flags in (('DXT1', DXT1), ('DXT3', DXT3), ('DXT5', DXT5)):
+            size = n_blocks * _BLOCK_DTYPES[flags].itemsize
+            data = memoryview(rng.integers(0, 256, size, numpy.uint8))
+            images.append((name, data, args.size, args.size, flags))
+
+    print(f'{"image":40} {"numpy":>10} {"squish":>10} {"same":>6}')
+    for name, data, width, height, flags in images:
+        best = None
+        for _ in range(args.repeat):
+            with Timed(name) as t:
+                out = decompress_image(data, width, height, flags)
+            best = min(best or t.elapsed, t.elapsed)
+        line = f'{name:40} {best * 1000:>8.1f}ms'
+
+        if squish:
+            best_squish = None
+            for _ in range(args.repeat):
+                with Timed(name) as t:
+                    ref = squish.decompressImage(
+                        data.tobytes(), width, height, flags)
+                best_squish = min(best_squish or t.elapsed, t.elapsed)
+            line += f' {best_squish * 1000:>8.1f}ms {str(out == ref):>6}'
+        else:
+            line += f' {"-":>10} {"-":>6}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ import struct
 import sys
 from typing import List, TypeVar
 
-from .util import Reader, Printable, BinData
+from .util import Reader, Printable, BinData, map_file
 
 
 class HWEffect(Printable):
@@ -29,6 +29,10 @@ class Shader(Printable):
 
 
 class ShaderParameter(Printable):
+    __slots__ = (
+        'name', 'unk1', 'flags', 'values_per_item', 'n_defaults', 'defaults'
+    )
+
     def __init__(self) -> None:
         self.name: BinData = None
         self.unk1: BinData = None
@@ -59,14 +63,11 @@ def read_file(data: BinData) -> HWEffect:
         param = ShaderParameter()
         param.name = reader.read_string()
         param.unk1 = reader.read_string()
-        param.flags = reader.read_uint32()
-        param.values_per_item = reader.read_uint32()
+        param.flags, param.values_per_item = reader.read_record('II')
 
         if not 42 <= param.flags <= 45:
             param.n_defaults = reader.read_uint32()
-            param.defaults = []
-            for j in range(param.n_defaults):
-                param.defaults.append(reader.read_float())
+            param.defaults = list(reader.read_float_array(param.n_defaults))
         effect.parameters.append(param)
 
     ## VertexShader
@@ -88,14 +89,12 @@ def read_file(data: BinData) -> HWEffect:
     ## ShaderProgram
     program = ShaderProgram()
     program.n_vertex_uniforms = reader.read_uint32()
-    program.vertex_uniforms = []
-    for i in range(program.n_vertex_uniforms):
-        program.vertex_uniforms.append(reader.read_uint32())
+    program.vertex_uniforms = list(
+        reader.read_uint32_array(program.n_vertex_uniforms))
 
     program.n_pixel_uniforms = reader.read_uint32()
-    program.pixel_uniforms = []
-    for i in range(program.n_pixel_uniforms):
-        program.pixel_uniforms.append(reader.read_uint32())
+    program.pixel_uniforms = list(
+        reader.read_uint32_array(program.n_pixel_uniforms))
 
     effect.shader_program = program
 
@@ -119,49 +118,49 @@ def main() -> None:
     args = parser.parse_args()
 
     if args.mode == 'r':
-        with open(args.filename, 'rb') as fp:
-            data = memoryview(fp.read())
-            out = read_file(data)
-            if args.extract == 'vertex':
-                sys.stdout.buffer.write(out.vertex_shader.code)
-            elif args.extract == 'pixel':
-                sys.stdout.buffer.write(out.pixel_shader.code)
-            elif args.extract == 'unpack':
-                mode = os.O_CREAT | os.O_WRONLY | os.O_TRUNC
-                if not args.overwrite:
-                    mode |= os.O_EXCL
-
-                n = os.path.join(
-                    args.dest,
-                    os.path.basename(
-                        out.vertex_shader.name.tobytes().decode('utf-8'))
-                )
-                if not args.overwrite and os.path.exists(n):
-                    print('File already exists: ' + n + \
-                        ' (add --overwrite if ok)')
-                else:
-                    os.makedirs(args.dest, exist_ok=True)
-                    fd = os.open(n, mode)
-                    os.write(fd, out.vertex_shader.code)
-                    os.close(fd)
-                    print(f'Extracted {n}')
-
-                n = os.path.join(
-                    args.dest,
-                    os.path.basename(
-                        out.pixel_shader.name.tobytes().decode('utf-8'))
-                )
-                if not args.overwrite and os.path.exists(n):
-                    print('File already exists: ' + n + \
-                        ' (add --overwrite if ok)')
-                else:
-                    os.makedirs(args.dest, exist_ok=True)
-                    fd = os.open(n, mode)
-                    os.write(fd, out.pixel_shader.code)
-                    os.close(fd)
-                    print(f'Extracted {n}')
+        data = map_file(args.filename)
+        out = read_file(data)
+        if args.extract == 'vertex':
+            sys.stdout.buffer.write(out.vertex_shader.code)
+        elif args.extract == 'pixel':
+            sys.stdout.buffer.write(out.pixel_shader.code)
+        elif args.extract == 'unpack':
+            mode = os.O_CREAT | os.O_WRONLY | os.O_TRUNC
+            if not args.overwrite:
+                mode |= os.O_EXCL
+
+            n = os.path.join(
+                args.dest,
+                os.path.basename(
+                    out.vertex_shader.name.tobytes().decode('utf-8'))
+            )
+            if not args.overwrite and os.path.exists(n):
+                print('File already exists: ' + n + \
+                    ' (add --overwrite if ok)')
+            else:
+                os.makedirs(args.dest, exist_ok=True)
+                fd = os.open(n, mode)
+                os.write(fd, out.vertex_shader.code)
+                os.close(fd)
+                print(f'Extracted {n}')
+
+            n = os.path.join(
+                args.dest,
+                os.path.basename(
+                    out.pixel_shader.name.tobytes().decode('utf-8'))
+            )
+            if not args.overwrite and os.path.exists(n):
+                print('File already exists: ' + n + \
+                    ' (add --overwrite if ok)')
             else:
-                print(out.to_json(indent=4))
+                os.makedirs(args.dest, exist_ok=True)
+                fd = os.open(n, mode)
+                os.write(fd, out.pixel_shader.code)
+                os.close(fd)
+                print(f'Extracted {n}')
+        else:
+            out.dump_json(sys.stdout, indent=4)
+            print()
     elif args.mode == 'w':
         raise NotImplementedError
 
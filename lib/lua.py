@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+
+"""
+Parser for the `return { ... }` Lua subset found in save files.
+
+decode() gives the same Python structures as slpp.decode() for the saves
+the game writes: positional items get keys starting at 0, and tables whose
+keys are exactly 0..n-1 become lists. Escape sequences in strings are
+decoded like Lua does, where slpp only unescapes quotes. It works on bytes,
+only decoding the strings themselves, and keeps its own stack instead of
+recursing.
+"""
+
+import argparse
+import itertools
+import random
+import re
+
+from .util import BinData, Timed
+
+
+# Strings, words/numbers and braces/equal signs. Commas and brackets are
+# skipped with whitespace: a positional item is stored as soon as the next
+# item starts, which is what the commas would tell anyway.
+_TOKENS = re.compile(rb'''
+    [\s,\[\]]*(
+        "[^"\\]*(?:\\.[^"\\]*)*"
+        |'[^'\\]*(?:\\.[^'\\]*)*'
+        |[^\s{}\[\]=,"']+
+        |[{}=]
+    )
+''', re.X | re.S)
+
+# Marks the absence of a pending item or key
+_NONE = object()
+
+_LBRACE, _RBRACE, _EQUALS = ord('{'), ord('}'), ord('=')
+_QUOTES = (ord('"'), ord("'"))
+_NUMBER_START = frozenset(b'-0123456789')
+
+
+def _number(token: bytes):
+    # Same as slpp: int(n, 0) first, so 0123 ends up as a float
+    if b'.' in token or (
+        (b'e' in token or b'E' in token) and b'x' not in token
+        and b'X' not in token
+    ):
+        return float(token)
+    try:
+        return int(token, 0)
+    except ValueError:
+        return float(token)
+
+
+def _table(o: dict):
+    """
+    Turns a table into a list if its keys are 0..n-1, same as slpp
+    """
+    if not o:
+        return o
+    i = 0
+    for key in o:
+        if key != i or type(key) is not int:
+            break
+        i += 1
+    else:
+        return list(o.values())
+
+    for key in o:
+        if type(key) is not int:
+            return o
+    keys = sorted(o)
+    if keys[0] != 0 or keys[-1] != len(keys) - 1:
+        return o
+    out = []
+    for key in o:
+        out.insert(key, o[key])
+    return out
+
+
+# Lua escape sequences: \ddd, \<newline> and single characters
+_UNESCAPE = re.compile(rb'\\(\d{1,3}|.)', re.S)
+_UNESCAPES = {
+    b'n': b'\n', b'r': b'\r', b't': b'\t', b'a': b'\a', b'b': b'\b',
+    b'f': b'\f', b'v': b'\v',
+}
+
+
+def _unescape(m) -> bytes:
+    c = m.group(1)
+    if c.isdigit():
+        return bytes((int(c),))
+    return _UNESCAPES.get(c, c)
+
+
+def _atom(token: bytes, cache: dict):
+    """
+    Decodes a string, number or word, and caches words and short strings
+    (which repeat a lot)
+    """
+    c = token[0]
+    if c in _QUOTES:
+        if token[-1] != c or len(token) < 2:
+            raise ValueError(f'Unterminated string {token!r}')
+        value = token[1:-1]
+        if b'\\' in value:
+            value = _UNESCAPE.sub(_unescape, value)
+        value = value.decode('utf-8')
+        if len(token) < 64:
+            cache[token] = value
+        return value
+    if c in _NUMBER_START:
+        return _number(token)
+    if token.replace(b'_', b'').isalnum():
+        value = token.decode('ascii')
+        cache[token] = value
+        return value
+    raise ValueError(f'Unexpected {token!r}')
+
+
+def _new_cache() -> dict:
+    return {
+        b'true': True, b'false': False, b'nil': None,
+        b'math.huge': float('inf'), b'-math.huge': float('-inf'),
+    }
+
+
+def tokens(source, chunk_size: int=1 << 16):
+    """
+    Yields the tokens of a buffer, or of a binary file-like object read in
+    chunks
+    """
+    if not hasattr(source, 'read'):
+        for m in _TOKENS.finditer(source):
+            yield m.group(1)
+        return
+
+    buf = b''
+    eof = False
+    while not eof:
+        data = source.read(chunk_size)
+        eof = not data
+        buf += data
+        pos = 0
+        for m in _TOKENS.finditer(buf):
+            # A gap means a token that didn't match, which could be a string
+            # cut by the end of the chunk. A token ending with the chunk
+            # could be cut too.
+            if m.start() != pos or (m.end() == len(buf) and not eof):
+                break
+            yield m.group(1)
+            pos = m.end()
+        buf = buf[pos:]
+    if buf.strip(b' \t\r\n,[]'):
+        raise ValueError(f'Unexpected {bytes(buf[:32])!r}')
+
+
+def _all_tokens(data: BinData) -> list:
+    """
+    Returns the tokens of a buffer, raising ValueError on any byte that is
+    not part of a token, e.g. an unterminated string
+    """
+    # Unmatched bytes end up between the tokens, skipped whitespace and
+    # commas being part of the matches
+    parts = _TOKENS.split(data)
+    gaps = parts[0::2]
+    if any(gaps[:-1]) or gaps[-1].strip(b' \t\r\n,[]'):
+        pos = 0
+        for m in _TOKENS.finditer(data):
+            if m.start() != pos:
+                break
+            pos = m.end()
+        rest = bytes(data[pos:])
+        pos += len(rest) - len(rest.lstrip(b' \t\r\n,[]'))
+        raise ValueError(
+            f'Unexpected {bytes(data[pos:pos+32])!r} at offset {pos}')
+    return parts[1::2]
+
+
+def decode(data: BinData):
+    """
+    Decodes a Lua value, without the leading `return`
+    """
+    return _decode(_all_tokens(data), _new_cache())
+
+
+def _decode(tokens, cache: dict):
+    """
+    Decodes the value starting at the first token, and stops right after it
+    """
+    stack = []
+    # Current table, index of its next positional item, pending item (a
+    # value that is either positional or the key of the next `=`) and key
+    # of the table in its parent
+    o = None
+    idx = 0
+    pending = _NONE
+    target = _NONE
+    key = _NONE # Set after `=`
+
+    for token in tokens:
+        c = token[0]
+
+        if c == _LBRACE:
+            if o is not None:
+                if key is not _NONE:
+                    stack.append((o, idx, pending, target))
+                    target = key
+                    key = _NONE
+                else:
+                    if pending is not _NONE:
+                        o[idx] = pending
+                        idx += 1
+                    stack.append((o, idx, _NONE, target))
+                    target = idx
+            o = {}
+            idx = 0
+            pending = _NONE
+            continue
+
+        if c == _RBRACE:
+            if o is None or key is not _NONE:
+                raise ValueError(f'Unexpected }} in {token!r}')
+            if pending is not _NONE:
+                o[idx] = pending
+            value = _table(o)
+            if not stack:
+                return value
+            child_target = target
+            o, idx, pending, target = stack.pop()
+            o[child_target] = value
+            idx += 1
+            pending = _NONE
+            continue
+
+        if c == _EQUALS:
+            if pending is _NONE or key is not _NONE:
+                raise ValueError(f'Unexpected = in {token!r}')
+            key = pending
+            pending = _NONE
+            continue
+
+        value = cache.get(token, _NONE)
+        if value is _NONE:
+            value = _atom(token, cache)
+
+        if o is None:
+            return value
+        if key is not _NONE:
+            o[key] = value
+            idx += 1
+            key = _NONE
+        else:
+            if pending is not _NONE:
+                o[idx] = pending
+                idx += 1
+            pending = value
+
+    if o is not None:
+        raise ValueError('Unexpected end of table')
+    return None
+
+
+START_TABLE = 'start_table'
+KEY = 'key'
+VALUE = 'value'
+END_TABLE = 'end_table'
+
+
+def events(source, chunk_size: int=1 << 16):
+    """
+    Yields (event, value) pairs for a Lua value, with an optional leading
+    `return`. `source` is a buffer or a binary file-like object. Every table
+    item is a KEY event followed by either a VALUE or a START_TABLE ...
+    END_TABLE sequence. Keys of positional items are the same as decode().
+    """
+    cache = _new_cache()
+    stack = []
+    idx = 0
+    pending = _NONE
+    keyed = False # After `=`
+    first = True
+
+    for token in tokens(source, chunk_size):
+        if first:
+            first = False
+            if token == b'return':
+                continue
+        c = token[0]
+
+        if c == _LBRACE:
+            if stack and not keyed:
+                if pending is not _NONE:
+                    yield KEY, idx
+                    yield VALUE, pending
+                    idx += 1
+                    pending = _NONE
+                yield KEY, idx
+            keyed = False
+            stack.append(idx + 1)
+            idx = 0
+            yield START_TABLE, None
+            continue
+
+        if c == _RBRACE:
+            if not stack or keyed:
+                raise ValueError('Unexpected }')
+            if pending is not _NONE:
+                yield KEY, idx
+                yield VALUE, pending
+                pending = _NONE
+            idx = stack.pop()
+            yield END_TABLE, None
+            if not stack:
+                return
+            continue
+
+        if c == _EQUALS:
+            if pending is _NONE or keyed:
+                raise ValueError('Unexpected =')
+            yield KEY, pending
+            pending = _NONE
+            keyed = True
+            continue
+
+        value = cache.get(token, _NONE)
+        if value is _NONE:
+            value = _atom(token, cache)
+
+        if not stack:
+            yield VALUE, value
+            return
+        if keyed:
+            yield VALUE, value
+            idx += 1
+            keyed = False
+        else:
+            if pending is not _NONE:
+                yield KEY, idx
+                yield VALUE, pending
+                idx += 1
+            pending = value
+
+
+def _skip(tokens) -> None:
+    """
+    Skips the rest of a table
+    """
+    depth = 1
+    for token in tokens:
+        c = token[0]
+        if c == _LBRACE:
+            depth += 1
+        elif c == _RBRACE:
+            depth -= 1
+            if not depth:
+                return
+    raise ValueError('Unexpected end of table')
+
+
+def _find(tokens, key, cache: dict):
+    """
+    Looks for `key` in the table whose `{` was just read. Returns its value
+    if it is not a table. Otherwise returns _NONE, right after reading the
+    `{` of the table.
+    """
+    idx = 0
+    pending = _NONE
+    for token in tokens:
+        c = token[0]
+
+        if c == _LBRACE or c == _RBRACE:
+            if pending is not _NONE:
+                if idx == key:
+                    return pending
+                idx += 1
+                pending = _NONE
+            if c == _RBRACE:
+                raise KeyError(key)
+            if idx == key:
+                return _NONE
+            _skip(tokens)
+            idx += 1
+            continue
+
+        if c == _EQUALS:
+            if pending is _NONE:
+                raise ValueError('Unexpected =')
+            found = pending == key
+            pending = _NONE
+            token = next(tokens)
+            if token[0] == _LBRACE:
+                if found:
+                    return _NONE
+                _skip(tokens)
+            else:
+                value = cache.get(token, _NONE)
+                if value is _NONE:
+                    value = _atom(token, cache)
+                if found:
+                    return value
+            idx += 1
+            continue
+
+        value = cache.get(token, _NONE)
+        if value is _NONE:
+            value = _atom(token, cache)
+        if pending is not _NONE:
+            if idx == key:
+                return pending
+            idx += 1
+        pending = value
+    raise ValueError('Unexpected end of table')
+
+
+def extract(source, path, chunk_size: int=1 << 16):
+    """
+    Returns the value at `path` (a list of keys, as given by decode()) in a
+    Lua table, with an optional leading `return`. `source` is a buffer or a
+    binary file-like object. Tables outside of the path are skipped without
+    being decoded. Raises KeyError if the path doesn't exist.
+    """
+    cache = _new_cache()
+    it = tokens(source, chunk_size)
+    token = next(it)
+    if token == b'return':
+        token = next(it)
+    if token[0] != _LBRACE:
+        if path:
+            raise KeyError(path[0])
+        return _atom(token, cache)
+
+    for i, key in enumerate(path):
+        value = _find(it, key, cache)
+        if value is not _NONE:
+            # Can't go deeper than a scalar
+            if i + 1 < len(path):
+                raise KeyError(path[i + 1])
+            return value
+    return _decode(itertools.chain([b'{'], it), cache)
+
+
+# Written escaped by the encoder, \0 as \000 as a digit could follow it
+_ESCAPE = re.compile(rb'[\\"\n\r\0]')
+_ESCAPES = {
+    b'\\': b'\\\\', b'"': b'\\"', b'\n': b'\\n', b'\r': b'\\r',
+    b'\0': b'\\000',
+}
+
+
+# Lua has no infinity literals, decode() reads these back
+_INFINITIES = {float('inf'): b'math.huge', float('-inf'): b'-math.huge'}
+
+
+def _escape(m) -> bytes:
+    return _ESCAPES[m.group()]
+
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\Z')
+_KEYWORDS = frozenset((
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+    'function', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat', 'return',
+    'then', 'true', 'until', 'while',
+))
+
+
+class Encoder:
+    """
+    Serializes Python values to Lua, as decode() reads them back: lists
+    and the 0-based indexes of dicts become positional items, and numbers
+    are written like the game's tostring() (%.14g). Dict keys are written
+    in insertion order, or sorted with `sort_keys`. Backslashes, quotes,
+    newlines, carriage returns and NULs are escaped in strings.
+    """
+    def __init__(self, sort_keys: bool=False) -> None:
+        self.sort_keys = sort_keys
+        self._keys: dict = {}
+        self._fp = None
+        self._chunk_size = 0
+
+    def encode(self, obj, out: bytearray=None) -> bytearray:
+        """
+        Appends to `out` if given
+        """
+        if out is None:
+            out = bytearray()
+        self._encode(obj, out)
+        return out
+
+    def dump(self, obj, fp, chunk_size: int=1 << 16) -> None:
+        """
+        Writes to a binary file-like object, in chunks of about chunk_size
+        """
+        out = bytearray()
+        self._fp = fp
+        self._chunk_size = chunk_size
+        try:
+            self._encode(obj, out)
+        finally:
+            self._fp = None
+        fp.write(out)
+
+    def _key(self, key) -> bytes:
+        # By type too, True == 1 == 1.0
+        k = self._keys.get((type(key), key))
+        if k is None:
+            if isinstance(key, str) and _IDENTIFIER.match(key) \
+                    and key not in _KEYWORDS:
+                k = key.encode('utf-8') + b'='
+            else:
+                # In a buffer of its own, not flushed to the file by dump()
+                out = bytearray(b'[')
+                fp = self._fp
+                self._fp = None
+                try:
+                    self._encode(key, out)
+                finally:
+                    self._fp = fp
+                k = bytes(out + b']=')
+            self._keys[(type(key), key)] = k
+        return k
+
+    def _encode(self, obj, out: bytearray) -> None:
+        if obj is None:
+            out += b'nil'
+        elif obj is True:
+            out += b'true'
+        elif obj is False:
+            out += b'false'
+        elif isinstance(obj, int):
+            out += b'%d' % obj
+        elif isinstance(obj, float):
+            if obj in _INFINITIES:
+                out += _INFINITIES[obj]
+            elif obj != obj:
+                raise ValueError('Can\'t encode nan to Lua')
+            else:
+                out += b'%.14g' % obj
+        elif isinstance(obj, str):
+            out += b'"'
+            out += _ESCAPE.sub(_escape, obj.encode('utf-8'))
+            out += b'"'
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            out += b'"'
+            out += _ESCAPE.sub(_escape, bytes(obj))
+            out += b'"'
+        elif isinstance(obj, dict):
+            out += b'{'
+            items = sorted(obj.items(), key=_sort_key) if self.sort_keys \
+                else obj.items()
+            # decode() gives positional items the index of the item in the
+            # table, whatever the items before them: an item is written
+            # positionally when its key is that index
+            for i, (key, value) in enumerate(items):
+                if type(key) is not int or key != i:
+                    out += self._key(key)
+                self._encode(value, out)
+                out += b','
+            if obj:
+                out[-1] = _RBRACE
+            else:
+                out += b'}'
+        elif isinstance(obj, (list, tuple)):
+            out += b'{'
+            for value in obj:
+                self._encode(value, out)
+                out += b','
+            if obj:
+                out[-1] = _RBRACE
+            else:
+                out += b'}'
+        else:
+            raise TypeError(f'Can\'t encode {type(obj)} to Lua')
+
+        if self._fp is not None and len(out) >= self._chunk_size:
+            self._fp.write(out)
+            del out[:]
+
+
+def _sort_key(item):
+    # Numbers first, then strings
+    key = item[0]
+    return (isinstance(key, str), key if isinstance(key, (str, int, float))
+        else str(key))
+
+
+def encode(obj, sort_keys: bool=False) -> bytearray:
+    return Encoder(sort_keys).encode(obj)
+
+
+def dump(obj, fp, sort_keys: bool=False) -> None:
+    Encoder(sort_keys).dump(obj, fp)
+
+
+def synthetic_save(n_entities: int, seed: int=0) -> bytes:
+    """
+    Generates a save-like Lua table with `n_entities` entities
+    """
+    rng = random.Random(seed)
+    out = [b'return {map={tiles="', b'A' * (n_entities * 4), b'",ents={']
+    for i in range(n_entities):
+        out.append(
+            b'prefab_%d={x=%.14g,z=%.14g,skinname=nil,'
+            b'data={health={health=%d},inventory={items={"%s",%d,true}}}},'
+            % (
+                i,
+                rng.uniform(-1000, 1000),
+                rng.uniform(-1000, 1000),
+                rng.randrange(200),
+                rng.choice((b'log', b'rocks', b'flint')),
+                rng.randrange(40)
+            )
+        )
+    out.append(b'}},playerinfo={x=1,y=0,z=-3.5,day=12}}')
+    return b''.join(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the Lua parser against slpp on ' + \
+            'synthetic saves.'
+    )
+    parser.add_argument('sizes', nargs='*', type=int,
+        default=[1000, 10000, 100000],
+        help='Number of entities of each save')
+    args = parser.parse_args()
+
+    try:
+        from slpp import slpp
+    except ImportError:
+        slpp = None
+
+    print(f'{"entities":>10} {"size":>10} {"lua":>10} {"slpp":>10} {"same":>6}')
+    for n in args.sizes:
+        data = synthetic_save(n)
+        with Timed('lua') as t:
+            out = decode(data[7:])
+        line = f'{n:>10} {len(data) >> 10:>8}kB {t.elapsed:>9.3f}s'
+        if slpp:
+            with Timed('slpp') as t:
+                ref = slpp.decode(data[7:].decode('utf-8'))
+            line += f' {t.elapsed:>9.3f}s {str(out == ref):>6}'
+        else:
+            line += f' {"-":>10} {"-":>6}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+"""
+Headless software rasterizer for animations.
+
+Draw lists from the compositor are rendered with numpy: every triangle of
+an element is transformed by the element matrix, textured (nearest texel)
+from its atlas and alpha blended over the frame. Elements are drawn from
+the last to the first, the first element of a frame being on top.
+
+Atlases are the decoded first mipmaps of the build materials, sampled with
+the OpenGL convention (v = 0 is the first row of the texture data). Their
+colours are taken as premultiplied by alpha, which is how ktech (ktools)
+writes game textures by default. Straight alpha atlases are rendered with
+`premultiplied=False`.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import PIL.Image
+from typing import List, Optional, Tuple
+
+from . import tex_file
+from .anim_file import ANIM, Animation
+from .bild_file import BILD
+from .compositor import Compositor
+from .util import Reader, Timed, map_file
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def load_atlas(path: str, decoder: Optional[str]=None):
+    """
+    Returns the (height, width, 4) uint8 RGBA pixels of the first mipmap of
+    a texture
+    """
+    tex = tex_file.read_file(map_file(path))
+    mipmap = tex.mipmaps[0]
+    if tex.pixel_format == tex_file.PixelFormat.RGBA:
+        data = mipmap.data
+    else:
+        data = tex_file.decompress(tex, 0, decoder)
+    return numpy.frombuffer(data, dtype=numpy.uint8) \
+        .reshape(mipmap.height, mipmap.width, 4)
+
+
+def load_atlases(
+    build: BILD, directory: str, decoder: Optional[str]=None
+) -> list:
+    """
+    Loads the atlases of a build, which are stored next to it
+    """
+    return [
+        load_atlas(os.path.join(directory, bytes(m).decode('utf-8')), decoder)
+        for m in build.materials
+    ]
+
+
+class Rasterizer:
+    """
+    Renders draw lists of `build` at `scale` pixels per unit, from atlases
+    with premultiplied or straight alpha
+    """
+    def __init__(
+        self, build: BILD, atlases: list, scale: float=1.0,
+        premultiplied: bool=True
+    ) -> None:
+        if numpy is None:
+            raise RuntimeError('numpy is required by the rasterizer')
+        self.atlases = atlases
+        self.scale = scale
+        self.premultiplied = premultiplied
+        v = build.vertices
+        if not isinstance(v, numpy.ndarray):
+            v = numpy.array(
+                [(p.x, p.y, p.z, p.u, p.v, p.w) for p in v],
+                dtype=numpy.float32
+            ).reshape(-1, 6)
+            self._xy, self._uv, self._page = v[:, 0:2], v[:, 3:5], v[:, 5]
+        else:
+            self._xy = numpy.stack([v['x'], v['y']], axis=-1)
+            self._uv = numpy.stack([v['u'], v['v']], axis=-1)
+            self._page = v['w']
+
+    def _transform(self, draw) -> numpy.ndarray:
+        start = int(draw['start'])
+        xy = self._xy[start:start+int(draw['count'])]
+        m = draw['matrix']
+        return xy @ m[:, :2].T + m[:, 2]
+
+    def bounds(self, draw_lists) -> Tuple[float, float, float, float]:
+        """
+        Returns (x0, y0, x1, y1) enclosing all the given draw lists
+        """
+        points = [
+            self._transform(d) for draws in draw_lists for d in draws
+        ]
+        if not points:
+            return 0.0, 0.0, 1.0, 1.0
+        points = numpy.concatenate(points)
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        return float(x0), float(y0), float(x1), float(y1)
+
+    def size(self, bounds) -> Tuple[int, int]:
+        x0, y0, x1, y1 = bounds
+        return (
+            max(1, int(numpy.ceil((x1 - x0) * self.scale))),
+            max(1, int(numpy.ceil((y1 - y0) * self.scale)))
+        )
+
+    def render(self, draws, bounds) -> numpy.ndarray:
+        """
+        Returns the (height, width, 4) uint8 RGBA image of a draw list, the
+        top left corner of `bounds` being at (0, 0)
+        """
+        width, height = self.size(bounds)
+        origin = numpy.array(bounds[:2], dtype=numpy.float32)
+        # Premultiplied colour and alpha
+        rgb = numpy.zeros((height, width, 3), dtype=numpy.float32)
+        alpha = numpy.zeros((height, width), dtype=numpy.float32)
+
+        for draw in draws[::-1]:
+            start = int(draw['start'])
+            points = (self._transform(draw) - origin) * self.scale
+            uv = self._uv[start:start+int(draw['count'])]
+            page = self._page[start:start+int(draw['count'])]
+            for i in range(0, len(points) - 2, 3):
+                atlas = self.atlases[min(
+                    int(round(float(page[i]))), len(self.atlases) - 1)]
+                self._triangle(
+                    rgb, alpha, points[i:i+3], uv[i:i+3], atlas,
+                    self.premultiplied
+                )
+
+        out = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+        visible = alpha > 0
+        out[visible, :3] = numpy.clip(
+            rgb[visible] / alpha[visible, None] * 255 + 0.5, 0, 255)
+        out[..., 3] = numpy.clip(alpha * 255 + 0.5, 0, 255)
+        return out
+
+    @staticmethod
+    def _triangle(rgb, alpha, p, uv, atlas, premultiplied) -> None:
+        height, width = alpha.shape
+        x0 = max(int(numpy.floor(p[:, 0].min())), 0)
+        x1 = min(int(numpy.ceil(p[:, 0].max())), width)
+        y0 = max(int(numpy.floor(p[:, 1].min())), 0)
+        y1 = min(int(numpy.ceil(p[:, 1].max())), height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        area = (p[1, 0] - p[0, 0]) * (p[2, 1] - p[0, 1]) - \
+            (p[2, 0] - p[0, 0]) * (p[1, 1] - p[0, 1])
+        if abs(area) < 1e-12:
+            return
+        if area < 0:
+            p, uv, area = p[[0, 2, 1]], uv[[0, 2, 1]], -area
+
+        # Edge functions of the pixel centres, edge k being opposite to
+        # vertex k. Pixels on an edge are only drawn for top and left edges,
+        # so that triangles sharing an edge don't both blend its pixels.
+        px = numpy.arange(x0, x1, dtype=numpy.float32)[None, :] + 0.5
+        py = numpy.arange(y0, y1, dtype=numpy.float32)[:, None] + 0.5
+        inside = True
+        weights = []
+        for k in range(3):
+            a, b = p[(k + 1) % 3], p[(k + 2) % 3]
+            ex, ey = b[0] - a[0], b[1] - a[1]
+            w = ex * (py - a[1]) - ey * (px - a[0])
+            top_left = ey < 0 or (ey == 0 and ex > 0)
+            inside = inside & ((w >= 0) if top_left else (w > 0))
+            weights.append(w)
+        if not inside.any():
+            return
+        l0, l1, l2 = (w[inside] / area for w in weights)
+
+        th, tw = atlas.shape[:2]
+        u = l0 * uv[0, 0] + l1 * uv[1, 0] + l2 * uv[2, 0]
+        v = l0 * uv[0, 1] + l1 * uv[1, 1] + l2 * uv[2, 1]
+        col = numpy.clip((u * tw).astype(numpy.int32), 0, tw - 1)
+        row = numpy.clip((v * th).astype(numpy.int32), 0, th - 1)
+        texel = atlas[row, col].astype(numpy.float32) / 255
+
+        a = texel[:, 3]
+        src_rgb = texel[:, :3] if premultiplied else texel[:, :3] * a[:, None]
+        dst_rgb = rgb[y0:y1, x0:x1]
+        dst_alpha = alpha[y0:y1, x0:x1]
+        dst_rgb[inside] = src_rgb + dst_rgb[inside] * (1 - a[:, None])
+        dst_alpha[inside] = a + dst_alpha[inside] * (1 - a)
+
+
+def render_animation(
+    rasterizer: Rasterizer, compositor: Compositor, animation: Animation
+) -> List[numpy.ndarray]:
+    """
+    Returns the frames of an animation, all of the same size
+    """
+    draw_lists = compositor.draw_lists(animation)
+    bounds = rasterizer.bounds(draw_lists)
+    return [rasterizer.render(draws, bounds) for draws in draw_lists]
+
+
+def sprite_sheet(
+    frames: List[numpy.ndarray], columns: Optional[int]=None
+) -> Tuple[numpy.ndarray, List[Tuple[int, int, int, int]]]:
+    """
+    Packs frames of the same size in a grid, square by default. Returns the
+    sheet and the (x, y, w, h) rectangle of each frame.
+    """
+    if not frames:
+        return numpy.zeros((1, 1, 4), dtype=numpy.uint8), []
+    h, w = frames[0].shape[:2]
+    if columns is None:
+        columns = int(numpy.ceil(numpy.sqrt(len(frames))))
+    rows = (len(frames) + columns - 1) // columns
+    sheet = numpy.zeros((rows * h, columns * w, 4), dtype=numpy.uint8)
+    rects = []
+    for i, frame in enumerate(frames):
+        x, y = (i % columns) * w, (i // columns) * h
+        sheet[y:y+h, x:x+w] = frame
+        rects.append((x, y, w, h))
+    return sheet, rects
+
+
+def save_png(image: numpy.ndarray, path: str) -> None:
+    PIL.Image.fromarray(image, 'RGBA').save(path)
+
+
+def render_file(
+    directory: str, dest: str, name: Optional[str]=None, sheet: bool=True,
+    scale: float=1.0, decoder: Optional[str]=None, premultiplied: bool=True
+) -> Tuple[str, int, float]:
+    """
+    Renders the animations (all of them unless a name is given) of a
+    directory holding anim.bin, build.bin and its atlases to `dest`, as a
+    sprite sheet and its JSON rectangles or as one PNG per frame. Returns
+    (directory, rendered frames, run time).
+    """
+    with Timed(directory, enabled=False) as t:
+        build = BILD.read(
+            Reader(map_file(os.path.join(directory, 'build.bin'))),
+            columnar=True
+        )
+        anim = ANIM.read(
+            Reader(map_file(os.path.join(directory, 'anim.bin'))),
+            columnar=True
+        )
+        rasterizer = Rasterizer(
+            build, load_atlases(build, directory, decoder), scale,
+            premultiplied
+        )
+        compositor = Compositor(build, anim)
+
+        animations = anim.animations if name is None else anim.find(name)
+        n_frames = 0
+        if animations:
+            os.makedirs(dest, exist_ok=True)
+        for animation in animations:
+            frames = render_animation(rasterizer, compositor, animation)
+            stem = os.path.join(
+                dest,
+                f'{bytes(animation.name).decode("utf-8")}-' + \
+                    f'{animation.valid_facings.value}'
+            )
+            if sheet:
+                image, rects = sprite_sheet(frames)
+                save_png(image, stem + '.png')
+                with open(stem + '.json', 'w') as fp:
+                    json.dump({
+                        'frame_rate': animation.frame_rate,
+                        'frames': rects,
+                    }, fp)
+            else:
+                for i, frame in enumerate(frames):
+                    save_png(frame, f'{stem}-{i:03}.png')
+            n_frames += len(frames)
+    return directory, n_frames, t.elapsed
+
+
+def find_dirs(path: str) -> List[Tuple[str, str]]:
+    """
+    Returns (path, path relative to the input root) of every directory of a
+    tree holding both an anim.bin and a build.bin
+    """
+    dirs = []
+    for root, subdirs, names in os.walk(path):
+        subdirs.sort()
+        if 'anim.bin' in names and 'build.bin' in names:
+            dirs.append((root, os.path.relpath(root, path)))
+    return dirs
+
+
+def render_batch(
+    path: str, dest: str, name: Optional[str]=None, sheet: bool=True,
+    scale: float=1.0, jobs: Optional[int]=None, decoder: Optional[str]=None,
+    premultiplied: bool=True
+) -> None:
+    """
+    Runs render_file over a directory tree, with one worker process per CPU
+    by default. The tree structure is kept under `dest`.
+    """
+    dirs = find_dirs(path)
+    n_frames = 0
+    with Timed('batch', enabled=False) as t:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    render_file,
+                    full,
+                    os.path.join(dest, rel),
+                    name,
+                    sheet,
+                    scale,
+                    decoder,
+                    premultiplied
+                )
+                for full, rel in dirs
+            ]
+            for future in as_completed(futures):
+                directory, n, elapsed = future.result()
+                print(f'{directory}: {n} frame(s) in {elapsed:.3f}s')
+                n_frames += n
+    print(f'{len(dirs)} build(s), {n_frames} frame(s), '
+        f'{n_frames / max(t.elapsed, 1e-9):.1f} frames/s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Renders `Don\'t Starve` animations without a GPU.',
+        epilog='Directories hold anim.bin, build.bin and the atlases ' + \
+            'listed by the build.'
+    )
+    parser.add_argument('mode', choices=['r', 'b'],
+        help='Render a directory/Batch render a directory tree')
+    parser.add_argument('path', help='Directory or directory tree')
+    parser.add_argument('name', nargs='?', default=None,
+        help='Animation name (all animations if unspecified)')
+    parser.add_argument('--dest', default='.', help='Output directory')
+    parser.add_argument('--frames', action='store_true',
+        help='Save one PNG per frame instead of a sprite sheet')
+    parser.add_argument('--scale', type=float, default=1.0,
+        help='Pixels per unit')
+    parser.add_argument('--jobs', type=int, default=None,
+        help='Number of worker processes in batch mode (defaults to CPU count)')
+    parser.add_argument('--decoder', choices=tex_file.DECODERS, default=None,
+        help='DXT decoder (defaults to the first available one)')
+    parser.add_argument('--straight-alpha', action='store_true',
+        help='The atlases are not premultiplied by alpha')
+    args = parser.parse_args()
+
+    if args.mode == 'r':
+        directory, n, elapsed = render_file(
+            args.path, args.dest, args.name, not args.frames, args.scale,
+            args.decoder, not args.straight_alpha
+        )
+        print(f'{directory}: {n} frame(s) in {elapsed:.3f}s')
+    elif args.mode == 'b':
+        render_batch(
+            args.path, args.dest, args.name, not args.frames, args.scale,
+            args.jobs, args.decoder, not args.straight_alpha
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+Structural diff of save files.
+
+A delta is a list of operations on the parsed Lua tables:
+    ['set', path, value]  creates or replaces the value at path
+    ['del', path]         removes the value at path
+where a path is a list of keys, with positional indexes starting at 0 like
+save_file.parse_path. Deltas are stored as Lua so that numeric keys and
+nils survive the round trip.
+"""
+
+import argparse
+import hashlib
+import sys
+from typing import Dict
+
+from . import lua
+from .save_file import ENCODED, read_file, parse_lua, serialize_lua, \
+    write_file
+from .util import BinData, map_file
+
+
+SET = 'set'
+DEL = 'del'
+
+_CONTAINERS = (dict, list)
+
+
+def _hash(obj, hashes: Dict[int, bytes]) -> bytes:
+    """
+    Merkle digest of the table `obj`, the digests of all its tables are
+    stored in `hashes` by id
+    """
+    # A digest of the contents rather than hash(), equal digests must mean
+    # equal tables (hash(-1) == hash(-2)). The repr of scalars is typed,
+    # as 1, 1.0 and true are different Lua values. Tables are inlined as
+    # their digest in a tuple, saves hold no tuples.
+    if type(obj) is dict:
+        # Sorted, so that the digest doesn't depend on the key order
+        data = '\0'.join(sorted([
+            repr((key, (_hash(value, hashes),) if type(value) in _CONTAINERS
+                else value))
+            for key, value in obj.items()
+        ]))
+    else:
+        data = repr([
+            (_hash(value, hashes),) if type(value) in _CONTAINERS else value
+            for value in obj
+        ])
+    digest = hashes[id(obj)] = hashlib.blake2b(
+        data.encode('utf-8'), digest_size=16).digest()
+    return digest
+
+
+def subtree_hashes(obj) -> Dict[int, bytes]:
+    """
+    Returns the digest of every table of `obj`, by id. The objects must be
+    kept alive as long as the digests are used.
+    """
+    hashes: Dict[int, bytes] = {}
+    if type(obj) in _CONTAINERS:
+        _hash(obj, hashes)
+    return hashes
+
+
+def _same(a, b) -> bool:
+    return type(a) is type(b) and a == b
+
+
+def _diff(a, b, path: list, ha: dict, hb: dict, out: list) -> None:
+    if type(a) is not type(b) or type(a) not in _CONTAINERS:
+        if not _same(a, b):
+            out.append([SET, path, b])
+        return
+    # Identical subtrees are skipped without being visited
+    if ha[id(a)] == hb[id(b)]:
+        return
+
+    if type(a) is dict:
+        for key in a:
+            if key not in b:
+                out.append([DEL, path + [key]])
+        for key, value in b.items():
+            if key in a:
+                _diff(a[key], value, path + [key], ha, hb, out)
+            else:
+                out.append([SET, path + [key], value])
+    else:
+        n = min(len(a), len(b))
+        for i in range(n):
+            _diff(a[i], b[i], path + [i], ha, hb, out)
+        for i in range(n, len(b)):
+            out.append([SET, path + [i], b[i]])
+        # From the end, so that indexes stay valid
+        for i in reversed(range(n, len(a))):
+            out.append([DEL, path + [i]])
+
+
+def diff(
+    a, b, ha: Dict[int, bytes]=None, hb: Dict[int, bytes]=None
+) -> list:
+    """
+    Returns the delta turning `a` into `b`. Hashes from subtree_hashes() can
+    be passed to compare one save against many.
+    """
+    out: list = []
+    _diff(
+        a, b, [],
+        subtree_hashes(a) if ha is None else ha,
+        subtree_hashes(b) if hb is None else hb,
+        out
+    )
+    return out
+
+
+def apply(obj, delta: list):
+    """
+    Applies `delta` to `obj` in place and returns it. The root is replaced
+    if a path is empty.
+    """
+    for op in delta:
+        path = op[1]
+        if not path:
+            obj = op[2] if op[0] == SET else None
+            continue
+        parent = obj
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if op[0] == DEL:
+            del parent[key]
+        elif isinstance(parent, list) and key == len(parent):
+            parent.append(op[2])
+        else:
+            parent[key] = op[2]
+    return obj
+
+
+def diff_files(a: BinData, b: BinData) -> list:
+    """
+    Returns the delta between the contents of two save files
+    """
+    return diff(parse_lua(read_file(a)), parse_lua(read_file(b)))
+
+
+def patch_file(data: BinData, delta: list, encoded: bool=None) -> bytes:
+    """
+    Applies `delta` to a save file. The result is compressed like the
+    original unless `encoded` is given.
+    """
+    if encoded is None:
+        encoded = data[10] == ENCODED
+    obj = apply(parse_lua(read_file(data)), delta)
+    return write_file(serialize_lua(obj), encoded)
+
+
+def dumps(delta: list) -> bytearray:
+    return lua.encode(delta)
+
+
+def loads(data: BinData) -> list:
+    return lua.decode(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Structural diff of `Don\'t Starve` save files.'
+    )
+    parser.add_argument('mode', choices=['d', 'a'],
+        help='Diff two saves / Apply a delta to a save')
+    parser.add_argument('filenames', nargs='+',
+        help='Diff: old and new saves. Apply: save, delta and output file.')
+    parser.add_argument('--compress', choices=['auto', 'yes', 'no'],
+        default='auto', help='Output compression in apply mode')
+    args = parser.parse_args()
+
+    if args.mode == 'd':
+        if len(args.filenames) != 2:
+            parser.error('diff takes two saves')
+        old, new = args.filenames
+        delta = diff_files(map_file(old), map_file(new))
+        sys.stdout.buffer.write(dumps(delta) + b'\n')
+    elif args.mode == 'a':
+        if len(args.filenames) != 3:
+            parser.error('apply takes a save, a delta and an output file')
+        save, delta, output = args.filenames
+        encoded = {'auto': None, 'yes': True, 'no': False}[args.compress]
+        data = patch_file(
+            map_file(save),
+            loads(map_file(delta)),
+            encoded
+        )
+        with open(output, 'wb') as fp:
+            fp.write(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,20 @@
 
 import argparse
 import base64
-from slpp import slpp as lua
+import io
+import json
+import os
+import shutil
 import struct
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Deque
 import zlib
 
-from .util import Reader, Printable, BinData
+from . import lua
+from .util import Reader, Printable, BinData, Timed, map_file
 
 
 def read_file(data: BinData) -> BinData:
@@ -42,12 +50,161 @@ def read_file(data: BinData) -> BinData:
 
 
 def parse_lua(data: BinData):
-    assert(data.startswith(b'return '))
-    d = data[7:].decode('utf-8')
-    return lua.decode(d)
+    assert(data[:7] == b'return ')
+    return lua.decode(data[7:])
 
 
-def write_file(data: BinData, encoded: bool=False) -> bytes:
+def serialize_lua(obj, sort_keys: bool=False) -> bytearray:
+    """
+    Inverse of parse_lua
+    """
+    return lua.Encoder(sort_keys).encode(obj, bytearray(b'return '))
+
+
+STRATEGIES = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'huffman': zlib.Z_HUFFMAN_ONLY,
+    'rle': zlib.Z_RLE,
+    'fixed': zlib.Z_FIXED,
+}
+
+WINDOW_SIZE = 1 << 15
+
+
+def _deflate_block(
+    data: bytes, dictionary: bytes, level: int, strategy: int, last: bool
+) -> bytes:
+    args = [level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+        strategy]
+    if dictionary:
+        args.append(dictionary)
+    compressor = zlib.compressobj(*args)
+    return compressor.compress(data) + \
+        compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelCompressor:
+    """
+    Drop-in replacement for zlib.compressobj deflating `block_size` blocks in
+    a thread pool, as pigz does. Each block is primed with the last 32kB of
+    the previous one and ends on a byte boundary (sync flush), so the raw
+    blocks concatenate into a single regular zlib stream.
+
+    The thread pool is shut down by a Z_FINISH flush, or by close() (also
+    called when used as a context manager) if the stream is abandoned.
+    """
+    def __init__(
+        self, level: int=9, strategy: int=zlib.Z_DEFAULT_STRATEGY,
+        jobs: int=None, block_size: int=1 << 20
+    ) -> None:
+        self.level = level
+        self.strategy = strategy
+        self.block_size = block_size
+        self._jobs = jobs or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(self._jobs)
+        self._pending = bytearray()
+        self._dictionary = b''
+        self._adler = zlib.adler32(b'')
+        self._futures: Deque[Future] = deque()
+        self._header = self._zlib_header()
+
+    def _zlib_header(self) -> bytes:
+        # Same FLEVEL as deflate.c, it is informative only
+        level = 6 if self.level == zlib.Z_DEFAULT_COMPRESSION else self.level
+        if level < 2 or self.strategy >= zlib.Z_HUFFMAN_ONLY:
+            flevel = 0
+        elif level < 6:
+            flevel = 1
+        elif level == 6:
+            flevel = 2
+        else:
+            flevel = 3
+        cmf = 0x78
+        flg = flevel << 6
+        flg += 31 - (cmf << 8 | flg) % 31
+        return bytes([cmf, flg])
+
+    def _submit(self, data: bytes, last: bool) -> None:
+        self._futures.append(self._pool.submit(
+            _deflate_block, data, self._dictionary, self.level, self.strategy,
+            last
+        ))
+        self._dictionary = (self._dictionary + data)[-WINDOW_SIZE:]
+
+    def _collect(self, keep: int) -> bytes:
+        out = [self._header]
+        self._header = b''
+        while len(self._futures) > keep:
+            out.append(self._futures.popleft().result())
+        return b''.join(out)
+
+    def compress(self, data) -> bytes:
+        self._adler = zlib.adler32(data, self._adler)
+        self._pending += data
+        while len(self._pending) >= self.block_size:
+            self._submit(bytes(self._pending[:self.block_size]), False)
+            del self._pending[:self.block_size]
+        # Bounds the memory used by blocks waiting to be written
+        return self._collect(2 * self._jobs)
+
+    def flush(self, mode: int=zlib.Z_FINISH) -> bytes:
+        if mode == zlib.Z_NO_FLUSH:
+            return self._collect(len(self._futures))
+        last = mode == zlib.Z_FINISH
+        self._submit(bytes(self._pending), last)
+        self._pending = bytearray()
+        if mode == zlib.Z_FULL_FLUSH:
+            # The next block must not refer to anything before this point
+            self._dictionary = b''
+        if not last:
+            return self._collect(0)
+        out = self._collect(0) + struct.pack('>I', self._adler)
+        self.close()
+        return out
+
+    def close(self) -> None:
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._pool.shutdown()
+
+    def __enter__(self) -> 'ParallelCompressor':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def compressor(
+    level: int=9, strategy: int=zlib.Z_DEFAULT_STRATEGY, jobs: int=1
+):
+    """
+    Returns a zlib compression object, parallel if `jobs` is not 1
+    (None for one thread per CPU)
+    """
+    if jobs == 1:
+        return zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+    return ParallelCompressor(level, strategy, jobs)
+
+
+def deflate(
+    data: BinData, level: int=9, strategy: int=zlib.Z_DEFAULT_STRATEGY,
+    jobs: int=1
+) -> bytes:
+    c = compressor(level, strategy, jobs)
+    try:
+        return c.compress(data) + c.flush()
+    finally:
+        if isinstance(c, ParallelCompressor):
+            c.close()
+
+
+def write_file(
+    data: BinData, encoded: bool=False, level: int=9,
+    strategy: int=zlib.Z_DEFAULT_STRATEGY, jobs: int=1
+) -> bytes:
     file_header = b'KLEI     1'
 
     if not encoded:
@@ -55,7 +212,7 @@ def write_file(data: BinData, encoded: bool=False) -> bytes:
         file_contents = data
     else:
         file_header += bytes([68])
-        zlib_data = zlib.compress(data, 9) # type: ignore
+        zlib_data = deflate(data, level, strategy, jobs)
 
         magic1 = 1
         magic2 = 16
@@ -75,26 +232,258 @@ def write_file(data: BinData, encoded: bool=False) -> bytes:
     return file_header + file_contents # type: ignore
 
 
+FILE_HEADER = b'KLEI     1'
+PLAIN = 32
+ENCODED = 68
+ZLIB_HEADER = struct.Struct('<IIII')
+
+
+class SaveReader(io.RawIOBase):
+    """
+    File-like object returning the decoded contents of a save file read from
+    `fp`, in constant memory
+    """
+    def __init__(self, fp: BinaryIO, chunk_size: int=1 << 16) -> None:
+        self.fp = fp
+        self.chunk_size = chunk_size
+        file_header = fp.read(11)
+        assert(file_header[:10] == FILE_HEADER)
+        self.file_type = file_header[10]
+        assert(self.file_type in (PLAIN, ENCODED))
+
+        self.inflated_len: int = None
+        self.deflated_len: int = None
+        self._eof = False
+        self._buffer = bytearray()
+        self._b64_tail = b''
+        self._header = b''
+        self._deflated = 0
+        self._inflated = 0
+        self._zlib = zlib.decompressobj()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            self._fill()
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        del self._buffer[:n]
+        return n
+
+    def _fill(self) -> None:
+        if self.file_type == PLAIN:
+            data = self.fp.read(self.chunk_size)
+            self._eof = not data
+            self._buffer += data
+            return
+
+        # Output is bounded by chunk_size, the rest of the input is kept
+        # in unconsumed_tail
+        if self._zlib.unconsumed_tail:
+            data = self._zlib.decompress(
+                self._zlib.unconsumed_tail,
+                self.chunk_size
+            )
+            self._inflated += len(data)
+            self._buffer += data
+            return
+
+        b64_data = self._b64_tail + self.fp.read(self.chunk_size)
+        if len(b64_data) == len(self._b64_tail):
+            assert(not self._b64_tail)
+            data = self._zlib.flush()
+            self._inflated += len(data)
+            self._buffer += data
+            self._eof = True
+            assert(self._deflated == self.deflated_len)
+            assert(self._inflated == self.inflated_len)
+            return
+
+        cut = len(b64_data) - len(b64_data) % 4
+        self._b64_tail = b64_data[cut:]
+        zlib_data = base64.b64decode(b64_data[:cut])
+
+        if self.inflated_len is None:
+            self._header += zlib_data
+            if len(self._header) < ZLIB_HEADER.size:
+                return
+            (
+                magic1,
+                magic2,
+                self.inflated_len,
+                self.deflated_len
+            ) = ZLIB_HEADER.unpack_from(self._header)
+            assert(magic1 == 1)
+            assert(magic2 == 16)
+            zlib_data = self._header[ZLIB_HEADER.size:]
+            self._header = b''
+
+        self._deflated += len(zlib_data)
+        data = self._zlib.decompress(zlib_data, self.chunk_size)
+        self._inflated += len(data)
+        self._buffer += data
+
+
+class SaveWriter(io.RawIOBase):
+    """
+    File-like object writing a save file to `fp`, in constant memory.
+    Encoded saves store their lengths before the data, so the compressed
+    stream is spooled (to disk past `spool_size`) until close().
+    """
+    def __init__(
+        self, fp: BinaryIO, encoded: bool=False, level: int=9,
+        spool_size: int=1 << 24, strategy: int=zlib.Z_DEFAULT_STRATEGY,
+        jobs: int=1
+    ) -> None:
+        self.fp = fp
+        self.encoded = encoded
+        self._inflated = 0
+        if encoded:
+            self._zlib = compressor(level, strategy, jobs)
+            self._spool = tempfile.SpooledTemporaryFile(spool_size)
+        else:
+            self.fp.write(FILE_HEADER + bytes([PLAIN]))
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if not self.encoded:
+            return self.fp.write(b)
+        self._spool.write(self._zlib.compress(b))
+        self._inflated += len(b)
+        return len(b)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.encoded:
+            try:
+                self._spool.write(self._zlib.flush())
+            finally:
+                if isinstance(self._zlib, ParallelCompressor):
+                    self._zlib.close()
+            deflated_len = self._spool.tell()
+            self._spool.seek(0)
+
+            self.fp.write(FILE_HEADER + bytes([ENCODED]))
+            # Chunks must be a multiple of 3 bytes to be encoded separately
+            data = ZLIB_HEADER.pack(1, 16, self._inflated, deflated_len)
+            while True:
+                chunk = self._spool.read(3 << 14)
+                data += chunk
+                cut = len(data) - len(data) % 3 if chunk else len(data)
+                self.fp.write(base64.b64encode(data[:cut]))
+                data = data[cut:]
+                if not chunk:
+                    break
+            self._spool.close()
+        self.fp.flush()
+        super().close()
+
+
+def load(path: str):
+    """
+    Reads and parses a save file
+    """
+    return parse_lua(read_file(map_file(path)))
+
+
+def save(
+    path: str, obj, encoded: bool=False, sort_keys: bool=False,
+    level: int=9, jobs: int=1
+) -> None:
+    """
+    Serializes `obj` to a save file, without building it in memory first
+    """
+    with open(path, 'wb') as fp:
+        with SaveWriter(fp, encoded, level, jobs=jobs) as writer:
+            writer.write(b'return ')
+            lua.dump(obj, writer, sort_keys)
+
+
+def parse_path(path: str) -> list:
+    """
+    'map.topology.ids.0' -> ['map', 'topology', 'ids', 0]
+    """
+    return [
+        int(key) if key.lstrip('-').isdigit() else key
+        for key in path.split('.')
+    ] if path else []
+
+
+def benchmark(
+    data: BinData, levels=range(10), strategy: int=zlib.Z_DEFAULT_STRATEGY,
+    jobs: int=None
+) -> None:
+    """
+    Prints the size and time of each compression level, with one thread
+    and with `jobs` threads
+    """
+    jobs = jobs or os.cpu_count() or 1
+    print(f'{len(data) >> 10}kB, {jobs} threads')
+    print(f'{"level":>5} {"size":>10} {"ratio":>6} {"time":>9} ' + \
+        f'{"parallel":>10} {"time":>9}')
+    for level in levels:
+        with Timed('deflate') as t:
+            size = len(deflate(data, level, strategy))
+        with Timed('parallel') as tp:
+            size_p = len(deflate(data, level, strategy, jobs))
+        print(f'{level:>5} {size >> 10:>8}kB {size / len(data):>6.3f} ' + \
+            f'{t.elapsed:>8.3f}s {size_p >> 10:>8}kB {tp.elapsed:>8.3f}s')
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description='Utility to parse `Don\'t Starve` save files.'
     )
-    parser.add_argument('mode', choices=['r', 'w', 'wc'],
-        help='Read/Write/Write Compressed. Takes input from stdin in write mode.')
-    parser.add_argument('filename', help='File path')
+    parser.add_argument('mode', choices=['r', 'w', 'wc', 'b'],
+        help='Read/Write/Write Compressed/Benchmark compression levels. ' + \
+        'Takes input from stdin in write mode.')
+    parser.add_argument('filename',
+        help='File path, - for stdin in read mode and stdout in write mode')
+    parser.add_argument('--extract', default=None,
+        help='Print the value at a dotted path (e.g. map.persistdata) as ' + \
+        'JSON in read mode. Numbers are positional indexes.')
+    parser.add_argument('--level', type=int, default=9,
+        help='zlib compression level, from 0 (none) to 9 (smallest)')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='default',
+        help='zlib compression strategy')
+    parser.add_argument('--jobs', type=int, default=1,
+        help='Number of compression threads, 0 for one per CPU')
     args = parser.parse_args()
 
-    data: BinData = None
+    strategy = STRATEGIES[args.strategy]
+    jobs = args.jobs or None
 
     if args.mode == 'r':
-        with open(args.filename, 'rb') as fp:
-            data = memoryview(fp.read())
-            sys.stdout.buffer.write(read_file(data)) # type: ignore
+        fp = sys.stdin.buffer if args.filename == '-' \
+            else open(args.filename, 'rb')
+        with fp:
+            if args.extract is not None:
+                value = lua.extract(SaveReader(fp), parse_path(args.extract))
+                json.dump(value, sys.stdout, indent=4)
+                print()
+            else:
+                shutil.copyfileobj(SaveReader(fp), sys.stdout.buffer)
     elif args.mode in ('w', 'wc'):
-        data = memoryview(sys.stdin.buffer.read())
-        with open(args.filename, 'wb+') as fp:
-            compress = (args.mode == 'wc')
-            fp.write(write_file(data, compress))
+        compress = (args.mode == 'wc')
+        options = dict(level=args.level, strategy=strategy, jobs=jobs)
+        if args.filename == '-':
+            with SaveWriter(sys.stdout.buffer, compress, **options) as writer:
+                shutil.copyfileobj(sys.stdin.buffer, writer)
+        else:
+            with open(args.filename, 'wb+') as fp:
+                with SaveWriter(fp, compress, **options) as writer:
+                    shutil.copyfileobj(sys.stdin.buffer, writer)
+    elif args.mode == 'b':
+        fp = sys.stdin.buffer if args.filename == '-' \
+            else open(args.filename, 'rb')
+        with fp:
+            data = SaveReader(fp).read()
+        benchmark(data, strategy=strategy, jobs=jobs)
 
 
 if __name__ == '__main__':
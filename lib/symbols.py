@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Hashed strings shared by ANIM and BILD files.
+
+Symbols, folders and animations are referenced by the hash of their name.
+Every parsed file adds its string table to the global `table`, so hashes
+from any file of an asset set resolve in O(1).
+"""
+
+import argparse
+from typing import Dict, Iterable, Optional, Union
+
+from .util import BinData, Struct
+
+
+class HashedString(Struct):
+    __slots__ = ('hash', 'str')
+
+    def __init__(self):
+        self.hash = None
+        self.str = None
+
+    @staticmethod
+    def read(reader):
+        h = HashedString()
+        h.hash = reader.read_uint32()
+        h.str = reader.read_string()
+        return h
+
+
+def string_hash(name: Union[str, BinData]) -> int:
+    """
+    Hash of a name as computed by the game (case-insensitive sdbm)
+    """
+    if isinstance(name, str):
+        name = name.encode('utf-8')
+    h = 0
+    for c in bytes(name).lower():
+        h = (c + (h << 6) + (h << 16) - h) & 0xffffffff
+    return h
+
+
+class SymbolTable:
+    """
+    Maps hashes to names. Names are stored once, as bytes.
+    """
+    def __init__(self) -> None:
+        self._names: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, h: int) -> bool:
+        return h in self._names
+
+    def add(self, h: int, name: BinData) -> bytes:
+        """
+        Returns the interned name, the first one wins if a hash collides
+        """
+        interned = self._names.get(h)
+        if interned is None:
+            interned = self._names[h] = bytes(name)
+        return interned
+
+    def add_name(self, name: Union[str, BinData]) -> int:
+        if isinstance(name, str):
+            name = name.encode('utf-8')
+        h = string_hash(name)
+        self.add(h, name)
+        return h
+
+    def add_strings(self, strings: Iterable[HashedString]) -> None:
+        for s in strings:
+            if s.hash not in self._names:
+                self._names[s.hash] = bytes(s.str)
+
+    def name(self, h: int) -> Optional[bytes]:
+        return self._names.get(h)
+
+    def hash(self, name: Union[str, BinData]) -> Optional[int]:
+        """
+        Returns the hash of a known name
+        """
+        h = string_hash(name)
+        return h if h in self._names else None
+
+
+# Filled by ANIM.read and BILD.read
+table = SymbolTable()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Hash of `Don\'t Starve` symbol names.'
+    )
+    parser.add_argument('names', nargs='+', help='Names to hash')
+    args = parser.parse_args()
+    for name in args.names:
+        print(f'{string_hash(name):#010x} {string_hash(name):>10} {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,40 @@
 
 import argparse
 import base64
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
 from enum import Enum
+import glob
+import hashlib
+import json
+import os
 import PIL.Image
 from pprint import pprint
-import squish
 import struct
 import sys
-from typing import List
+from typing import List, Optional, Tuple
 import zlib
 
-from .util import Reader, Timed
+from .util import Reader, Timed, fields, map_file
 # Timed.ENABLED = True
 
+try:
+    import squish
+except ImportError:
+    squish = None
+
+try:
+    from . import dxt
+except ImportError:
+    dxt = None
+
+# Both give the same output, the first available one is the default
+DECODERS = [name for name, mod in (('squish', squish), ('numpy', dxt)) if mod]
+
+# Optional dependency of each decoder
+_DECODER_MODULES = {'squish': 'squish', 'numpy': 'numpy'}
+
 
 class PixelFormat(Enum):
     DXT1 = 0
@@ -38,6 +60,8 @@ class TextureType(Enum):
 
 
 class MipMap:
+    __slots__ = ('width', 'height', 'pitch', 'size', 'data')
+
     def __init__(self) -> None:
         self.width: int = None
         self.height: int = None
@@ -55,34 +79,188 @@ class TexFile:
         self.flags: int = None
         self.unk1: int = None
         self.mipmaps: List[MipMap] = None
+        self.content_hash: str = None
+
+    def hash(self) -> str:
+        """
+        Hash of the texture format and data, computed once
+        """
+        if self.content_hash is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(struct.pack(
+                '<6I',
+                self.platform.value,
+                self.pixel_format.value,
+                self.texture_type.value,
+                self.mips,
+                self.flags,
+                self.unk1
+            ))
+            for mipmap in self.mipmaps:
+                h.update(struct.pack('<HHI', mipmap.width, mipmap.height,
+                    mipmap.size))
+                h.update(mipmap.data)
+            self.content_hash = h.hexdigest()
+        return self.content_hash
+
+
+class DecodedCache:
+    """
+    LRU cache of decoded RGBA mipmaps, keyed by (texture hash, mipmap index)
+    and bounded by `max_bytes`. If `directory` is set, evicted entries are
+    written there as raw RGBA files, which are memory-mapped on later hits.
+    """
+    def __init__(
+        self, max_bytes: int=256 << 20, directory: Optional[str]=None
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def _path(self, key: Tuple[str, int]) -> str:
+        return os.path.join(self.directory, f'{key[0]}-{key[1]}.rgba')
+
+    def get(self, key: Tuple[str, int]) -> Optional[memoryview]:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+        if self.directory is not None and os.path.exists(self._path(key)):
+            self.disk_hits += 1
+            return map_file(self._path(key))
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple[str, int], data: memoryview) -> None:
+        if key in self._entries:
+            return
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes and self._entries:
+            old_key, old_data = self._entries.popitem(last=False)
+            self.size -= len(old_data)
+            self.evictions += 1
+            if self.directory is not None:
+                self._spill(old_key, old_data)
+
+    def _spill(self, key: Tuple[str, int], data: memoryview) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size': self.size,
+        }
+
+
+# Consulted by read_compressed when set, see enable_cache()
+cache: Optional[DecodedCache] = None
 
 
-def read_compressed(tex: TexFile, mipmap_index: int) -> PIL.Image:
+def enable_cache(
+    max_bytes: int=256 << 20, directory: Optional[str]=None
+) -> DecodedCache:
+    """
+    Makes read_compressed cache decoded mipmaps in this process, returns
+    the cache. Entries evicted to `directory` are reused by later runs.
+    """
+    global cache
+    cache = DecodedCache(max_bytes, directory)
+    return cache
+
+
+def disable_cache() -> None:
+    global cache
+    cache = None
+
+# squish and dxt use the same flags
+PF_TO_FLAGS = {
+    PixelFormat.DXT1: 1 << 0,
+    PixelFormat.DXT3: 1 << 1,
+    PixelFormat.DXT5: 1 << 2
+}
+
+
+def decompress(
+    tex: TexFile, mipmap_index: int, decoder: Optional[str]=None
+) -> memoryview:
+    """
+    Returns the raw RGBA pixels of a DXT compressed mipmap.
+    `decoder` is one of DECODERS, the first available one by default.
+    """
+    if decoder is None:
+        if not DECODERS:
+            raise RuntimeError(
+                'No DXT decoder available, squish or numpy is required')
+        decoder = DECODERS[0]
+    elif decoder not in DECODERS:
+        if decoder not in _DECODER_MODULES:
+            raise ValueError(f'Unknown DXT decoder {decoder!r}, expected ' + \
+                ' or '.join(_DECODER_MODULES))
+        raise RuntimeError(f'{_DECODER_MODULES[decoder]} is required ' + \
+            f'by the {decoder} DXT decoder')
+
+    mipmap = tex.mipmaps[mipmap_index]
+    flags = PF_TO_FLAGS[tex.pixel_format]
+    if decoder == 'squish':
+        with Timed('squish.decompressImage'):
+            return memoryview(squish.decompressImage(
+                mipmap.data.tobytes(),
+                mipmap.width,
+                mipmap.height,
+                flags
+            ))
+    with Timed('dxt.decompress'):
+        return memoryview(dxt.decompress(
+            mipmap.data,
+            mipmap.width,
+            mipmap.height,
+            flags
+        ).reshape(-1))
+
+
+def read_compressed(
+    tex: TexFile, mipmap_index: int, decoder: Optional[str]=None
+) -> PIL.Image:
+    """
+    Decoded mipmaps go through the module `cache` if there is one
+    """
     assert(tex.pixel_format in (
         PixelFormat.DXT1,
         PixelFormat.DXT3,
         PixelFormat.DXT5,
         PixelFormat.RGBA)
     )
-    pf_to_squish = {
-        PixelFormat.DXT1: squish.DXT1,
-        PixelFormat.DXT3: squish.DXT3,
-        PixelFormat.DXT5: squish.DXT5
-    }
 
     mipmap = tex.mipmaps[mipmap_index]
-    if tex.pixel_format in pf_to_squish:
-        with Timed('squish.decompressImage'):
-            decompressed_data = memoryview(squish.decompressImage(
-                mipmap.data.tobytes(),
-                mipmap.width,
-                mipmap.height,
-                pf_to_squish[tex.pixel_format]
-            ))
+    if tex.pixel_format in PF_TO_FLAGS and cache is not None:
+        key = (tex.hash(), mipmap_index)
+        decompressed_data = cache.get(key)
+        if decompressed_data is None:
+            decompressed_data = decompress(tex, mipmap_index, decoder)
+            cache.put(key, decompressed_data)
+    elif tex.pixel_format in PF_TO_FLAGS:
+        decompressed_data = decompress(tex, mipmap_index, decoder)
     elif tex.pixel_format == PixelFormat.RGBA:
         decompressed_data = mipmap.data
 
-
     with Timed('PIL.Image.frombuffer'):
         image = PIL.Image.frombuffer(
             'RGBA',
@@ -97,9 +275,14 @@ def read_compressed(tex: TexFile, mipmap_index: int) -> PIL.Image:
     return image
 
 
-def read_file(data: memoryview) -> TexFile:
-    data = data
-    reader = Reader(data)
+HEADER_SIZE = 8
+MIPMAP_HEADER_SIZE = 10
+
+
+def read_header(reader: Reader) -> TexFile:
+    """
+    Reads the KTEX header and mipmap descriptors, not the mipmap data
+    """
     assert(reader.read_bytes(4) == b'KTEX')
 
     b = reader.read_uint32()
@@ -114,46 +297,228 @@ def read_file(data: memoryview) -> TexFile:
     mipmaps = []
     for i in range(tex.mips):
         m = MipMap()
-        m.width = reader.read_uint16()
-        m.height = reader.read_uint16()
-        m.pitch = reader.read_uint16()
-        m.size = reader.read_uint32()
+        m.width, m.height, m.pitch, m.size = reader.read_record('HHHI')
         mipmaps.append(m)
 
-    for i in range(tex.mips):
-        mipmaps[i].data = reader.read_bytes(mipmaps[i].size)
-
     tex.mipmaps = mipmaps
     return tex
 
 
+def read_header_file(path: str) -> TexFile:
+    """
+    Same as read_header, but only reads the header bytes of a file
+    """
+    with open(path, 'rb') as fp:
+        data = fp.read(HEADER_SIZE)
+        mips = (struct.unpack_from('<I', data, 4)[0] >> 13) & 31
+        data += fp.read(mips * MIPMAP_HEADER_SIZE)
+    return read_header(Reader(data))
+
+
+def read_file(data: memoryview) -> TexFile:
+    reader = Reader(data)
+    tex = read_header(reader)
+    for mipmap in tex.mipmaps:
+        mipmap.data = reader.read_bytes(mipmap.size)
+    return tex
+
+
+def find_files(path: str) -> List[Tuple[str, str]]:
+    """
+    Returns (path, path relative to the input root) of every .tex file in a
+    directory tree, or matching a glob pattern
+    """
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith('.tex'):
+                    full = os.path.join(root, name)
+                    files.append((full, os.path.relpath(full, path)))
+        return files
+    # Relative to the directory before the first wildcard, so that files of
+    # the same name in different directories don't collide
+    root = path
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    if root == path:
+        root = os.path.dirname(root)
+    return [
+        (f, os.path.relpath(f, root or '.'))
+        for f in sorted(glob.glob(path, recursive=True))
+    ]
+
+
+def extract_file(
+    path: str, dest: str, mipmap_index: Optional[int]=None,
+    decoder: Optional[str]=None
+) -> Tuple[str, int, int, float]:
+    """
+    Saves the mipmaps (all of them unless an index is given) of a texture as
+    PNG images in `dest`. Returns (path, file size, saved images, run time).
+    """
+    with Timed(path, enabled=False) as t:
+        data = map_file(path)
+        tex = read_file(data)
+        if mipmap_index is None:
+            indexes = range(len(tex.mipmaps))
+        else:
+            indexes = [mipmap_index] if mipmap_index < len(tex.mipmaps) else []
+
+        stem = os.path.splitext(dest)[0]
+        if indexes:
+            os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        for i in indexes:
+            image = read_compressed(tex, i, decoder)
+            image.save(stem + '.png' if i == 0 else f'{stem}-{i}.png')
+    return path, len(data), len(indexes), t.elapsed
+
+
+def extract_batch(
+    path: str, dest: str, mipmap_index: Optional[int]=None,
+    jobs: Optional[int]=None, decoder: Optional[str]=None,
+    cache_size: int=0, cache_dir: Optional[str]=None
+) -> None:
+    """
+    Runs extract_file over a directory tree or glob pattern, with one worker
+    process per CPU by default. The tree structure is kept under `dest`.
+    Each worker has a decoded mipmap cache of `cache_size` bytes if it is
+    not 0.
+    """
+    files = find_files(path)
+    n_images = 0
+    with Timed('batch', size=0, enabled=True) as t:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=enable_cache if cache_size else None,
+            initargs=(cache_size, cache_dir) if cache_size else ()
+        ) as executor:
+            futures = [
+                executor.submit(
+                    extract_file,
+                    full,
+                    os.path.join(dest, rel),
+                    mipmap_index,
+                    decoder
+                )
+                for full, rel in files
+            ]
+            for future in as_completed(futures):
+                name, size, n, elapsed = future.result()
+                print(f'{name}: {n} image(s) in {elapsed:.3f}s')
+                t.size += size
+                n_images += n
+    if files:
+        print(f'{len(files)} file(s), {n_images} image(s), '
+            f'{len(files) / max(t.elapsed, 1e-9):.1f} files/s')
+
+
+CATALOG_FIELDS = [
+    'path',
+    'platform',
+    'pixel_format',
+    'texture_type',
+    'mips',
+    'width',
+    'height',
+    'data_size',
+]
+
+
+def catalog(path: str) -> List[dict]:
+    """
+    Describes every texture of a directory tree or glob pattern, reading
+    only their headers. Width and height are the ones of the first mipmap.
+    """
+    rows = []
+    for full, rel in find_files(path):
+        tex = read_header_file(full)
+        first = tex.mipmaps[0] if tex.mipmaps else None
+        rows.append({
+            'path': rel,
+            'platform': tex.platform.name,
+            'pixel_format': tex.pixel_format.name,
+            'texture_type': tex.texture_type.name,
+            'mips': tex.mips,
+            'width': first.width if first else 0,
+            'height': first.height if first else 0,
+            'data_size': sum(m.size for m in tex.mipmaps),
+            'mipmaps': [[m.width, m.height, m.size] for m in tex.mipmaps],
+        })
+    return rows
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description='Utility to parse `Don\'t Starve` texture (.tex) files.',
         epilog='If a mipmap index is not provided, it will list the mipmaps.'
     )
-    parser.add_argument('mode', choices=['r', 'w'],
-        help='Read/Write')
+    parser.add_argument('mode', choices=['r', 'w', 'b', 'i'],
+        help='Read/Write/Batch extract/Index. Batch and index modes take ' + \
+        'a directory or a glob pattern as file path. Batch mode extracts ' + \
+        'all mipmaps by default, index mode prints a catalog of the ' + \
+        'textures to stdout.')
     parser.add_argument('filename', help='File path')
     parser.add_argument('mipmap', nargs='?', type=int, default=None, help='Mipmap index (starts at 0)')
     parser.add_argument('--image', required=False,
         help='Extracted image file path. Open the image in a new window if unspecified.')
+    parser.add_argument('--dest', default='.',
+        help='Output directory in batch mode')
+    parser.add_argument('--jobs', type=int, default=None,
+        help='Number of worker processes in batch mode (defaults to CPU count)')
+    parser.add_argument('--decoder', choices=DECODERS, default=None,
+        help='DXT decoder (defaults to the first available one)')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json',
+        help='Catalog format in index mode')
+    parser.add_argument('--cache-size', type=int, default=0,
+        help='Size in MiB of the decoded mipmap cache (per worker in ' + \
+        'batch mode), disabled by default')
+    parser.add_argument('--cache-dir', default=None,
+        help='Directory keeping the mipmaps evicted from the cache ' + \
+        'across runs')
     args = parser.parse_args()
+    cache_size = args.cache_size << 20
+    if cache_size:
+        enable_cache(cache_size, args.cache_dir)
 
     if args.mode == 'r':
-        with open(args.filename, 'rb') as fp:
-            data = memoryview(fp.read())
+        if args.mipmap != None:
+            data = map_file(args.filename)
             tex = read_file(data)
-            if args.mipmap != None:
-                image = read_compressed(tex, args.mipmap)
-                if args.image != None:
-                    with Timed('PIL.Image.save'):
-                        image.save(args.image)
-                else:
-                    image.show()
+            image = read_compressed(tex, args.mipmap, args.decoder)
+            if args.image != None:
+                with Timed('PIL.Image.save'):
+                    image.save(args.image)
             else:
-                pprint(dict({k: v for k, v in tex.__dict__.items() if k != 'mipmaps'}))
-                pprint(list(dict({k: v for k, v in mipmap.__dict__.items() if k != 'data'}) for mipmap in tex.mipmaps))
+                image.show()
+        else:
+            tex = read_header_file(args.filename)
+            pprint(dict({k: v for k, v in tex.__dict__.items() if k not in ('mipmaps', 'content_hash')}))
+            pprint(list(dict({k: v for k, v in fields(mipmap).items() if k != 'data'}) for mipmap in tex.mipmaps))
+    elif args.mode == 'b':
+        extract_batch(
+            args.filename,
+            args.dest,
+            args.mipmap,
+            args.jobs,
+            args.decoder,
+            cache_size,
+            args.cache_dir
+        )
+    elif args.mode == 'i':
+        rows = catalog(args.filename)
+        if args.format == 'json':
+            json.dump(rows, sys.stdout, indent=4)
+            print()
+        else:
+            writer = csv.DictWriter(
+                sys.stdout,
+                CATALOG_FIELDS,
+                extrasaction='ignore'
+            )
+            writer.writeheader()
+            writer.writerows(rows)
     elif args.mode in ('w', 'wc'):
         raise NotImplementedError
 
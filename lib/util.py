@@ -1,12 +1,31 @@
 from json import JSONEncoder
+import mmap
 import struct
 import time
-from typing import Generic, TypeVar, Union
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar, Union
 
 
 BinData = Union[bytes, memoryview]
 T = TypeVar('T')
 
+_STRUCTS: Dict[str, struct.Struct] = {}
+
+
+def _struct(fmt: str) -> struct.Struct:
+    """
+    Returns a cached little-endian struct.Struct for the given format
+    """
+    s = _STRUCTS.get(fmt)
+    if s is None:
+        s = _STRUCTS[fmt] = struct.Struct('<' + fmt)
+    return s
+
+
+_UINT32 = _struct('I')
+_UINT16 = _struct('H')
+_FLOAT = _struct('f')
+
+
 # This not really a generic, it has to be indexable
 class Reader(Generic[T]):
     """
@@ -17,29 +36,41 @@ class Reader(Generic[T]):
         self.offset: int = 0
 
     def read_uint32(self) -> int:
-        i = struct.unpack(
-            '<I',
-            self.data[self.offset:self.offset+4] # type: ignore
-        )[0]
+        i = _UINT32.unpack_from(self.data, self.offset)[0] # type: ignore
         self.offset += 4
         return i
 
     def read_uint16(self) -> int:
-        i = struct.unpack(
-            '<H',
-            self.data[self.offset:self.offset+2] # type: ignore
-        )[0]
+        i = _UINT16.unpack_from(self.data, self.offset)[0] # type: ignore
         self.offset += 2
         return i
 
     def read_float(self) -> float:
-        i = struct.unpack(
-            '<f',
-            self.data[self.offset:self.offset+4] # type: ignore
-        )[0]
+        i = _FLOAT.unpack_from(self.data, self.offset)[0] # type: ignore
         self.offset += 4
         return i
 
+    def read_record(self, fmt: str) -> Tuple:
+        """
+        Unpacks a whole record (e.g. '7f', 'IIffffII') in a single call
+        """
+        s = _struct(fmt)
+        rec = s.unpack_from(self.data, self.offset) # type: ignore
+        self.offset += s.size
+        return rec
+
+    # Array lengths vary too much to be worth caching, struct keeps its own
+    # small cache of compiled formats anyway
+    def read_uint32_array(self, n: int) -> Tuple[int, ...]:
+        arr = struct.unpack_from(f'<{n}I', self.data, self.offset) # type: ignore
+        self.offset += 4 * n
+        return arr
+
+    def read_float_array(self, n: int) -> Tuple[float, ...]:
+        arr = struct.unpack_from(f'<{n}f', self.data, self.offset) # type: ignore
+        self.offset += 4 * n
+        return arr
+
     def read_string(self) -> T:
         str_len = self.read_uint32()
         str_dat = self.data[self.offset:self.offset+str_len] # type: ignore
@@ -52,16 +83,57 @@ class Reader(Generic[T]):
         return dat
 
 
+def map_file(path: str) -> memoryview:
+    """
+    Maps a file read-only in memory. Slices of the returned memoryview (as
+    returned by Reader) are views into the mapping, not copies.
+    """
+    with open(path, 'rb') as fp:
+        try:
+            m = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty files can't be mapped
+            return memoryview(b'')
+    # The mapping outlives the file descriptor and is released with the last
+    # view on it
+    return memoryview(m)
+
+
+_SLOTS: Dict[type, Tuple[str, ...]] = {}
+
+
+def fields(o) -> dict:
+    """
+    Returns the attributes of an object, `__slots__` (in declaration order)
+    then `__dict__`
+    """
+    cls = type(o)
+    slots = _SLOTS.get(cls)
+    if slots is None:
+        slots = _SLOTS[cls] = tuple(
+            name
+            for c in reversed(cls.__mro__)
+            for name in c.__dict__.get('__slots__', ())
+            if name not in ('__dict__', '__weakref__')
+        )
+    out = {name: getattr(o, name) for name in slots}
+    if hasattr(o, '__dict__'):
+        out.update(o.__dict__)
+    return out
+
+
 class Printable:
     """
-    Helper class to somewhat print an object's value based on its attribs
+    Helper class to somewhat print an object's value based on its attribs.
+    Subclasses can declare `__slots__` to drop the per-object dict, all slots
+    must be set in __init__.
     """
+    __slots__ = ()
     __noprint__ = []
 
     def __repr__(self) -> str:
         out = {}
         for k in dir(self):
-            if not k.startswith('_'):
+            if not k.startswith('_') and k not in self.__noprint__:
                 attr = getattr(self, k)
                 if callable(attr):
                     continue
@@ -74,55 +146,104 @@ class Printable:
         raise NotImplementedError()
 
     def to_json(self, **kwargs) -> str:
-        class Encoder(JSONEncoder):
-            def default(self, o):
-                if isinstance(o, memoryview):
-                    try:
-                        return o.tobytes().decode('utf-8')
-                    except UnicodeDecodeError:
-                        return repr(o.tobytes())
-                if isinstance(o, bytes):
-                    try:
-                        return o.decode('utf-8')
-                    except UnicodeDecodeError:
-                        return repr(o)
-
-                if isinstance(o, Printable):
-                    try:
-                        return o.json_value()
-                    except NotImplementedError:
-                        return {
-                            k:v for k,v in o.__dict__.items()
-                            if k not in o.__noprint__
-                        }
-                try:
-                    return o.__dict__
-                except AttributeError:
-                    return super().default(o)
-        return Encoder(**kwargs).encode(self)
+        return PrintableEncoder(**kwargs).encode(self)
+
+    def dump_json(
+        self, fp, chunk_size: int=1 << 16, stream: bool=None, **kwargs
+    ) -> None:
+        """
+        Writes the JSON value to the text file `fp` in chunks of about
+        `chunk_size` characters. Without indent, it is encoded in one go by
+        the C encoder unless `stream` is set; indented output is always
+        streamed (pure Python), instead of being built in memory.
+        """
+        encoder = PrintableEncoder(**kwargs)
+        if stream is None:
+            stream = encoder.indent is not None
+        if not stream:
+            s = encoder.encode(self)
+            for i in range(0, len(s), chunk_size):
+                fp.write(s[i:i+chunk_size])
+            return
+
+        chunk: List[str] = []
+        size = 0
+        for s in encoder.iterencode(self):
+            chunk.append(s)
+            size += len(s)
+            if size >= chunk_size:
+                fp.write(''.join(chunk))
+                chunk.clear()
+                size = 0
+        fp.write(''.join(chunk))
+
+
+class PrintableEncoder(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, (bytes, memoryview)):
+            # Decodes views in place, without a tobytes() copy
+            try:
+                return str(o, 'utf-8')
+            except UnicodeDecodeError:
+                return repr(bytes(o))
+
+        if isinstance(o, Printable):
+            try:
+                return o.json_value()
+            except NotImplementedError:
+                return {
+                    k:v for k,v in fields(o).items()
+                    if k not in o.__noprint__
+                }
+        # numpy arrays, the rows of structured ones as dicts like the Struct
+        # they replace
+        if hasattr(o, 'tolist'):
+            names = o.dtype.names if hasattr(o, 'dtype') else None
+            if names:
+                return [dict(zip(names, row)) for row in o.tolist()]
+            return o.tolist()
+        out = fields(o)
+        if out or hasattr(o, '__dict__'):
+            return out
+        return super().default(o)
 
 
 class Timed:
     """
-    Prints the run time of the enclosed block
+    Prints the run time of the enclosed block, and its throughput if the
+    amount of processed bytes is known (`size`, which can also be set from
+    within the block). The run time is kept in `elapsed`.
     """
     ENABLED = False
 
-    def __init__(self, name: str) -> None:
+    def __init__(
+        self, name: str, size: Optional[int]=None,
+        enabled: Optional[bool]=None
+    ) -> None:
         self.name = name
+        self.size = size
+        self.enabled = self.ENABLED if enabled is None else enabled
+        self.elapsed: float = None
 
     def __enter__(self, *args) -> 'Timed':
         self.start = time.time()
         return self
 
     def __exit__(self, *args) -> None:
-        if not self.ENABLED:
+        self.elapsed = time.time() - self.start
+        if not self.enabled:
             return
-        elapsed = time.time() - self.start
-        print(f'Elapsed[{self.name}]: {elapsed}s')
+        if self.size is not None and self.elapsed > 0:
+            throughput = self.size / self.elapsed / (1 << 20)
+            print(f'Elapsed[{self.name}]: {self.elapsed}s '
+                f'({throughput:.2f} MiB/s)')
+        else:
+            print(f'Elapsed[{self.name}]: {self.elapsed}s')
 
 
 class Struct(Printable):
+    __slots__ = ()
+
     @staticmethod
     def read(reader):
         raise NotImplementedError()
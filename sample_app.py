@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import sys
+
 import glm
 
 import ui.gl_utils as utils
@@ -6,8 +8,11 @@ import ui.shapes as shapes
 
 
 class Scene(utils.Scene):
-    def __init__(self, *args):
+    def __init__(self, anim_dir=None, n_characters=100):
         super().__init__('dont_starve_tools')
+        self.anim_dir = anim_dir
+        self.n_characters = n_characters
+        self.characters = None
 
     def init(self):
         super().init()
@@ -15,6 +20,10 @@ class Scene(utils.Scene):
         # self.instances.append(shapes.planes())
         self.triangle = shapes.triangle()
         self.instances.append(self.triangle)
+        if self.anim_dir:
+            self.characters = shapes.characters(
+                self.anim_dir, self.n_characters)
+            self.instances.append(self.characters)
 
         # Transparent at the end (and axes on top of everything)
         self.instances.append(shapes.grid())
@@ -28,10 +37,13 @@ class Scene(utils.Scene):
             glm.radians(elapsed * 180),
             glm.vec3(0, 1, 0)
         )
+        if self.characters:
+            self.characters.asset.update(elapsed)
 
 
 def main():
-    scene = Scene()
+    # ./sample_app.py [directory with anim.bin, build.bin and atlases [count]]
+    scene = Scene(*sys.argv[1:2], *map(int, sys.argv[2:3]))
     scene.main()
 
     # PyOpenGL functions don't work when called during interpreter shutdown,
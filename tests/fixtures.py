@@ -0,0 +1,69 @@
+"""
+Minimal ANIM, BILD and KTEX files built from explicit contents
+"""
+
+import struct
+
+
+def _string(b: bytes) -> bytes:
+    return struct.pack('<I', len(b)) + b
+
+
+def _strings(names: dict) -> bytes:
+    return struct.pack('<I', len(names)) + b''.join(
+        struct.pack('<I', h) + _string(n) for h, n in names.items())
+
+
+def anim(animations: dict, names: dict) -> bytes:
+    """
+    `animations` maps names to lists of frames, a frame being a list of
+    (symbol_hash, symbol_frame, folder_hash, (a, b, c, d, tx, ty, z))
+    """
+    body = b''
+    n_frames = n_elements = 0
+    for name, frames in animations.items():
+        body += _string(name) + bytes([1]) + \
+            struct.pack('<IfI', 0, 30.0, len(frames))
+        for elements in frames:
+            body += struct.pack('<4fI', 0, 0, 1, 1, 0)
+            body += struct.pack('<I', len(elements))
+            for symbol_hash, symbol_frame, folder_hash, mat in elements:
+                body += struct.pack(
+                    '<3I7f', symbol_hash, symbol_frame, folder_hash, *mat)
+            n_frames += 1
+            n_elements += len(elements)
+    return b'ANIM' + struct.pack('<I', 4) + \
+        struct.pack('<4I', n_elements, n_frames, 0, len(animations)) + \
+        body + _strings(names)
+
+
+def bild(symbols: dict, names: dict) -> bytes:
+    """
+    `symbols` maps hashes to lists of (frame number, n_alpha), the vertices
+    of each frame following the ones of the previous frame. Vertex i is
+    (i, 0, 0, 0, 0, 0).
+    """
+    n_frames = sum(len(frames) for frames in symbols.values())
+    out = b'BILD' + struct.pack('<III', 6, len(symbols), n_frames) + \
+        _string(b'test') + struct.pack('<I', 1) + _string(b'atlas-0.tex')
+    start = 0
+    for h, frames in symbols.items():
+        out += struct.pack('<II', h, len(frames))
+        for num, n_alpha in frames:
+            out += struct.pack('<II4fII', num, 1, 0, 0, 1, 1, start, n_alpha)
+            start += n_alpha
+    out += struct.pack('<I', start)
+    for i in range(start):
+        out += struct.pack('<6f', i, 0, 0, 0, 0, 0)
+    return out + _strings(names)
+
+
+def tex(mipmaps: list, pixel_format: int=0) -> bytes:
+    """
+    `mipmaps` is a list of (width, height, data), for a PC 2D texture
+    """
+    flags = 12 | pixel_format << 4 | 2 << 9 | len(mipmaps) << 13
+    out = b'KTEX' + struct.pack('<I', flags)
+    for width, height, data in mipmaps:
+        out += struct.pack('<HHHI', width, height, 0, len(data))
+    return out + b''.join(data for _, _, data in mipmaps)
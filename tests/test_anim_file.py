@@ -0,0 +1,104 @@
+import pytest
+
+from lib.anim_file import ANIM
+from lib.symbols import string_hash
+from lib.util import Reader
+
+from . import fixtures
+
+HEAD, BODY = 0x100, 0x200
+NAMES = {HEAD: b'head', BODY: b'body'}
+
+
+def mat(tx, z=0.0):
+    return (1.0, 0.0, 0.0, 1.0, tx, 0.0, z)
+
+
+ANIMATIONS = {
+    b'idle': [
+        [(HEAD, 0, BODY, mat(1)), (BODY, 1, BODY, mat(2, 0.5))],
+        [(BODY, 2, HEAD, mat(3))],
+    ],
+    b'Run_Loop': [
+        [],
+    ],
+}
+
+MODES = {
+    'objects': {},
+    'columnar': {'columnar': True},
+    'lazy': {'lazy': True},
+}
+
+
+@pytest.fixture(params=list(MODES))
+def anim(request):
+    return ANIM.read(
+        Reader(fixtures.anim(ANIMATIONS, NAMES)), **MODES[request.param])
+
+
+def test_find(anim):
+    idle, run = anim.animations
+    assert anim.find('idle') == [idle]
+    assert anim.find(b'Run_Loop') == [run]
+    assert anim.find(memoryview(b'idle')) == [idle]
+    assert anim.find('missing') == []
+
+
+def test_find_by_hash(anim):
+    # Animation names are not in the string table of the file
+    idle, run = anim.animations
+    assert anim.find(string_hash('idle')) == [idle]
+    assert anim.find(string_hash('run_loop')) == [run]
+    assert anim.find(string_hash('missing')) == []
+
+
+def read_all_modes():
+    data = fixtures.anim(ANIMATIONS, NAMES)
+    return {m: ANIM.read(Reader(data), **kw) for m, kw in MODES.items()}
+
+
+def test_modes_print_the_same():
+    anims = read_all_modes()
+    ref = anims.pop('objects')
+    for anim in anims.values():
+        assert anim.to_json() == ref.to_json()
+        assert repr(anim.animations) == repr(ref.animations)
+        assert repr(anim.animations[0].frames[0]) == \
+            repr(ref.animations[0].frames[0])
+    assert 'SIZE' not in repr(ref.animations[0].frames[0].elements[0])
+
+
+def test_modes_read_the_same():
+    anims = read_all_modes()
+    ref = anims.pop('objects')
+    for anim in anims.values():
+        for a, b in zip(anim.animations, ref.animations):
+            assert bytes(a.name) == bytes(b.name)
+            assert len(a.frames) == len(b.frames) == b.n_frames
+            for fa, fb in zip(a.frames, b.frames):
+                assert fa.n_elements == fb.n_elements
+                for ea, eb in zip(fa.elements, fb.elements):
+                    assert ea.symbol_hash == eb.symbol_hash
+                    assert ea.symbol_frame == eb.symbol_frame
+                    assert ea.mat.tx == eb.mat.tx
+                    assert ea.mat.z == eb.mat.z
+
+
+def test_lazy_frames():
+    anim = ANIM.read(Reader(fixtures.anim(ANIMATIONS, NAMES)), lazy=True)
+    idle, run = anim.animations
+    assert idle._frames is None and run._frames is None
+    assert len(run.frames) == 1 and idle._frames is None
+    frames = idle.frames
+    assert [f.n_elements for f in frames] == [2, 1]
+    assert frames[1].elements[0].mat.tx == 3
+    assert idle.frames is frames
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_dump_json(anim, stream):
+    import io
+    fp = io.StringIO()
+    anim.dump_json(fp, chunk_size=64, stream=stream)
+    assert fp.getvalue() == anim.to_json()
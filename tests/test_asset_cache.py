@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from lib.anim_file import ANIM  # noqa: E402
+from lib.asset_cache import AssetCache  # noqa: E402
+from lib.bild_file import BILD  # noqa: E402
+from lib.util import Reader  # noqa: E402
+
+from . import fixtures  # noqa: E402
+from .test_anim_file import ANIMATIONS, NAMES  # noqa: E402
+from .test_bild_file import SYMBOLS  # noqa: E402
+
+FILES = {
+    'anim.bin': (fixtures.anim(ANIMATIONS, NAMES), ANIM),
+    'build.bin': (fixtures.bild(SYMBOLS, NAMES), BILD),
+}
+
+
+@pytest.fixture
+def sources(tmp_path):
+    os.makedirs(tmp_path / 'data')
+    for name, (data, _) in FILES.items():
+        (tmp_path / 'data' / name).write_bytes(data)
+    return tmp_path / 'data'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AssetCache(str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('name', list(FILES))
+def test_load(sources, cache, name):
+    data, cls = FILES[name]
+    expected = cls.read(Reader(data), columnar=True).to_json()
+    source = str(sources / name)
+    assert cache.load(source).to_json() == expected
+    assert cache.stats() == {'hits': 0, 'rehashed': 0, 'misses': 1}
+    assert cache.load(source).to_json() == expected
+    assert cache.stats() == {'hits': 1, 'rehashed': 0, 'misses': 1}
+
+
+def test_touched(sources, cache):
+    source = str(sources / 'anim.bin')
+    cache.load(source)
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cache.load(source)
+    cache.load(source)
+    assert cache.stats() == {'hits': 2, 'rehashed': 1, 'misses': 1}
+
+
+def test_modified(sources, cache):
+    source = sources / 'anim.bin'
+    cache.load(str(source))
+    st = os.stat(source)
+    # Same size, different names
+    data = FILES['anim.bin'][0].replace(b'idle', b'walk')
+    source.write_bytes(data)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    anim = cache.load(str(source))
+    assert bytes(anim.animations[0].name) == b'walk'
+    assert cache.stats() == {'hits': 0, 'rehashed': 0, 'misses': 2}
+
+
+def test_warm_and_prune(sources, cache):
+    (sources / 'other.txt').write_bytes(b'not an asset')
+    assert cache.warm(str(sources)) == 2
+    assert cache.misses == 2
+    assert cache.prune() == 0
+    os.remove(sources / 'build.bin')
+    assert cache.prune(str(sources.parent / 'elsewhere')) == 0
+    assert cache.prune(str(sources)) == 1
+    assert len(os.listdir(cache.directory)) == 1
+    cache.load(str(sources / 'anim.bin'))
+    assert cache.hits == 1
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from lib.bild_file import BILD
+from lib.util import Reader
+
+from . import fixtures
+
+SYMBOLS = {0x100: [(0, 3), (1, 6)], 0x200: [(0, 0)]}
+NAMES = {0x100: b'head', 0x200: b'body'}
+
+
+def read(**kwargs):
+    return BILD.read(Reader(fixtures.bild(SYMBOLS, NAMES)), **kwargs)
+
+
+def test_read():
+    b = read()
+    assert b.n_vertices == 9
+    assert [v.x for v in b.vertices] == list(range(9))
+    assert [s.hash for s in b.symbols] == list(SYMBOLS)
+
+
+def test_columnar():
+    pytest.importorskip('numpy')
+    b, ref = read(columnar=True), read()
+    assert b.vertices['x'].tolist() == [v.x for v in ref.vertices]
+    assert b.to_json() == ref.to_json()
+    vertex = json.loads(b.to_json())['vertices'][4]
+    assert vertex == {'x': 4.0, 'y': 0.0, 'z': 0.0, 'u': 0.0, 'v': 0.0,
+                      'w': 0.0}
+
+
+def test_columnar_zero_copy():
+    numpy = pytest.importorskip('numpy')
+    data = bytearray(fixtures.bild(SYMBOLS, NAMES))
+    b = BILD.read(Reader(memoryview(data)), columnar=True)
+    assert not b.vertices.flags.owndata
+    assert numpy.shares_memory(b.vertices, numpy.frombuffer(data, 'u1'))
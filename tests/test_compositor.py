@@ -0,0 +1,87 @@
+import numpy
+import pytest
+
+from lib.anim_file import ANIM
+from lib.bild_file import BILD
+from lib.compositor import Compositor
+from lib.util import Reader
+
+from . import fixtures
+
+HEAD, BODY, UNKNOWN = 0x100, 0x200, 0x300
+
+# Frames 0, 2 and 5 of HEAD, with 3, 6 and 9 vertices
+SYMBOLS = {
+    HEAD: [(0, 3), (2, 6), (5, 9)],
+    BODY: [(0, 12)],
+}
+
+
+def mat(tx, z=0.0):
+    return (1, 0, 0, 1, tx, 0, z)
+
+
+ANIMATIONS = {
+    b'idle': [
+        [(HEAD, 0, 1, mat(1)), (BODY, 0, 1, mat(2))],
+        [(BODY, 0, 1, mat(3)), (UNKNOWN, 0, 1, mat(4)), (HEAD, 3, 1, mat(5))],
+        [(HEAD, 7, 1, mat(6, 0.5))],
+        [],
+    ],
+    b'run': [
+        [(UNKNOWN, 0, 1, mat(7))],
+    ],
+}
+
+
+@pytest.fixture(params=[False, True], ids=['objects', 'columnar'])
+def compositor(request):
+    names = {HEAD: b'head', BODY: b'body'}
+    build = BILD.read(Reader(fixtures.bild(SYMBOLS, names)))
+    anim = ANIM.read(
+        Reader(fixtures.anim(ANIMATIONS, names)), columnar=request.param)
+    return Compositor(build, anim, max_animations=1)
+
+
+def summary(draws):
+    return [
+        (int(d['start']), int(d['count']), float(d['matrix'][0, 2]))
+        for d in draws
+    ]
+
+
+def test_compose(compositor):
+    idle = compositor.anim.animations[0]
+    frames = compositor.compose(idle)
+    assert len(frames) == 4
+    # HEAD frame 0, then BODY whose vertices follow all the HEAD frames
+    assert summary(frames[0]) == [(0, 3, 1.0), (18, 12, 2.0)]
+    # Unknown symbols are dropped, the order is kept and symbol frame 3
+    # uses build frame 2
+    assert summary(frames[1]) == [(18, 12, 3.0), (3, 6, 5.0)]
+    # Past the last build frame
+    assert summary(frames[2]) == [(9, 9, 6.0)]
+    assert float(frames[2][0]['z']) == 0.5
+    assert summary(frames[3]) == []
+
+
+def test_matrix(compositor):
+    draws = compositor.compose(compositor.anim.animations[0])[0]
+    assert draws['matrix'][0].tolist() == [[1, 0, 1], [0, 1, 0]]
+
+
+def test_unknown_only(compositor):
+    run = compositor.anim.animations[1]
+    assert [len(d) for d in compositor.compose(run)] == [0]
+
+
+def test_draw_lists_cache(compositor):
+    idle, run = compositor.anim.animations
+    first = compositor.draw_lists(idle)
+    assert compositor.draw_lists(idle) is first
+    assert (compositor.hits, compositor.misses) == (1, 1)
+    assert numpy.array_equal(compositor.draw_list(idle, 1), first[1])
+    # Evicted by the next animation, max_animations being 1
+    compositor.draw_lists(run)
+    assert compositor.draw_lists(idle) is not first
+    assert compositor.misses == 3
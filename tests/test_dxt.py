@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from lib import dxt  # noqa: E402
+
+
+def unpack565(c):
+    r, g, b = c >> 11 & 0x1f, c >> 5 & 0x3f, c & 0x1f
+    return [r << 3 | r >> 2, g << 2 | g >> 4, b << 3 | b >> 2]
+
+
+def colour_block(block, dxt1):
+    """
+    One pixel at a time decoding of the colour part of a block
+    """
+    c0, c1, indices = struct.unpack('<HHI', block)
+    a, b = unpack565(c0), unpack565(c1)
+    codes = [a + [255], b + [255]]
+    if dxt1 and c0 <= c1:
+        codes.append([(x + y) // 2 for x, y in zip(a, b)] + [255])
+        codes.append([0, 0, 0, 0])
+    else:
+        codes.append([(2 * x + y) // 3 for x, y in zip(a, b)] + [255])
+        codes.append([(x + 2 * y) // 3 for x, y in zip(a, b)] + [255])
+    return [list(codes[indices >> 2 * i & 3]) for i in range(16)]
+
+
+def alpha_dxt5(block):
+    a0, a1 = block[0], block[1]
+    if a0 > a1:
+        codes = [a0, a1] + [((7 - i) * a0 + i * a1) // 7 for i in range(1, 7)]
+    else:
+        codes = [a0, a1] + [((5 - i) * a0 + i * a1) // 5 for i in range(1, 5)]
+        codes += [0, 255]
+    bits = int.from_bytes(block[2:8], 'little')
+    return [codes[bits >> 3 * i & 7] for i in range(16)]
+
+
+def reference(data, width, height, flags):
+    size = 8 if flags == dxt.DXT1 else 16
+    bw, bh = (width + 3) // 4, (height + 3) // 4
+    out = numpy.zeros((bh * 4, bw * 4, 4), numpy.uint8)
+    for n in range(bw * bh):
+        block = data[n * size:(n + 1) * size]
+        pixels = colour_block(block[-8:], flags == dxt.DXT1)
+        if flags == dxt.DXT3:
+            bits = int.from_bytes(block[:8], 'little')
+            for i in range(16):
+                pixels[i][3] = (bits >> 4 * i & 0xf) * 0x11
+        elif flags == dxt.DXT5:
+            for i, a in enumerate(alpha_dxt5(block)):
+                pixels[i][3] = a
+        y, x = divmod(n, bw)
+        out[y * 4:y * 4 + 4, x * 4:x * 4 + 4] = \
+            numpy.array(pixels).reshape(4, 4, 4)
+    return out[:height, :width]
+
+
+FLAGS = {'dxt1': dxt.DXT1, 'dxt3': dxt.DXT3, 'dxt5': dxt.DXT5}
+
+
+@pytest.mark.parametrize('flags', FLAGS.values(), ids=FLAGS.keys())
+@pytest.mark.parametrize('width, height', [(8, 8), (12, 4), (6, 5)])
+def test_decompress(flags, width, height):
+    size = 8 if flags == dxt.DXT1 else 16
+    n = ((width + 3) // 4) * ((height + 3) // 4)
+    data = numpy.random.default_rng(flags).bytes(n * size)
+    image = dxt.decompress(memoryview(data), width, height, flags)
+    assert image.shape == (height, width, 4)
+    assert (image == reference(data, width, height, flags)).all()
+
+
+def test_dxt1_colours():
+    # Red and blue, then blue and red for the transparent mode
+    data = struct.pack('<HHI', 0xf800, 0x001f, 0b11100100) + \
+        struct.pack('<HHI', 0x001f, 0xf800, 0b11100100)
+    image = dxt.decompress(data, 8, 4, dxt.DXT1)
+    assert image[0, :4].tolist() == [
+        [255, 0, 0, 255], [0, 0, 255, 255], [170, 0, 85, 255],
+        [85, 0, 170, 255]]
+    assert image[0, 4:].tolist() == [
+        [0, 0, 255, 255], [255, 0, 0, 255], [127, 0, 127, 255],
+        [0, 0, 0, 0]]
+
+
+@pytest.mark.parametrize('flags', FLAGS.values(), ids=FLAGS.keys())
+def test_same_as_squish(flags):
+    squish = pytest.importorskip('squish')
+    data = numpy.random.default_rng(flags).bytes(4 * 16)
+    assert dxt.decompress_image(data, 8, 8, flags) == \
+        squish.decompressImage(data, 8, 8, flags)
@@ -0,0 +1,298 @@
+"""
+Parts of ui.gl_utils that run without a GL context
+"""
+
+import os
+
+import numpy
+import pytest
+
+glm = pytest.importorskip('glm')
+pytest.importorskip('glfw')
+pytest.importorskip('OpenGL.GL')
+
+from lib.anim_file import ANIM  # noqa: E402
+from lib.bild_file import BILD  # noqa: E402
+from lib.compositor import Compositor  # noqa: E402
+from lib.util import Reader  # noqa: E402
+from ui import gl_utils  # noqa: E402
+
+from . import fixtures  # noqa: E402
+from .test_compositor import ANIMATIONS, SYMBOLS, HEAD, BODY  # noqa: E402
+
+
+def test_mat4_array():
+    m = gl_utils.mat4_array(glm.translate(glm.mat4(1), glm.vec3(1, 2, 3)))
+    assert m.dtype == numpy.float32 and m.shape == (4, 4)
+    # Column-major: the translation is the last column
+    assert m[3].tolist() == [1, 2, 3, 1]
+    assert m[:3, :3].tolist() == numpy.eye(3).tolist()
+
+
+class Characters:
+    """
+    AnimationAsset without its GL objects
+    """
+    reserve = gl_utils.InstancedAsset.reserve
+    update = gl_utils.AnimationAsset.update
+
+    def __init__(self, compositor):
+        self.compositor = compositor
+        self.characters = []
+        self.instance_dtype = gl_utils.ANIMATION_INSTANCE_DTYPE
+        self.instance_data = numpy.zeros(1, dtype=self.instance_dtype)
+        self.n_instances = 0
+        self.dirty = False
+
+
+@pytest.fixture
+def characters():
+    names = {HEAD: b'head', BODY: b'body'}
+    build = BILD.read(Reader(fixtures.bild(SYMBOLS, names)))
+    anim = ANIM.read(Reader(fixtures.anim(ANIMATIONS, names)))
+    return Characters(Compositor(build, anim))
+
+
+def test_animation_frame():
+    animation = ANIM.read(
+        Reader(fixtures.anim(ANIMATIONS, {}))).animations[0]
+    character = gl_utils.AnimationInstance(animation, time=0.0)
+    frame_time = 1 / animation.frame_rate
+    assert character.frame() == 0
+    character.time = 1.5 * frame_time
+    assert character.frame() == 1
+    character.time = (animation.n_frames + 2.5) * frame_time
+    assert character.frame() == 2
+
+
+def test_animation_update(characters):
+    idle = characters.compositor.anim.animations[0]
+    moved = glm.translate(glm.mat4(1), glm.vec3(5, 0, 0))
+    characters.characters = [
+        gl_utils.AnimationInstance(idle),
+        gl_utils.AnimationInstance(idle, moved, 0.9 / idle.frame_rate),
+    ]
+    characters.update(0.2 / idle.frame_rate)
+    assert characters.dirty
+    # Frames 0 and 1, each with 2 elements drawn in reverse order
+    assert characters.n_instances == 4
+    data = characters.instance_data[:4]
+    assert data['range'].tolist() == [[18, 12], [0, 3], [3, 6], [18, 12]]
+    assert data['matrix'][:, 0, 2].tolist() == [2, 1, 5, 3]
+    assert (data['transform'][:2] == numpy.eye(4)).all()
+    assert (data['transform'][2:] == gl_utils.mat4_array(moved)).all()
+
+    characters.characters = []
+    characters.update(0.0)
+    assert characters.n_instances == 0
+
+
+class Res:
+    def __init__(self, res):
+        self._res = res
+
+    def res(self):
+        return self._res
+
+
+class GL:
+    """
+    Records the calls to the patched GL functions of ui.gl_utils, `results`
+    maps their names to return values, or to functions of their arguments
+    """
+    def __init__(self, monkeypatch):
+        self.calls = []
+        self.results = {}
+        self._monkeypatch = monkeypatch
+
+    def patch(self, *names):
+        for name in names:
+            self._monkeypatch.setattr(gl_utils, name, self._recorder(name))
+
+    def _recorder(self, name):
+        def call(*args):
+            self.calls.append((name,) + args)
+            result = self.results.get(name)
+            return result(*args) if callable(result) else result
+        return call
+
+    def count(self, name):
+        return sum(call[0] == name for call in self.calls)
+
+
+@pytest.fixture
+def gl(monkeypatch):
+    return GL(monkeypatch)
+
+
+PROGRAM_FUNCTIONS = (
+    'glCreateProgram', 'glAttachShader', 'glLinkProgram', 'glDetachShader',
+    'glGetProgramiv', 'glGetActiveUniform', 'glGetUniformLocation',
+    'glGetActiveAttrib', 'glGetAttribLocation', 'glGetUniformBlockIndex',
+    'glUniformBlockBinding', 'glDeleteProgram',
+)
+
+
+def program(gl, uniforms, attribs, blocks=()):
+    gl.patch(*PROGRAM_FUNCTIONS)
+    gl.results.update({
+        'glCreateProgram': 9,
+        'glGetProgramiv': lambda res, name: {
+            gl_utils.GL_LINK_STATUS: 1,
+            gl_utils.GL_ACTIVE_UNIFORMS: len(uniforms),
+            gl_utils.GL_ACTIVE_ATTRIBUTES: len(attribs),
+        }[name],
+        'glGetActiveUniform': lambda res, i: (uniforms[i].encode(), 1, 0),
+        'glGetUniformLocation': lambda res, name: 10 + list(
+            u.replace('[0]', '') for u in uniforms).index(name),
+        'glGetActiveAttrib': lambda res, i: (attribs[i].encode(), 1, 0),
+        'glGetAttribLocation': lambda res, name: attribs.index(name),
+        'glGetUniformBlockIndex': lambda res, name: list(blocks).index(name)
+            if name in blocks else gl_utils.GL_INVALID_INDEX,
+    })
+    return gl_utils.Program([Res(1), Res(2)])
+
+
+def test_program_locations(gl):
+    p = program(gl, ['transform', 'atlas[0]'], ['vertPos', 'vertColor'])
+    assert p.uniform('transform') == 10
+    assert p.uniform('atlas') == 11
+    assert p.uniform('transform') == 10
+    assert p.attrib('vertColor') == 1
+    assert p.has_uniform('atlas') and not p.has_uniform('view')
+    with pytest.raises(RuntimeError):
+        p.uniform('view')
+    with pytest.raises(RuntimeError):
+        p.attrib('vertUV')
+    # Queried once, when linking
+    assert gl.count('glGetUniformLocation') == 2
+    assert gl.count('glGetAttribLocation') == 2
+    del p
+    assert gl.count('glDeleteProgram') == 1
+
+
+class FakeAsset(gl_utils.Asset):
+    """
+    Asset without GL objects
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __del__(self):
+        pass
+
+
+def instance(program, texture, vao, transparent=False, before=None):
+    asset = FakeAsset(
+        shaders=Res(program), texture=Res(texture) if texture else None,
+        vao=vao, draw_type=1, before=before, after=None,
+        transparent=transparent)
+    return gl_utils.Instance(asset, glm.mat4(1))
+
+
+def test_draw_order():
+    scene = gl_utils.Scene()
+    a = instance(2, 1, 5)
+    b = instance(1, 2, 6)
+    glass = instance(1, 1, 1, transparent=True)
+    c = instance(1, 1, 7)
+    reset = instance(1, 0, 2, before=lambda: None)
+    d = instance(2, 0, 3)
+    e = instance(1, 0, 4)
+    scene.instances = [a, glass, b, c, reset, d, e]
+    order = scene.draw_order()
+    # Sorted by program, texture and VAO, transparent instances last, and
+    # nothing crosses the instance with a callback
+    assert order == [c, b, a, glass, reset, e, d]
+    assert scene.draw_order() is order
+    scene.instances.remove(b)
+    assert scene.draw_order() == [c, a, glass, reset, e, d]
+
+
+def test_camera_block_layout():
+    # std140: two column-major mat4, 64 bytes apart
+    assert gl_utils.CAMERA_DTYPE.itemsize == 128
+    assert gl_utils.CAMERA_DTYPE.fields['view'][1] == 64
+    for name in ('anim.vs', 'colors.vs'):
+        with open(os.path.join(os.path.dirname(gl_utils.__file__), name)) as fp:
+            source = fp.read()
+        assert 'layout(std140) uniform Camera {' in source
+        assert source.index('mat4 projection') < source.index('mat4 view')
+
+
+def test_program_binds_camera_block(gl):
+    p = program(gl, ['transform'], ['vertPos'], ['Lights', 'Camera'])
+    assert ('glUniformBlockBinding', 9, 1,
+        gl_utils.UNIFORM_BLOCKS['Camera']) in gl.calls
+    del p
+
+
+def test_uniform_buffer(gl):
+    gl.patch('glGenBuffers', 'glBindBuffer', 'glBufferData',
+        'glBindBufferBase', 'glBufferSubData', 'glDeleteBuffers')
+    gl.results['glGenBuffers'] = 4
+    buffer = gl_utils.UniformBuffer(gl_utils.CAMERA_DTYPE, 0)
+    assert ('glBindBufferBase', gl_utils.GL_UNIFORM_BUFFER, 0, 4) in gl.calls
+    view = glm.translate(glm.mat4(1), glm.vec3(1, 2, 3))
+    buffer.data[0]['view'] = gl_utils.mat4_array(view)
+    del gl.calls[:]
+    buffer.upload()
+    # One upload of the whole block, with the matrices in GL order
+    (upload,) = [c for c in gl.calls if c[0] == 'glBufferSubData']
+    assert upload[1:4] == (gl_utils.GL_UNIFORM_BUFFER, 0, 128)
+    assert bytes(upload[4][64:]) == gl_utils.mat4_array(view).tobytes()
+    del buffer
+    assert gl.count('glDeleteBuffers') == 1
+
+
+TEXTURE_FUNCTIONS = (
+    'glGenTextures', 'glBindTexture', 'glTexParameteri', 'glTexImage2D',
+    'glCompressedTexImage2D', 'glDeleteTextures',
+)
+
+
+def test_texture_from_tex(gl):
+    from lib.tex_file import read_file
+    from .test_tex_file import MIPMAPS
+    gl.patch(*TEXTURE_FUNCTIONS)
+    gl.results['glGenTextures'] = 3
+    texture = gl_utils.Texture.from_tex(
+        read_file(memoryview(fixtures.tex(MIPMAPS))))
+    # Every level uploaded compressed, as stored in the file
+    uploads = [c for c in gl.calls if c[0] == 'glCompressedTexImage2D']
+    assert [c[2:8] for c in uploads] == [
+        (0, gl_utils.GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, 8, 4, 0, 16),
+        (1, gl_utils.GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, 4, 2, 0, 8),
+    ]
+    assert bytes(uploads[1][8]) == MIPMAPS[1][2]
+    assert gl.count('glTexImage2D') == 0
+    assert ('glTexParameteri', gl_utils.GL_TEXTURE_2D,
+        gl_utils.GL_TEXTURE_MAX_LEVEL, 1) in gl.calls
+    assert ('glTexParameteri', gl_utils.GL_TEXTURE_2D,
+        gl_utils.GL_TEXTURE_MIN_FILTER, gl_utils.GL_LINEAR_MIPMAP_LINEAR) \
+        in gl.calls
+    del texture
+
+
+def test_texture_from_rgba_tex(gl):
+    from lib.tex_file import read_file
+    gl.patch(*TEXTURE_FUNCTIONS)
+    gl.results['glGenTextures'] = 3
+    pixels = bytes(range(2 * 2 * 4))
+    texture = gl_utils.Texture.from_tex(
+        read_file(memoryview(fixtures.tex([(2, 2, pixels)], 4))))
+    (upload,) = [c for c in gl.calls if c[0] == 'glTexImage2D']
+    assert upload[2:9] == (0, gl_utils.GL_RGBA, 2, 2, 0, gl_utils.GL_RGBA,
+        gl_utils.GL_UNSIGNED_BYTE)
+    assert bytes(upload[9]) == pixels
+    assert gl.count('glCompressedTexImage2D') == 0
+    del texture
+
+
+def test_texture_from_unknown_tex(gl):
+    from lib.tex_file import read_file
+    gl.patch(*TEXTURE_FUNCTIONS)
+    tex = read_file(memoryview(fixtures.tex([(1, 1, bytes(4))], 7)))
+    with pytest.raises(RuntimeError, match='Unsupported pixel format'):
+        gl_utils.Texture.from_tex(tex)
+    assert gl.count('glGenTextures') == 0
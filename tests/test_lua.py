@@ -0,0 +1,180 @@
+import io
+
+import pytest
+
+from lib import lua
+
+
+@pytest.mark.parametrize('value', [
+    'C:\\',
+    'a\\"b',
+    'say "hi"',
+    'line\nbreak',
+    'cr\rlf\r\n',
+    'nul\0',
+    'nul\x001',
+    '\\n is not a newline',
+])
+def test_string_round_trip(value):
+    data = lua.encode({'s': value})
+    assert lua.decode(data) == {'s': value}
+    assert lua.decode(lua.encode([value])) == [value]
+
+
+def test_decode_escapes():
+    assert lua.decode(rb'"a\tb\65\\\'\"c"') == 'a\tbA\\\'"c'
+    assert lua.decode(b'"a\\\nb"') == 'a\nb'
+
+
+def test_infinities():
+    data = lua.encode({'x': float('inf'), 'y': [float('-inf'), 1.5]})
+    assert data == b'{x=math.huge,y={-math.huge,1.5}}'
+    assert lua.decode(data) == {'x': float('inf'), 'y': [float('-inf'), 1.5]}
+    assert list(lua.events(data))[1:3] == \
+        [(lua.KEY, 'x'), (lua.VALUE, float('inf'))]
+
+
+def test_nan():
+    with pytest.raises(ValueError):
+        lua.encode({'x': float('nan')})
+
+
+@pytest.mark.parametrize('data', [
+    b'{"a","b",x=1}',
+    b'{x=1,"a","b"}',
+    b'{"a",x=1,"b",[7]=2}',
+    b'{[1]="a",[2]="b"}',
+    b'{[true]=1,[1.5]=3,["a b"]=4}',
+])
+def test_table_round_trip(data):
+    obj = lua.decode(data)
+    assert lua.encode(obj) == data
+    assert lua.decode(lua.encode(obj)) == obj
+
+
+def test_mixed_table():
+    assert lua.decode(b'{"a","b",x=1}') == {0: 'a', 1: 'b', 'x': 1}
+    assert lua.encode({0: 'a', 1: 'b', 'x': 1}) == b'{"a","b",x=1}'
+    assert lua.encode({'x': 1, 0: 'a'}, sort_keys=True) == b'{"a",x=1}'
+
+
+def test_dump_long_keys():
+    # Keys longer than a chunk must not be flushed ahead of their table
+    import io
+    obj = {'k' * 100 + ' ' + str(i): {'x': 'v' * 50} for i in range(50)}
+    obj[1e300] = 'big'
+    fp = io.BytesIO()
+    lua.Encoder().dump(obj, fp, chunk_size=16)
+    assert fp.getvalue() == lua.encode(obj)
+    assert lua.decode(fp.getvalue()) == obj
+
+
+@pytest.mark.parametrize('data, offset', [
+    (b'{a="unterminated}', 3),
+    (b'{a=1, "b}', 6),
+    (b"{a='x}", 3),
+])
+def test_decode_invalid(data, offset):
+    with pytest.raises(ValueError, match=f'at offset {offset}'):
+        lua.decode(data)
+
+
+def test_decode_whitespace():
+    assert lua.decode(b' {a=1,[2]=3,} \n') == {'a': 1, 2: 3}
+
+
+SAVE = b'''return {
+  map = { tiles = "AAAA", w = 4, scale = -3.5e2, ents = {} },
+  ents = { { x = 1, z = -0.25, skin = nil },
+    { x = 2, z = 1E3, data = { health = { health = 150 } } } },
+  [3] = true, [4] = false, ["a key"] = 'q',
+}'''
+
+SAVE_VALUE = {
+    'map': {'tiles': 'AAAA', 'w': 4, 'scale': -350.0, 'ents': {}},
+    'ents': [
+        {'x': 1, 'z': -0.25, 'skin': None},
+        {'x': 2, 'z': 1000.0, 'data': {'health': {'health': 150}}},
+    ],
+    3: True, 4: False, 'a key': 'q',
+}
+
+
+def test_parse_lua():
+    from lib.save_file import parse_lua
+    value = parse_lua(memoryview(SAVE))
+    assert value == SAVE_VALUE
+    assert type(value['map']['w']) is int
+    assert lua.decode(SAVE[len(b'return '):]) == SAVE_VALUE
+
+
+def rebuild(events):
+    """
+    Builds the value described by events(), with dicts only
+    """
+    stack, key, root = [], None, None
+    for event, value in events:
+        if event == lua.KEY:
+            key = value
+        elif event in (lua.VALUE, lua.START_TABLE):
+            if event == lua.START_TABLE:
+                value = {}
+            if stack:
+                stack[-1][key] = value
+            else:
+                root = value
+            if event == lua.START_TABLE:
+                stack.append(value)
+        else:
+            stack.pop()
+    return root
+
+
+def test_events():
+    assert list(lua.events(b'return {1,x={2},"a"}')) == [
+        (lua.START_TABLE, None),
+        (lua.KEY, 0), (lua.VALUE, 1),
+        (lua.KEY, 'x'), (lua.START_TABLE, None),
+        (lua.KEY, 0), (lua.VALUE, 2),
+        (lua.END_TABLE, None),
+        # Keyed items take a position too, as with slpp
+        (lua.KEY, 2), (lua.VALUE, 'a'),
+        (lua.END_TABLE, None),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [3, 1 << 16])
+def test_events_decode(chunk_size):
+    data = lua.synthetic_save(20)
+    expected = lua.decode(data[len(b'return '):])
+    rebuilt = rebuild(lua.events(io.BytesIO(data), chunk_size))
+    ents = rebuilt['map']['ents']
+    assert rebuilt['playerinfo'] == expected['playerinfo']
+    assert ents['prefab_7']['x'] == expected['map']['ents']['prefab_7']['x']
+    items = ents['prefab_3']['data']['inventory']['items']
+    assert list(items.values()) == \
+        expected['map']['ents']['prefab_3']['data']['inventory']['items']
+
+
+@pytest.mark.parametrize('path', [
+    ['map', 'w'],
+    ['map'],
+    ['ents', 1, 'data', 'health'],
+    ['ents', 0, 'skin'],
+    ['a key'],
+    [3],
+    [],
+])
+@pytest.mark.parametrize('chunk_size', [5, 1 << 16])
+def test_extract(path, chunk_size):
+    expected = SAVE_VALUE
+    for key in path:
+        expected = expected[key]
+    assert lua.extract(io.BytesIO(SAVE), path, chunk_size) == expected
+    assert lua.extract(SAVE, path) == expected
+
+
+@pytest.mark.parametrize('path', [['missing'], ['map', 'w', 'x'], ['ents', 2]])
+def test_extract_missing(path):
+    with pytest.raises(KeyError):
+        lua.extract(SAVE, path)
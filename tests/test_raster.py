@@ -0,0 +1,61 @@
+import numpy
+import pytest
+
+from lib.compositor import DRAW_DTYPE
+from lib.raster import Rasterizer
+
+
+class Build:
+    def __init__(self, points):
+        self.vertices = numpy.zeros(len(points), dtype=[
+            (f, '<f4') for f in ('x', 'y', 'z', 'u', 'v', 'w')
+        ])
+        self.vertices['x'] = [p[0] for p in points]
+        self.vertices['y'] = [p[1] for p in points]
+
+
+def quad(size, clockwise=True):
+    a, b, c, d = (0, 0), (size, 0), (size, size), (0, size)
+    if clockwise:
+        return Build([a, b, c, c, d, a])
+    return Build([a, c, b, c, a, d])
+
+
+def draw_list(count):
+    draws = numpy.zeros(1, dtype=DRAW_DTYPE)
+    draws['count'] = count
+    draws['matrix'] = [[1, 0, 0], [0, 1, 0]]
+    return draws
+
+
+@pytest.mark.parametrize('clockwise', [True, False])
+def test_shared_edges(clockwise):
+    # The diagonal of the quad is drawn once, not blended twice
+    atlas = numpy.array([[[100, 50, 0, 128]]], dtype=numpy.uint8)
+    rasterizer = Rasterizer(quad(4, clockwise), [atlas], premultiplied=False)
+    image = rasterizer.render(draw_list(6), (0, 0, 4, 4))
+    assert (image[..., 3] == 128).all()
+    assert (image[..., :3] == [100, 50, 0]).all()
+
+
+def test_premultiplied_atlas():
+    # Output colours are straight: the atlas colour divided by alpha
+    atlas = numpy.array([[[100, 50, 0, 128]]], dtype=numpy.uint8)
+    image = Rasterizer(quad(4), [atlas]).render(draw_list(6), (0, 0, 4, 4))
+    assert (image[..., 3] == 128).all()
+    assert (image[..., :3] == [199, 100, 0]).all()
+
+
+def test_premultiplied_over():
+    # Half transparent black over opaque white gives half grey
+    white = numpy.array([[[255, 255, 255, 255]]], dtype=numpy.uint8)
+    black = numpy.array([[[0, 0, 0, 128]]], dtype=numpy.uint8)
+    build = quad(4)
+    build.vertices = numpy.concatenate([build.vertices, build.vertices])
+    build.vertices['w'][6:] = 1
+    draws = numpy.concatenate([draw_list(6), draw_list(6)])
+    # The first element is on top
+    draws['start'] = [6, 0]
+    image = Rasterizer(build, [white, black]).render(draws, (0, 0, 4, 4))
+    assert (image[..., 3] == 255).all()
+    assert (image[..., :3] == 127).all()
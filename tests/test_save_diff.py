@@ -0,0 +1,26 @@
+from lib.save_diff import apply, diff
+
+
+def test_equal_python_hashes():
+    # hash(-1) == hash(-2) and hash(2**61) == hash(1)
+    assert diff({'x': -1}, {'x': -2}) == [['set', ['x'], -2]]
+    assert diff({'x': 2**61}, {'x': 1}) == [['set', ['x'], 1]]
+    assert diff([-1], [-2]) == [['set', [0], -2]]
+    assert diff({'t': {'x': -1}}, {'t': {'x': -2}}) == \
+        [['set', ['t', 'x'], -2]]
+
+
+def test_typed_scalars():
+    assert diff({'x': 1}, {'x': 1.0}) == [['set', ['x'], 1.0]]
+    assert diff({'x': 1}, {'x': True}) == [['set', ['x'], True]]
+
+
+def test_key_order():
+    assert diff({'a': 1, 'b': {'c': 2}}, {'b': {'c': 2}, 'a': 1}) == []
+
+
+def test_apply():
+    a = {'x': -1, 'l': [1, 2, 3], 'gone': {'y': 1}}
+    b = {'x': -2, 'l': [1, 5], 'new': {'z': [1]}}
+    delta = diff(a, b)
+    assert apply(a, delta) == b
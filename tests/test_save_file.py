@@ -0,0 +1,80 @@
+import io
+import zlib
+
+import pytest
+
+from lib.save_file import (
+    ParallelCompressor, SaveReader, SaveWriter, deflate, load, read_file, save,
+    write_file
+)
+
+DATA = b''.join(b'%d: {x=%d, y="abc"},' % (i, i * i) for i in range(20000))
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+@pytest.mark.parametrize('level', [0, 1, 9])
+def test_deflate(jobs, level):
+    assert zlib.decompress(deflate(DATA, level, jobs=jobs)) == DATA
+
+
+@pytest.mark.parametrize('block_size', [1000, 1 << 16])
+def test_parallel_flush(block_size):
+    with ParallelCompressor(jobs=3, block_size=block_size) as c:
+        out = c.compress(DATA[:5000])
+        out += c.flush(zlib.Z_SYNC_FLUSH)
+        # Everything given so far can be decompressed
+        assert zlib.decompressobj().decompress(out) == DATA[:5000]
+        out += c.compress(DATA[5000:9000])
+        out += c.flush(zlib.Z_FULL_FLUSH)
+        out += c.flush(zlib.Z_NO_FLUSH)
+        out += c.compress(DATA[9000:])
+        out += c.flush()
+    assert zlib.decompress(out) == DATA
+
+
+def test_parallel_close():
+    c = ParallelCompressor(jobs=2, block_size=1000)
+    c.compress(DATA)
+    c.close()
+    with pytest.raises(RuntimeError):
+        c.compress(DATA)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('encoded', [False, True])
+def test_write_file(encoded, jobs):
+    assert read_file(write_file(DATA, encoded, jobs=jobs)) == DATA
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+@pytest.mark.parametrize('chunk_size', [1001, 1 << 16])
+def test_save_reader(encoded, chunk_size):
+    reader = SaveReader(io.BytesIO(write_file(DATA, encoded)), chunk_size)
+    out = b''
+    while True:
+        chunk = reader.read(1000)
+        if not chunk:
+            break
+        assert len(chunk) <= 1000
+        out += chunk
+    assert out == DATA
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_save_writer(encoded, jobs):
+    fp = io.BytesIO()
+    with SaveWriter(fp, encoded, spool_size=1000, jobs=jobs) as writer:
+        for i in range(0, len(DATA), 999):
+            writer.write(DATA[i:i + 999])
+    assert read_file(fp.getvalue()) == DATA
+    if not encoded:
+        assert fp.getvalue() == write_file(DATA)
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_save_load(tmp_path, encoded):
+    obj = {'a': [1, 2.5, 'x'], 'b': {'c': True}}
+    path = str(tmp_path / 'save')
+    save(path, obj, encoded)
+    assert load(path) == obj
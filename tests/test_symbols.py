@@ -0,0 +1,41 @@
+from lib import symbols
+from lib.anim_file import ANIM
+from lib.bild_file import BILD
+from lib.symbols import SymbolTable, string_hash
+from lib.util import Reader
+
+from . import fixtures
+
+
+def test_string_hash():
+    assert string_hash('') == 0
+    assert string_hash('a') == 97
+    assert string_hash('ab') == 98 + (97 << 6) + (97 << 16) - 97
+    assert string_hash('Idle_Loop') == string_hash(b'idle_loop') == \
+        string_hash(memoryview(b'IDLE_LOOP'))
+    assert 0 <= string_hash('x' * 100) < 1 << 32
+
+
+def test_symbol_table():
+    table = SymbolTable()
+    h = table.add_name('Head')
+    assert h == string_hash('head')
+    assert h in table and len(table) == 1
+    assert table.name(h) == b'Head'
+    # The first name wins
+    assert table.add(h, memoryview(b'HEAD')) == b'Head'
+    assert table.hash('HEAD') == h
+    assert table.hash('body') is None
+    assert table.name(string_hash('body')) is None
+
+
+def test_files_fill_the_table():
+    head, arm = string_hash('test_head'), string_hash('test_arm')
+    anim_names = {head: b'test_head'}
+    bild_names = {arm: b'test_arm'}
+    ANIM.read(Reader(fixtures.anim({b'idle': [[]]}, anim_names)))
+    BILD.read(Reader(fixtures.bild({arm: [(0, 0)]}, bild_names)))
+    # Names from either file resolve hashes used by the other one
+    assert symbols.table.name(head) == b'test_head'
+    assert symbols.table.name(arm) == b'test_arm'
+    assert isinstance(symbols.table.name(arm), bytes)
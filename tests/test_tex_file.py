@@ -0,0 +1,96 @@
+import os
+
+from lib.tex_file import find_files
+
+
+def test_find_files_glob_keeps_directories(tmp_path):
+    for d in ('a', 'b'):
+        os.makedirs(tmp_path / 'anim' / d)
+        (tmp_path / 'anim' / d / 'atlas-0.tex').write_bytes(b'')
+    expected = [os.path.join('a', 'atlas-0.tex'), os.path.join('b', 'atlas-0.tex')]
+    pattern = os.path.join(str(tmp_path), 'anim', '**', 'atlas-0.tex')
+    assert [rel for _, rel in find_files(pattern)] == expected
+    assert [rel for _, rel in find_files(str(tmp_path / 'anim'))] == expected
+    single = str(tmp_path / 'anim' / 'a' / 'atlas-0.tex')
+    assert find_files(single) == [(single, 'atlas-0.tex')]
+
+
+def test_enable_cache(tmp_path):
+    from lib import tex_file
+    try:
+        cache = tex_file.enable_cache(1 << 10, str(tmp_path))
+        assert tex_file.cache is cache
+        assert cache.max_bytes == 1 << 10
+        assert cache.directory == str(tmp_path)
+    finally:
+        tex_file.disable_cache()
+    assert tex_file.cache is None
+
+
+def test_decoders(monkeypatch):
+    import pytest
+    from lib import tex_file
+    tex = tex_file.TexFile()
+    with pytest.raises(ValueError, match='Unknown DXT decoder'):
+        tex_file.decompress(tex, 0, 'bogus')
+    monkeypatch.setattr(tex_file, 'DECODERS', [])
+    with pytest.raises(RuntimeError, match='squish or numpy'):
+        tex_file.decompress(tex, 0)
+    with pytest.raises(RuntimeError, match='numpy is required'):
+        tex_file.decompress(tex, 0, 'numpy')
+
+
+def test_extract_batch_empty(tmp_path, capsys):
+    from lib.tex_file import extract_batch
+    extract_batch(str(tmp_path / '*.tex'), str(tmp_path / 'out'), jobs=1)
+    assert 'file(s)' not in capsys.readouterr().out
+
+
+# Red then blue 4x4 DXT1 blocks
+MIPMAPS = [
+    (8, 4, bytes.fromhex('00f81f0000000000 1f00f80000000000')),
+    (4, 2, bytes.fromhex('1f00f80055555555')),
+]
+
+
+def test_read_header_file(tmp_path):
+    from lib.tex_file import PixelFormat, read_file, read_header_file
+    from . import fixtures
+    data = fixtures.tex(MIPMAPS)
+    path = tmp_path / 'atlas-0.tex'
+    path.write_bytes(data)
+    header = read_header_file(str(path))
+    tex = read_file(memoryview(data))
+    assert header.pixel_format == tex.pixel_format == PixelFormat.DXT1
+    assert header.mips == tex.mips == 2
+    assert [(m.width, m.height, m.size) for m in header.mipmaps] == \
+        [(m.width, m.height, m.size) for m in tex.mipmaps] == \
+        [(8, 4, 16), (4, 2, 8)]
+    assert all(m.data is None for m in header.mipmaps)
+    assert bytes(tex.mipmaps[1].data) == MIPMAPS[1][2]
+
+
+def test_catalog(tmp_path):
+    from lib.tex_file import catalog
+    from . import fixtures
+    os.makedirs(tmp_path / 'a')
+    (tmp_path / 'a' / 'atlas-0.tex').write_bytes(fixtures.tex(MIPMAPS))
+    (tmp_path / 'b.tex').write_bytes(fixtures.tex(MIPMAPS[1:], 2))
+    rows = sorted(catalog(str(tmp_path)), key=lambda r: r['path'])
+    assert [(r['path'], r['pixel_format'], r['width'], r['height'],
+             r['data_size']) for r in rows] == [
+        (os.path.join('a', 'atlas-0.tex'), 'DXT1', 8, 4, 24),
+        ('b.tex', 'DXT5', 4, 2, 8),
+    ]
+
+
+def test_decompress_numpy():
+    import pytest
+    pytest.importorskip('numpy')
+    from lib.tex_file import decompress, read_file
+    from . import fixtures
+    tex = read_file(memoryview(fixtures.tex(MIPMAPS)))
+    pixels = bytes(decompress(tex, 0, 'numpy'))
+    assert len(pixels) == 8 * 4 * 4
+    assert pixels[:4] == bytes([255, 0, 0, 255])
+    assert pixels[16:20] == bytes([0, 0, 255, 255])
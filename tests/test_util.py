@@ -0,0 +1,112 @@
+import io
+import json
+import struct
+
+import pytest
+
+from lib.util import Printable, Reader, Struct, fields, map_file
+
+
+RECORD = struct.pack('<IHf', 7, 3, 0.5) + struct.pack('<I', 3) + b'abc' + \
+    struct.pack('<2I3f', 1, 2, 1.5, 2.5, 3.5)
+
+
+@pytest.mark.parametrize('wrap', [bytes, memoryview])
+def test_reader(wrap):
+    r = Reader(wrap(RECORD))
+    assert (r.read_uint32(), r.read_uint16(), r.read_float()) == (7, 3, 0.5)
+    assert bytes(r.read_string()) == b'abc'
+    assert r.read_record('2I') == (1, 2)
+    assert r.read_float_array(3) == (1.5, 2.5, 3.5)
+    assert r.offset == len(RECORD)
+
+
+def test_reader_records():
+    r = Reader(RECORD)
+    assert r.read_record('IHf') == (7, 3, 0.5)
+    r.offset = len(RECORD) - 20
+    assert r.read_uint32_array(2) == (1, 2)
+    assert r.read_record('3f') == (1.5, 2.5, 3.5)
+    with pytest.raises(struct.error):
+        r.read_uint32()
+
+
+def test_map_file(tmp_path):
+    path = tmp_path / 'record'
+    path.write_bytes(RECORD)
+    data = map_file(str(path))
+    assert data.readonly and bytes(data) == RECORD
+    r = Reader(data)
+    r.offset = 10
+    name = r.read_string()
+    assert isinstance(name, memoryview) and name.obj is data.obj
+    assert bytes(name) == b'abc'
+
+
+def test_map_empty_file(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'')
+    assert bytes(map_file(str(path))) == b''
+
+
+class Node(Printable):
+    def __init__(self, depth):
+        self.name = memoryview(b'node')
+        self.values = [1, 2.5, None, 'x']
+        self.children = [Node(depth - 1) for _ in range(3)] if depth else []
+
+    def json_value(self):
+        return self.__dict__
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'indent': 4}, {'stream': True}, {'stream': False, 'indent': 2},
+])
+def test_dump_json(kwargs):
+    node = Node(4)
+    fp = io.StringIO()
+    node.dump_json(fp, chunk_size=100, **kwargs)
+    kwargs.pop('stream', None)
+    assert fp.getvalue() == node.to_json(**kwargs)
+    assert json.loads(fp.getvalue())['name'] == 'node'
+
+
+def record_classes():
+    from lib import anim_file, bild_file, ksh_file, symbols, tex_file
+    for module in (anim_file, bild_file, ksh_file, symbols, tex_file):
+        for cls in vars(module).values():
+            if isinstance(cls, type) and cls.__module__ == module.__name__ \
+                    and '__slots__' in cls.__dict__:
+                yield cls
+
+
+@pytest.mark.parametrize('cls', list(record_classes()),
+    ids=lambda c: f'{c.__module__}.{c.__qualname__}')
+def test_slots(cls):
+    o = cls()
+    assert not hasattr(o, '__dict__')
+    assert list(fields(o)) == list(cls.__slots__)
+    with pytest.raises(AttributeError):
+        o.not_a_field = 1
+
+
+class Point(Struct):
+    __slots__ = ('x', 'y')
+
+    def __init__(self):
+        self.x = 1
+        self.y = 2
+
+
+class Point3(Point):
+    def __init__(self):
+        super().__init__()
+        self.z = 3
+
+
+def test_fields():
+    assert fields(Point()) == {'x': 1, 'y': 2}
+    # Slots of the base class, then the dict
+    assert fields(Point3()) == {'x': 1, 'y': 2, 'z': 3}
+    assert json.loads(Point3().to_json()) == {'x': 1, 'y': 2, 'z': 3}
+    assert repr(Point3()) == "{'x': 1, 'y': 2, 'z': 3}"
@@ -0,0 +1,42 @@
+#version 330 core
+
+// Shared by all programs, updated once per frame
+layout(std140) uniform Camera {
+    mat4 projection; // P
+    mat4 view; // V
+};
+uniform mat4 transform; // Whole asset
+uniform float unitScale; // World units per build pixel
+uniform samplerBuffer vertices; // (x, y, z, u), (v, w, 0, 0) per vertex
+
+// Per instance (one per element)
+in mat4 instanceTransform;
+in mat2x3 elementMatrix;
+in uvec2 elementRange; // First vertex, vertex count
+
+out vec2 fragUV;
+flat out int fragAtlas;
+
+void main()
+{
+    if (uint(gl_VertexID) >= elementRange.y) {
+        // Outside of the clip volume, the whole triangle is culled
+        gl_Position = vec4(2, 2, 2, 1);
+        fragUV = vec2(0);
+        fragAtlas = 0;
+        return;
+    }
+
+    int i = 2 * (int(elementRange.x) + gl_VertexID);
+    vec4 a = texelFetch(vertices, i);
+    vec4 b = texelFetch(vertices, i + 1);
+
+    vec3 p = vec3(a.xy, 1);
+    vec2 pos = vec2(dot(elementMatrix[0], p), dot(elementMatrix[1], p));
+
+    // Build pixels have y down
+    gl_Position = projection * view * transform * instanceTransform *
+        vec4(pos.x * unitScale, -pos.y * unitScale, 0, 1);
+    fragUV = vec2(a.w, b.x);
+    fragAtlas = int(b.y + 0.5);
+}
@@ -1,7 +1,10 @@
 #version 330 core
 
-uniform mat4 projection; // P
-uniform mat4 view; // V
+// Shared by all programs, updated once per frame
+layout(std140) uniform Camera {
+    mat4 projection; // P
+    mat4 view; // V
+};
 uniform mat4 transform; // ?
 
 in vec3 vertPos;
@@ -1,7 +1,11 @@
+from ctypes import c_void_p
 import glfw
 import glm
 import numpy
 from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import \
+    GL_COMPRESSED_RGBA_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, \
+    GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
 from OpenGL.GLU import *
 import PIL.Image
 
@@ -41,6 +45,18 @@ class Shader:
         return Shader(data, shader_type)
 
 
+# Uniform blocks bound by every Program to their binding point
+UNIFORM_BLOCKS = {
+    'Camera': 0,
+}
+
+# std140 layout of the Camera block
+CAMERA_DTYPE = numpy.dtype([
+    ('projection', '<f4', (4, 4)),
+    ('view', '<f4', (4, 4)),
+])
+
+
 class Program:
     def __init__(self, shaders):
         self.enabled = False
@@ -66,6 +82,28 @@ class Program:
             self.__del__()
             raise RuntimeError(msg)
 
+        # Locations of the active variables, queried once
+        self._uniforms = {}
+        for i in range(glGetProgramiv(self._res, GL_ACTIVE_UNIFORMS)):
+            name = self._active_name(glGetActiveUniform(self._res, i)[0])
+            self._uniforms[name] = glGetUniformLocation(self._res, name)
+        self._attribs = {}
+        for i in range(glGetProgramiv(self._res, GL_ACTIVE_ATTRIBUTES)):
+            name = self._active_name(glGetActiveAttrib(self._res, i)[0])
+            self._attribs[name] = glGetAttribLocation(self._res, name)
+
+        for name, binding in UNIFORM_BLOCKS.items():
+            index = glGetUniformBlockIndex(self._res, name)
+            if index != GL_INVALID_INDEX:
+                glUniformBlockBinding(self._res, index, binding)
+
+    @staticmethod
+    def _active_name(name):
+        # Arrays are listed as `name[0]`
+        if isinstance(name, bytes):
+            name = name.decode()
+        return name[:-3] if name.endswith('[0]') else name
+
     def __del__(self):
         if self._res:
             if glDeleteProgram:
@@ -76,17 +114,20 @@ class Program:
         return self._res
 
     def attrib(self, name):
-        pos = glGetAttribLocation(self._res, name)
+        pos = self._attribs.get(name, -1)
         if pos == -1:
             raise RuntimeError(f'glGetAttribLocation({name})')
         return pos
 
     def uniform(self, name):
-        pos = glGetUniformLocation(self._res, name)
+        pos = self._uniforms.get(name, -1)
         if pos == -1:
             raise RuntimeError(f'glGetUniformLocation({name})')
         return pos
 
+    def has_uniform(self, name):
+        return self._uniforms.get(name, -1) != -1
+
     def __enter__(self):
         assert not self.enabled
         self.enabled = True
@@ -99,6 +140,48 @@ class Program:
         glUseProgram(0)
 
 
+class UniformBuffer:
+    """
+    Buffer backing a uniform block of `dtype` (laid out as std140) for all
+    programs, bound to `binding`
+    """
+    def __init__(self, dtype, binding):
+        self.data = numpy.zeros(1, dtype=dtype)
+        self.binding = binding
+        self._res = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._res)
+        glBufferData(
+            GL_UNIFORM_BUFFER,
+            self.data.nbytes,
+            None,
+            GL_DYNAMIC_DRAW
+        )
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self._res)
+
+    def __del__(self):
+        if self._res:
+            if glDeleteBuffers:
+                glDeleteBuffers(1, numpy.array([self._res]))
+            self._res = 0
+
+    def res(self):
+        return self._res
+
+    def upload(self):
+        """
+        Uploads `data` with a single glBufferSubData
+        """
+        glBindBuffer(GL_UNIFORM_BUFFER, self._res)
+        glBufferSubData(
+            GL_UNIFORM_BUFFER,
+            0,
+            self.data.nbytes,
+            self.data.view(numpy.uint8)
+        )
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
 class Asset:
     def __init__(self):
         self.shaders = None
@@ -110,6 +193,9 @@ class Asset:
         self.draw_count = 0
         self.before = None
         self.after = None
+        # Blended assets are drawn after the opaque ones of their pass, in
+        # the order they were added to the scene
+        self.transparent = False
 
         self.vao = glGenVertexArrays(1)
         self.vbo = glGenBuffers(1)
@@ -129,6 +215,287 @@ class Asset:
         glBindVertexArray(0)
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
+    def buffer_data(self, data, usage=GL_STATIC_DRAW):
+        """
+        Uploads a numpy array (plain or structured, e.g. BILD vertices in
+        columnar mode) to the VBO as-is. Must be called while bound.
+        """
+        glBufferData(
+            GL_ARRAY_BUFFER,
+            data.nbytes,
+            data.view(numpy.uint8),
+            usage
+        )
+
+    def draw(self):
+        """
+        Draws the asset, called while bound
+        """
+        glDrawArrays(self.draw_type, self.draw_start, self.draw_count)
+
+    def attrib_pointer(self, index, dtype, fields):
+        """
+        Points a float attribute to consecutive `fields` of a structured
+        dtype, e.g. attrib_pointer(pos, VERTEX_DTYPE, ('u', 'v'))
+        """
+        glEnableVertexAttribArray(index)
+        glVertexAttribPointer(
+            index=index,
+            size=len(fields),
+            type=GL_FLOAT,
+            normalized=GL_FALSE,
+            stride=dtype.itemsize,
+            pointer=c_void_p(dtype.fields[fields[0]][1])
+        )
+
+
+class InstancedAsset(Asset):
+    """
+    Asset drawn `n_instances` times in a single glDrawArraysInstanced call.
+    Per-instance attributes are read from `instance_data`, a structured array
+    of `instance_dtype` uploaded with a single glBufferSubData when dirty.
+    """
+    def __init__(self, instance_dtype, max_instances=256):
+        super().__init__()
+        self.instance_dtype = instance_dtype
+        self.instance_data = numpy.zeros(max_instances, dtype=instance_dtype)
+        self.n_instances = 0
+        self.dirty = False
+        self._capacity = 0
+        self.instance_vbo = glGenBuffers(1)
+
+    def __del__(self):
+        super().__del__()
+        if glDeleteBuffers:
+            glDeleteBuffers(1, numpy.array([self.instance_vbo]))
+
+    def reserve(self, n):
+        """
+        Grows instance_data to hold at least `n` instances
+        """
+        if n > len(self.instance_data):
+            data = numpy.zeros(
+                max(n, 2 * len(self.instance_data)),
+                dtype=self.instance_dtype
+            )
+            data[:self.n_instances] = self.instance_data[:self.n_instances]
+            self.instance_data = data
+
+    def instance_attrib_pointer(self, index, field):
+        """
+        Points attributes starting at `index` to a field of instance_dtype,
+        with one location per row of 2D fields (e.g. a mat4 takes four).
+        Unsigned fields are integer attributes. Must be called while bound.
+        """
+        subdtype, offset = self.instance_dtype.fields[field][:2]
+        shape = subdtype.shape or (1,)
+        rows, size = (shape[0], shape[1]) if len(shape) == 2 else (1, shape[0])
+        row_size = size * subdtype.base.itemsize
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        for row in range(rows):
+            glEnableVertexAttribArray(index + row)
+            pointer = c_void_p(offset + row * row_size)
+            if subdtype.base.kind in 'ui':
+                glVertexAttribIPointer(
+                    index + row,
+                    size,
+                    GL_UNSIGNED_INT if subdtype.base.kind == 'u' else GL_INT,
+                    self.instance_dtype.itemsize,
+                    pointer
+                )
+            else:
+                glVertexAttribPointer(
+                    index=index + row,
+                    size=size,
+                    type=GL_FLOAT,
+                    normalized=GL_FALSE,
+                    stride=self.instance_dtype.itemsize,
+                    pointer=pointer
+                )
+            glVertexAttribDivisor(index + row, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+
+    def upload_instances(self):
+        """
+        Uploads the live part of instance_data, called while bound
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        if self._capacity < len(self.instance_data):
+            self._capacity = len(self.instance_data)
+            glBufferData(
+                GL_ARRAY_BUFFER,
+                self.instance_data.nbytes,
+                None,
+                GL_DYNAMIC_DRAW
+            )
+        if self.n_instances:
+            glBufferSubData(
+                GL_ARRAY_BUFFER,
+                0,
+                self.n_instances * self.instance_dtype.itemsize,
+                self.instance_data[:self.n_instances].view(numpy.uint8)
+            )
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self.dirty = False
+
+    def draw(self):
+        if self.dirty or not self._capacity:
+            self.upload_instances()
+        if self.n_instances:
+            glDrawArraysInstanced(
+                self.draw_type,
+                self.draw_start,
+                self.draw_count,
+                self.n_instances
+            )
+
+
+def mat4_array(m):
+    """
+    glm matrix as a column-major (4, 4) float32 array, ready for upload
+    """
+    return numpy.float32(tuple(tuple(x) for x in m))
+
+
+# Per-element instance of AnimationAsset: the character transform, the
+# element matrix ((a, c, tx), (b, d, ty)) and the element vertex range
+ANIMATION_INSTANCE_DTYPE = numpy.dtype([
+    ('transform', '<f4', (4, 4)),
+    ('matrix', '<f4', (2, 3)),
+    ('range', '<u4', (2,)),
+])
+
+
+class AnimationInstance:
+    """
+    Character playing an animation of an AnimationAsset
+    """
+    def __init__(self, animation, transform=None, time=0.0):
+        self.animation = animation
+        self.transform = transform if transform else glm.mat4(1)
+        self.time = time
+
+    def frame(self):
+        n_frames = max(self.animation.n_frames, 1)
+        return int(self.time * self.animation.frame_rate) % n_frames
+
+
+class AnimationAsset(InstancedAsset):
+    """
+    Draws every element of every character in `characters` as one instance.
+    Build vertices are fetched from a texture buffer by the vertex shader,
+    so all elements share one draw call whatever their vertex range. Units
+    are build pixels scaled by `unit_scale`, with y up.
+    """
+    MAX_ATLASES = 4
+
+    def __init__(
+        self, compositor, textures, unit_scale=1.0 / 128, max_instances=4096
+    ):
+        super().__init__(ANIMATION_INSTANCE_DTYPE, max_instances)
+        assert len(textures) <= self.MAX_ATLASES
+        self.transparent = True
+        self.compositor = compositor
+        self.textures = textures
+        self.characters = []
+
+        self.shaders = Program([
+            Shader.load_file('ui/anim.vs', GL_VERTEX_SHADER),
+            Shader.load_file('ui/anim.ps', GL_FRAGMENT_SHADER),
+        ])
+
+        # Two RGBA32F texels per vertex: (x, y, z, u), (v, w, 0, 0)
+        build = compositor.build
+        if isinstance(build.vertices, numpy.ndarray):
+            vertices = build.vertices.view(numpy.float32).reshape(-1, 6)
+        else:
+            vertices = numpy.float32([
+                (v.x, v.y, v.z, v.u, v.v, v.w) for v in build.vertices
+            ]).reshape(-1, 6)
+        texels = numpy.zeros((len(vertices), 8), dtype=numpy.float32)
+        texels[:, :6] = vertices
+        self.vertex_buffer = glGenBuffers(1)
+        glBindBuffer(GL_TEXTURE_BUFFER, self.vertex_buffer)
+        glBufferData(GL_TEXTURE_BUFFER, texels.nbytes, texels, GL_STATIC_DRAW)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+        self.vertex_texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_BUFFER, self.vertex_texture)
+        glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32F, self.vertex_buffer)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+        with self.shaders:
+            glUniform1i(self.shaders.uniform('vertices'), 0)
+            for i in range(self.MAX_ATLASES):
+                glUniform1i(self.shaders.uniform(f'atlas{i}'), i + 1)
+            glUniform1f(self.shaders.uniform('unitScale'), unit_scale)
+
+        with self:
+            self.instance_attrib_pointer(
+                self.shaders.attrib('instanceTransform'), 'transform')
+            self.instance_attrib_pointer(
+                self.shaders.attrib('elementMatrix'), 'matrix')
+            self.instance_attrib_pointer(
+                self.shaders.attrib('elementRange'), 'range')
+
+        # Extra vertices of elements smaller than the largest are culled
+        # by the vertex shader
+        self.draw_type = GL_TRIANGLES
+        self.draw_count = max(
+            (f.n_alpha for sym in build.symbols for f in sym.frames),
+            default=0
+        )
+
+    def __del__(self):
+        super().__del__()
+        if glDeleteTextures:
+            glDeleteTextures(self.vertex_texture)
+        if glDeleteBuffers:
+            glDeleteBuffers(1, numpy.array([self.vertex_buffer]))
+
+    def update(self, elapsed):
+        """
+        Advances the characters and rebuilds instance_data
+        """
+        draws = []
+        transforms = []
+        for character in self.characters:
+            character.time += elapsed
+            # First element on top: draw it last
+            draws.append(self.compositor.draw_list(
+                character.animation, character.frame())[::-1])
+            transforms.append(mat4_array(character.transform))
+        counts = [len(d) for d in draws]
+        n = sum(counts)
+        self.reserve(n)
+        self.n_instances = n
+        self.dirty = True
+        if not n:
+            return
+
+        draws = numpy.concatenate(draws)
+        data = self.instance_data[:n]
+        data['transform'] = numpy.repeat(
+            numpy.array(transforms), counts, axis=0)
+        data['matrix'] = draws['matrix']
+        data['range'][:, 0] = draws['start']
+        data['range'][:, 1] = draws['count']
+
+    def draw(self):
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_BUFFER, self.vertex_texture)
+        for i, texture in enumerate(self.textures):
+            glActiveTexture(GL_TEXTURE1 + i)
+            glBindTexture(GL_TEXTURE_2D, texture.res())
+        # Elements are sorted back to front, they must not hide each other.
+        # Atlas colours are premultiplied by alpha (see lib.raster).
+        glDepthMask(GL_FALSE)
+        glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+        super().draw()
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glDepthMask(GL_TRUE)
+        glActiveTexture(GL_TEXTURE0)
+
 
 class Instance:
     def __init__(self, asset, transform=None):
@@ -150,6 +517,9 @@ class Scene:
         self.screen_x = 800
         self.screen_y = 600
         self.instances = []
+        self.camera_buffer = None
+        self._draw_order = []
+        self._draw_order_of = []
 
     def main(self):
         glfw.set_error_callback(error_callback)
@@ -189,6 +559,10 @@ class Scene:
         # print(b'Vendor: ' + glGetString(GL_VENDOR))
         # print(b'Renderer: ' + glGetString(GL_RENDERER))
 
+        self.camera_buffer = UniformBuffer(
+            CAMERA_DTYPE,
+            UNIFORM_BLOCKS['Camera']
+        )
         self.init()
         old_time = glfw.get_time()
         try:
@@ -274,88 +648,159 @@ class Scene:
             self.camera.position = glm.vec3(1.5, 1.5, 1.5)
             self.camera.look_at(glm.vec3(0, 0, 0))
 
-    def render(self):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    @staticmethod
+    def _state_key(instance):
+        asset = instance.asset
+        return (
+            asset.shaders.res(),
+            asset.texture.res() if asset.texture else 0,
+            int(asset.vao)
+        )
 
-        # camera_proj = numpy.array(
-        #     glm.perspective(
-        #         glm.radians(60),
-        #         float(self.screen_x)/self.screen_y,
-        #         0.01,
-        #         100
-        #     ) * glm.lookAt(
-        #         eye=glm.vec3(1.5, 1.5, 1.5),
-        #         center=glm.vec3(0, 0, 0),
-        #         up=glm.vec3(0, 1, 0)
-        #     )
-        # ).tobytes()
-
-        projection_t = tuple(tuple(x) for x in self.camera.projection())
-        projection = numpy.float32(projection_t).tobytes()
-
-        view_t = tuple(tuple(x) for x in self.camera.view())
-        view = numpy.float32(view_t).tobytes()
+    def draw_order(self):
+        """
+        Returns the instances sorted by (program, texture, VAO) to minimise
+        state changes. Instances without a draw type or with before/after
+        callbacks (e.g. reset_depth) split the list into passes and keep
+        their position, transparent instances are drawn at the end of their
+        pass in their original order. The order is kept until the instance
+        list changes.
+        """
+        if self._draw_order_of == self.instances:
+            return self._draw_order
+
+        order = []
+        opaque, transparent = [], []
+
+        def end_pass():
+            opaque.sort(key=self._state_key)
+            order.extend(opaque)
+            order.extend(transparent)
+            opaque.clear()
+            transparent.clear()
 
         for instance in self.instances:
-            with instance.asset.shaders:
-                if instance.asset.before:
-                    instance.asset.before()
-
-                if instance.asset.draw_type:
-                    glUniformMatrix4fv(
-                        instance.asset.shaders.uniform('projection'),
-                        1,
-                        False,
-                        projection
-                    )
-                    glUniformMatrix4fv(
-                        instance.asset.shaders.uniform('view'),
-                        1,
-                        False,
-                        view
-                    )
-                    transform_t = tuple(tuple(x) for x in instance.transform)
-                    transform = numpy.float32(transform_t).tobytes()
-                    glUniformMatrix4fv(
-                        instance.asset.shaders.uniform('transform'),
-                        1,
-                        False,
-                        transform
-                    )
+            asset = instance.asset
+            if not asset.draw_type or asset.before or asset.after:
+                end_pass()
+                order.append(instance)
+            elif asset.transparent:
+                transparent.append(instance)
+            else:
+                opaque.append(instance)
+        end_pass()
+
+        self._draw_order = order
+        self._draw_order_of = list(self.instances)
+        return order
+
+    def render(self):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        camera = self.camera_buffer.data[0]
+        camera['projection'] = mat4_array(self.camera.projection())
+        camera['view'] = mat4_array(self.camera.view())
+        self.camera_buffer.upload()
+
+        program = None
+        asset = None
+        texture = None
+        for instance in self.draw_order():
+            if not instance.asset.draw_type or \
+                    instance.asset.before or instance.asset.after:
+                # Pass boundaries run with their own context, as before
+                if asset:
+                    asset.__exit__(None, None, None)
+                    asset = None
+                if program:
+                    program.__exit__(None, None, None)
+                    program = None
+                texture = None
+                with instance.asset.shaders:
+                    if instance.asset.before:
+                        instance.asset.before()
+                    if instance.asset.draw_type:
+                        self._set_transform(instance)
+                        with instance.asset:
+                            instance.asset.draw()
+                    if instance.asset.after:
+                        instance.asset.after()
+                continue
+
+            if instance.asset.shaders is not program:
+                # Switches program without unbinding the previous one
+                if program:
+                    program.enabled = False
+                program = instance.asset.shaders
+                program.enabled = True
+                glUseProgram(program.res())
+            if instance.asset.texture is not texture:
+                texture = instance.asset.texture
+                glBindTexture(GL_TEXTURE_2D, texture.res() if texture else 0)
+            if instance.asset is not asset:
+                # Binding the next VAO replaces the current one
+                asset = instance.asset.__enter__()
+
+            self._set_transform(instance)
+            asset.draw()
+
+        if asset:
+            asset.__exit__(None, None, None)
+        if program:
+            program.__exit__(None, None, None)
+        if texture:
+            glBindTexture(GL_TEXTURE_2D, 0)
+
+    def _set_transform(self, instance):
+        glUniformMatrix4fv(
+            instance.asset.shaders.uniform('transform'),
+            1,
+            False,
+            mat4_array(instance.transform)
+        )
 
-                    with instance.asset:
-                        glDrawArrays(
-                            instance.asset.draw_type,
-                            instance.asset.draw_start,
-                            instance.asset.draw_count
-                        )
 
-                if instance.asset.after:
-                    instance.asset.after()
+# Minification filters used instead of minMagFiler when there are mipmaps
+MIPMAP_FILTERS = {
+    GL_LINEAR: GL_LINEAR_MIPMAP_LINEAR,
+    GL_NEAREST: GL_NEAREST_MIPMAP_NEAREST,
+}
 
 
 class Texture:
     def __init__(
         self, width, height, image,
-        minMagFiler=GL_LINEAR, wrapMode=GL_CLAMP_TO_EDGE
+        minMagFiler=GL_LINEAR, wrapMode=GL_CLAMP_TO_EDGE,
+        pixelFormat=GL_RGB, levels=1
     ):
+        """
+        Uploads `image` as level 0, the texture is left empty when it is
+        None (see from_tex). Levels past the first must be uploaded by the
+        caller.
+        """
         self._res = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, self._res)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, minMagFiler)
+        if levels > 1:
+            minFilter = MIPMAP_FILTERS.get(minMagFiler, minMagFiler)
+        else:
+            minFilter = minMagFiler
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, minFilter)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, minMagFiler)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, wrapMode)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, wrapMode)
-        glTexImage2D(
-            GL_TEXTURE_2D,
-            0,
-            GL_RGB,
-            width,
-            height,
-            0,
-            GL_RGB,
-            GL_UNSIGNED_BYTE,
-            image
-        )
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, levels - 1)
+        if image is not None:
+            glTexImage2D(
+                GL_TEXTURE_2D,
+                0,
+                pixelFormat,
+                width,
+                height,
+                0,
+                pixelFormat,
+                GL_UNSIGNED_BYTE,
+                image
+            )
         glBindTexture(GL_TEXTURE_2D, 0)
 
     def __del__(self):
@@ -363,6 +808,9 @@ class Texture:
             glDeleteTextures(self._res)
             self._res = 0
 
+    def res(self):
+        return self._res
+
     @staticmethod
     def from_file(path):
         tex = PIL.Image.open(path)
@@ -374,6 +822,58 @@ class Texture:
         # tex.show()
         return Texture(width, height, image)
 
+    @staticmethod
+    def from_tex(tex, minMagFiler=GL_LINEAR, wrapMode=GL_CLAMP_TO_EDGE):
+        """
+        Uploads every mipmap of a lib.tex_file.TexFile as-is: DXT formats
+        stay compressed in VRAM. Rows are kept in file order, i.e. bottom
+        up like GL expects.
+        """
+        from lib.tex_file import PixelFormat
+
+        internal_format = {
+            PixelFormat.DXT1: GL_COMPRESSED_RGBA_S3TC_DXT1_EXT,
+            PixelFormat.DXT3: GL_COMPRESSED_RGBA_S3TC_DXT3_EXT,
+            PixelFormat.DXT5: GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+            PixelFormat.RGBA: GL_RGBA,
+        }.get(tex.pixel_format)
+        if internal_format is None:
+            raise RuntimeError(f'Unsupported pixel format {tex.pixel_format}')
+
+        mipmap = tex.mipmaps[0]
+        texture = Texture(
+            mipmap.width, mipmap.height, None, minMagFiler, wrapMode,
+            levels=len(tex.mipmaps)
+        )
+        glBindTexture(GL_TEXTURE_2D, texture.res())
+        for level, mipmap in enumerate(tex.mipmaps):
+            data = numpy.frombuffer(mipmap.data, dtype=numpy.uint8)
+            if internal_format == GL_RGBA:
+                glTexImage2D(
+                    GL_TEXTURE_2D,
+                    level,
+                    GL_RGBA,
+                    mipmap.width,
+                    mipmap.height,
+                    0,
+                    GL_RGBA,
+                    GL_UNSIGNED_BYTE,
+                    data
+                )
+            else:
+                glCompressedTexImage2D(
+                    GL_TEXTURE_2D,
+                    level,
+                    internal_format,
+                    mipmap.width,
+                    mipmap.height,
+                    0,
+                    mipmap.size,
+                    data
+                )
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture
+
 
 class FreeflyCamera:
     def __init__(self):
@@ -1,6 +1,7 @@
 from ctypes import *
 import glm
 from OpenGL.GL import *
+import os
 import struct
 
 from . import gl_utils as utils
@@ -120,7 +121,9 @@ def grid(bounds=[-1, 1], precision=0.1):
             *((0, 0.3, 1, alpha) * 4), # Z
         ])
 
-    return colored_object(vertices, colors, GL_LINES)
+    instance = colored_object(vertices, colors, GL_LINES)
+    instance.asset.transparent = True
+    return instance
 
 
 def quad_to_tris(vertices):
@@ -201,4 +204,37 @@ def reset_depth():
     asset.draw_type = None
     asset.before = lambda: glClear(GL_DEPTH_BUFFER_BIT)
     asset.shaders = empty_context()
-    return utils.Instance(asset)
\ No newline at end of file
+    return utils.Instance(asset)
+
+def characters(directory, count, columns=20, spacing=0.5):
+    """
+    Grid of `count` characters playing the animations of a directory holding
+    anim.bin, build.bin and its atlases, drawn with a single instanced call
+    """
+    from lib.anim_file import ANIM
+    from lib.bild_file import BILD
+    from lib.compositor import Compositor
+    from lib.tex_file import read_file
+    from lib.util import Reader, map_file
+
+    build = BILD.read(
+        Reader(map_file(os.path.join(directory, 'build.bin'))), columnar=True)
+    anim = ANIM.read(
+        Reader(map_file(os.path.join(directory, 'anim.bin'))), columnar=True)
+    # Atlases are uploaded compressed, with their mipmaps
+    textures = [
+        utils.Texture.from_tex(read_file(map_file(
+            os.path.join(directory, bytes(m).decode('utf-8')))))
+        for m in build.materials
+    ]
+    asset = utils.AnimationAsset(Compositor(build, anim), textures)
+    for i in range(count):
+        position = glm.vec3(
+            (i % columns) * spacing, 0, (i // columns) * spacing)
+        asset.characters.append(utils.AnimationInstance(
+            anim.animations[i % len(anim.animations)],
+            glm.translate(glm.mat4(1), position),
+            time=0.1 * i
+        ))
+    asset.update(0)
+    return utils.Instance(asset)